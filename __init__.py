@@ -46,6 +46,7 @@ import os
 from bpy.types import AddonPreferences
 from bpy.props import BoolProperty
 from bpy.props import StringProperty
+from bpy.app.handlers import persistent
 
 
 class RigifyPreferences(AddonPreferences):
@@ -127,21 +128,16 @@ class RigifyPreferences(AddonPreferences):
         custom_rigs_folder = bpy.context.user_preferences.addons['rigify'].preferences.custom_rigs_folder
 
         if custom_rigs_folder == "" and 'external' in rig_lists.rigs_dict:
-            rig_lists.rigs_dict.pop('external')
+            rig_lists.remove_external_rigs()
             return
 
         if custom_rigs_folder not in sys.path:
             sys.path.append(bpy.context.user_preferences.addons['rigify'].preferences.custom_rigs_folder)
 
+        utils.clear_rig_type_cache()
+
+        # External rig parameters are added as the rig types get used
         rig_lists.get_external_rigs()
-        if 'external' in rig_lists.rigs_dict and rig_lists.rigs_dict['external']:
-            # Add external rig parameters
-            for rig in rig_lists.rigs_dict['external']['rig_list']:
-                r = utils.get_rig_type(rig, custom_rigs_folder)
-                try:
-                    r.add_parameters(RigifyParameters)
-                except AttributeError:
-                    pass
 
     legacy_mode = BoolProperty(
         name='Rigify Legacy Mode',
@@ -158,6 +154,12 @@ class RigifyPreferences(AddonPreferences):
         update=update_external_rigs
     )
 
+    hot_reload_rigs = BoolProperty(
+        name='Hot Reload Rig Types',
+        description='Reload rig type modules whenever their file changes. Meant for rig type development',
+        default=False
+    )
+
     show_expanded = BoolProperty()
 
     show_rigs_folder_expanded = BoolProperty()
@@ -206,6 +208,9 @@ class RigifyPreferences(AddonPreferences):
             split.label('Description:')
             split.label(text='When enabled the add-on will run in legacy mode using the old 2.76b feature set.')
 
+        row = layout.row()
+        row.prop(self, 'hot_reload_rigs')
+
         row = layout.row()
         row.label("End of Rigify Preferences")
 
@@ -284,9 +289,49 @@ class RigifyArmatureLayer(bpy.types.PropertyGroup):
     group = bpy.props.IntProperty(name="Bone Group", default=0, min=0, max=32,
                                   get=get_group, set=set_group, description='Assign Bone Group to this layer')
 
+def update_rigify_type(self, context):
+    """ Adds the parameters of a rig type as soon as a bone uses it,
+        and refreshes the metarig status shown in the Rigify panel.
+    """
+    rig_lists.ensure_parameters(self.rigify_type)
+    ui.forget_metarig_status(self.id_data)
+
+
+# Number of objects in the file when ensure_file_parameters() last ran.
+parameters_object_count = None
+
+
+@persistent
+def ensure_file_parameters(dummy):
+    """ Adds the parameters of the rig types used by the loaded file.
+    """
+    global parameters_object_count
+
+    parameters_object_count = len(bpy.data.objects)
+    for obj in bpy.data.objects:
+        if obj.type == 'ARMATURE' and obj.pose:
+            for pbone in obj.pose.bones:
+                if pbone.rigify_type:
+                    rig_lists.ensure_parameters(pbone.rigify_type)
+
+
+@persistent
+def ensure_new_parameters(scene):
+    """ Adds the parameters of the rig types used by appended or linked
+        objects, and by the open file when the add-on gets enabled, on
+        the first update after the objects change in number.
+    """
+    if len(bpy.data.objects) != parameters_object_count:
+        ensure_file_parameters(None)
+
+
 ##### REGISTER #####
 
 def register():
+    global parameters_object_count
+
+    legacy = 'legacy' in str(ui)
+
     ui.register()
     metarig_menu.register()
 
@@ -299,7 +344,7 @@ def register():
     bpy.utils.register_class(RigifyPreferences)
     bpy.types.Armature.rigify_layers = bpy.props.CollectionProperty(type=RigifyArmatureLayer)
 
-    bpy.types.PoseBone.rigify_type = bpy.props.StringProperty(name="Rigify Type", description="Rig type for this bone")
+    bpy.types.PoseBone.rigify_type = bpy.props.StringProperty(name="Rigify Type", description="Rig type for this bone", update=None if legacy else update_rigify_type)
     bpy.types.PoseBone.rigify_parameters = bpy.props.PointerProperty(type=RigifyParameters)
     bpy.types.PoseBone.rigify_glue = bpy.props.StringProperty(name="Rigify Glue", description="Defines influence between controls")
 
@@ -357,6 +402,14 @@ def register():
                                                                 description="Forces Rigify to delete and rebuild all the rig widgets. if unset, only missing widgets will be created",
                                                                 default=False)
 
+    IDStore.rigify_incremental_generation = bpy.props.BoolProperty(name="Incremental Update",
+                                                                   description="Only regenerate the rigs whose metarig bones, type or parameters changed since the target rig was last generated",
+                                                                   default=False)
+
+    IDStore.rigify_profile_generation = bpy.props.BoolProperty(name="Profile Rig Contents",
+                                                               description="Also count the bones, constraints, drivers and widgets each rig creates in the generation profile. Slows down generation",
+                                                               default=False)
+
     IDStore.rigify_target_rigs = bpy.props.CollectionProperty(type=RigifyName)
     IDStore.rigify_target_rig = bpy.props.StringProperty(name="Rigify Target Rig",
                                                          description="Defines which rig to overwrite. If unset, a new one called 'rig' will be created.",
@@ -375,16 +428,30 @@ def register():
     IDStore.rigify_transfer_start_frame = bpy.props.IntProperty(name="Start Frame", description="First Frame to Transfer", default=0, min= 0)
     IDStore.rigify_transfer_end_frame = bpy.props.IntProperty(name="End Frame", description="Last Frame to Transfer", default=0, min= 0)
 
-    if (ui and 'legacy' in str(ui)) or bpy.context.user_preferences.addons['rigify'].preferences.legacy_mode:
+    if legacy or bpy.context.user_preferences.addons['rigify'].preferences.legacy_mode:
         # update legacy on restart or reload
         bpy.context.user_preferences.addons['rigify'].preferences.legacy_mode = True
 
     # Add rig parameters
-    for rig in rig_lists.rig_list:
-        r = utils.get_rig_type(rig)
+    if legacy:
+        for rig in rig_lists.rig_list:
+            r = utils.get_rig_type(rig)
+            try:
+                r.add_parameters(RigifyParameters)
+            except AttributeError:
+                pass
+    else:
+        # Only as the rig types get used, see update_rigify_type()
+        rig_lists.parameters_group = RigifyParameters
+        rig_lists.added_parameters.clear()
+        parameters_object_count = None
+        bpy.app.handlers.load_post.append(ensure_file_parameters)
+        bpy.app.handlers.scene_update_post.append(ensure_new_parameters)
         try:
-            r.add_parameters(RigifyParameters)
+            ensure_file_parameters(None)
         except AttributeError:
+            # The blend data can't be read while Blender starts up,
+            # ensure_new_parameters() catches up on the first update
             pass
 
     external_rigs_folder = bpy.context.user_preferences.addons['rigify'].preferences.custom_rigs_folder
@@ -405,6 +472,8 @@ def unregister():
     del IDStore.rigify_advanced_generation
     del IDStore.rigify_generate_mode
     del IDStore.rigify_force_widget_update
+    del IDStore.rigify_incremental_generation
+    del IDStore.rigify_profile_generation
     del IDStore.rigify_target_rig
     del IDStore.rigify_target_rigs
     del IDStore.rigify_rig_uis
@@ -414,6 +483,11 @@ def unregister():
     del IDStore.rigify_transfer_start_frame
     del IDStore.rigify_transfer_end_frame
 
+    if ensure_file_parameters in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(ensure_file_parameters)
+        bpy.app.handlers.scene_update_post.remove(ensure_new_parameters)
+        rig_lists.parameters_group = None
+
     bpy.utils.unregister_class(RigifyName)
     bpy.utils.unregister_class(RigifyParameters)
 
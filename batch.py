@@ -0,0 +1,431 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+
+""" Headless batch generation of rigs.
+
+    Run it with a plain python interpreter, outside of Blender:
+
+        python batch.py --blender /path/to/blender --workers 4 \\
+            --summary summary.json character.blend:metarig prop.blend:metarig:prop_rig
+
+    Every FILE:METARIG[:TARGET_RIG] job is run in its own
+    'blender --background' process, with up to --workers of them at
+    the same time. Each file is saved after generating (in place, or
+    into --output-dir), and a summary with the time taken and the error
+    of every job is written as JSON.
+
+    The rotation mode of the actions of a file can be converted the
+    same way, with the actions split across the workers:
+
+        python batch.py convert-rotations --blender /path/to/blender --workers 4 \\
+            --order XYZ --output converted.blend library.blend armature
+
+    The Blender processes run this same script as their --python
+    script, which is why it doesn't import bpy at the top.
+    The rigify add-on must be installed in the Blender being used.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Name of the add-on package this script is part of.
+ADDON_NAME = os.path.basename(os.path.dirname(os.path.realpath(__file__)))
+
+# Prefix of the stdout line a worker reports its result on.
+RESULT_MARKER = "RIGIFY-BATCH-RESULT "
+
+
+#=============================================
+# Running jobs in background Blender processes
+#=============================================
+
+def run_job(blender, blend_file, task, task_args, timeout=None):
+    """ Runs a worker task on a .blend file in a background Blender
+        process, and returns its result as a dict.
+    """
+    command = [blender, "--background", "--factory-startup", blend_file,
+               "--python", os.path.realpath(__file__),
+               "--", "--worker", task] + list(task_args)
+
+    start = time.time()
+    result = {'file': blend_file, 'task': task, 'args': list(task_args), 'status': 'FAILED', 'error': ''}
+    try:
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                 universal_newlines=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        result['error'] = "Timed out after %ss" % timeout
+    except OSError as e:
+        result['error'] = "Could not run Blender: %s" % e
+    else:
+        for line in process.stdout.splitlines():
+            if line.startswith(RESULT_MARKER):
+                result.update(json.loads(line[len(RESULT_MARKER):]))
+                break
+        else:
+            result['error'] = "Blender exited with code %d without a result" % process.returncode
+        if result['status'] != 'FINISHED':
+            result['log'] = process.stdout.splitlines()[-20:]
+
+    result['seconds'] = time.time() - start
+    return result
+
+
+def run_jobs(blender, jobs, workers=1, timeout=None, report=print, progress=None):
+    """ Runs (blend_file, task, task_args) jobs across a pool of
+        background Blender processes.
+        report() and progress(done, total) are called from the calling
+        thread as the jobs finish.
+        Returns the results in the order of the jobs.
+    """
+    results = [None] * len(jobs)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(run_job, blender, job[0], job[1], job[2], timeout): i for i, job in enumerate(jobs)}
+        for done, future in enumerate(as_completed(futures), 1):
+            result = results[futures[future]] = future.result()
+            report("%s %s %s (%.1fs) %s" % (result['status'], result['file'], " ".join(result['args']),
+                                            result['seconds'], result['error']))
+            if progress:
+                progress(done, len(jobs))
+
+    return results
+
+
+def write_summary(path, results):
+    """ Writes the results of a batch as JSON.
+    """
+    summary = {'date': time.strftime("%Y-%m-%d %H:%M:%S"),
+               'jobs': len(results),
+               'failed': len([r for r in results if r['status'] != 'FINISHED']),
+               'seconds': sum(r['seconds'] for r in results),
+               'results': results}
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=4)
+
+
+def split_actions(actions, parts):
+    """ Splits {action name: number of keys} into up to parts lists of
+        action names, with about the same number of keys in each.
+    """
+    chunks = [[] for i in range(max(1, min(parts, len(actions))))]
+    sizes = [0] * len(chunks)
+    for name in sorted(actions, key=lambda name: -actions[name]):
+        i = sizes.index(min(sizes))
+        chunks[i].append(name)
+        sizes[i] += actions[name]
+    return [chunk for chunk in chunks if chunk]
+
+
+def convert_rotations(blender, blend_file, armature, order, output, actions=None, bones=(),
+                      workers=1, timeout=None, report=print, progress=None):
+    """ Converts the rotation mode of the actions of a .blend file across
+        background Blender processes, and writes the converted actions
+        into the output library file.
+        actions maps the names of the actions to their number of keys, all
+        the actions of the file are converted if it isn't given.
+        Returns the results of the jobs, and the seconds each action took
+        to convert by name, for the actions written into the output.
+        If merging fails the converted part files are kept, and listed
+        in the 'parts' of the merge result.
+    """
+    blend_file = os.path.abspath(blend_file)
+    output = os.path.abspath(output)
+
+    if actions is None:
+        result = run_job(blender, blend_file, 'list_actions', [], timeout)
+        if result['status'] != 'FINISHED':
+            return [result], {}
+        actions = result['actions']
+
+    jobs = []
+    for i, names in enumerate(split_actions(actions, workers)):
+        task_args = [armature, "--order", order, "--output", "%s.part%d.blend" % (output, i)]
+        if bones:
+            task_args += ["--bones"] + list(bones)
+        jobs += [(blend_file, 'convert_rotations', task_args + ["--actions"] + names)]
+
+    def job_progress(done, total):
+        if progress:
+            progress(done, total + 1)
+
+    results = run_jobs(blender, jobs, workers, timeout, report, job_progress)
+
+    timings = {}
+    parts = []
+    for result in results:
+        if result['status'] == 'FINISHED':
+            timings.update(result['actions'])
+            parts += [result['saved']]
+
+    # Gather the converted actions into the output library
+    if parts:
+        result = run_job(blender, parts[0], 'merge_actions', ["--output", output] + parts[1:], timeout)
+        report("%s merging into %s (%.1fs) %s" % (result['status'], output, result['seconds'], result['error']))
+        results += [result]
+        if result['status'] == 'FINISHED':
+            for part in parts:
+                os.remove(part)
+        else:
+            result['parts'] = parts
+            timings = {}
+            report("Kept the converted parts: %s" % " ".join(parts))
+    if progress:
+        progress(len(jobs) + 1, len(jobs) + 1)
+
+    return results, timings
+
+
+#=============================================
+# Worker tasks, run inside Blender
+#=============================================
+
+def get_addon_module(name):
+    """ Enables the add-on and returns one of its modules.
+    """
+    import addon_utils
+    import importlib
+
+    addon_utils.enable(ADDON_NAME, default_set=True)
+    return importlib.import_module(ADDON_NAME + "." + name)
+
+
+def save_file(output_dir):
+    """ Saves the open file in place, or into output_dir.
+    """
+    import bpy
+
+    filepath = bpy.data.filepath
+    if output_dir:
+        filepath = os.path.join(output_dir, os.path.basename(filepath))
+    bpy.ops.wm.save_as_mainfile(filepath=filepath)
+    return filepath
+
+
+def task_generate(args):
+    """ Generates the rig of a metarig in the open file and saves it.
+    """
+    import bpy
+
+    parser = argparse.ArgumentParser(prog="generate")
+    parser.add_argument("metarig")
+    parser.add_argument("--target-rig", default="")
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument("--output-dir", default="")
+    args = parser.parse_args(args)
+
+    generate = get_addon_module("generate")
+
+    context = bpy.context
+    scene = context.scene
+    metarig = scene.objects.get(args.metarig)
+    if metarig is None or metarig.type != 'ARMATURE':
+        raise ValueError("No metarig armature '%s' in the scene" % args.metarig)
+
+    id_store = context.window_manager
+    id_store.rigify_generate_mode = 'overwrite'
+    id_store.rigify_target_rig = args.target_rig
+    id_store.rigify_incremental_generation = args.incremental
+
+    for ob in scene.objects:
+        ob.select = False
+    scene.objects.active = metarig
+    metarig.select = True
+
+    generate.generate_rig(context, metarig)
+
+    return {'rig': id_store.rigify_target_rig, 'saved': save_file(args.output_dir)}
+
+
+def task_list_actions(args):
+    """ Returns the actions of the open file, with their number of keys.
+    """
+    import bpy
+
+    return {'actions': {act.name: sum(len(fcu.keyframe_points) for fcu in act.fcurves)
+                        for act in bpy.data.actions}}
+
+
+def task_convert_rotations(args):
+    """ Converts the rotation mode of some actions of the open file, and
+        writes them into a library file.
+    """
+    import bpy
+
+    parser = argparse.ArgumentParser(prog="convert_rotations")
+    parser.add_argument("armature")
+    parser.add_argument("--order", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--actions", nargs="*", default=[])
+    parser.add_argument("--bones", nargs="*", default=[])
+    args = parser.parse_args(args)
+
+    rot_mode = get_addon_module("rot_mode")
+
+    obj = bpy.data.objects.get(args.armature)
+    if obj is None or obj.type != 'ARMATURE':
+        raise ValueError("No armature '%s' in the file" % args.armature)
+    pose_bones = [obj.pose.bones[name] for name in args.bones if name in obj.pose.bones]
+
+    timings = {}
+    actions = set()
+    for name in args.actions:
+        action = bpy.data.actions[name]
+        start = time.time()
+        if args.bones:
+            rot_mode.convert.one_act_sel_bon(obj, action, pose_bones, args.order)
+        else:
+            rot_mode.convert.one_act_every_bon(obj, action, args.order)
+        timings[name] = time.time() - start
+        actions.add(action)
+
+    bpy.data.libraries.write(args.output, actions, fake_user=True)
+
+    return {'actions': timings, 'saved': args.output}
+
+
+def task_merge_actions(args):
+    """ Writes the actions of the open file and of other library files
+        into a single library file.
+    """
+    import bpy
+
+    parser = argparse.ArgumentParser(prog="merge_actions")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("parts", nargs="*")
+    args = parser.parse_args(args)
+
+    for path in args.parts:
+        with bpy.data.libraries.load(path) as (data_from, data_to):
+            data_to.actions = data_from.actions
+
+    bpy.data.libraries.write(args.output, set(bpy.data.actions), fake_user=True)
+
+    return {'actions': len(bpy.data.actions), 'saved': args.output}
+
+
+# Tasks a worker process can run, by name.
+TASKS = {'generate': task_generate,
+         'list_actions': task_list_actions,
+         'convert_rotations': task_convert_rotations,
+         'merge_actions': task_merge_actions}
+
+
+def worker_main(argv):
+    """ Entry point inside Blender: runs a task and prints its result.
+    """
+    start = time.time()
+    task = argv[0]
+    try:
+        result = TASKS[task](argv[1:])
+        result['status'] = 'FINISHED'
+        result['error'] = ''
+    except Exception as e:
+        traceback.print_exc()
+        result = {'status': 'FAILED', 'error': "%s: %s" % (type(e).__name__, e)}
+    result['task_seconds'] = time.time() - start
+
+    print(RESULT_MARKER + json.dumps(result))
+    sys.stdout.flush()
+
+
+#=============================================
+# Command line
+#=============================================
+
+def parse_job(job):
+    """ Splits FILE:METARIG[:TARGET_RIG] into its parts.
+        The file is split off at the last .blend so paths may contain ':'.
+    """
+    index = job.rfind(".blend:")
+    if index < 0:
+        raise argparse.ArgumentTypeError("Expected FILE.blend:METARIG[:TARGET_RIG], got '%s'" % job)
+    blend_file = job[:index + len(".blend")]
+    names = job[index + len(".blend:"):].split(":")
+    if len(names) > 2 or not names[0]:
+        raise argparse.ArgumentTypeError("Expected FILE.blend:METARIG[:TARGET_RIG], got '%s'" % job)
+    return os.path.abspath(blend_file), names[0], names[1] if len(names) > 1 else ""
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Generate Rigify rigs in background Blender processes.")
+    parser.add_argument("jobs", nargs="+", type=parse_job, metavar="FILE.blend:METARIG[:TARGET_RIG]")
+    parser.add_argument("--blender", default="blender", help="Blender executable")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of Blender processes")
+    parser.add_argument("--timeout", type=float, default=None, help="Seconds after which a job is killed")
+    parser.add_argument("--output-dir", default="", help="Save the files here instead of overwriting them")
+    parser.add_argument("--incremental", action="store_true", help="Use incremental generation")
+    parser.add_argument("--summary", default="rigify_batch_summary.json", help="Where to write the summary")
+    args = parser.parse_args(argv)
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    jobs = []
+    for blend_file, metarig, target in args.jobs:
+        task_args = [metarig, "--target-rig", target]
+        if args.incremental:
+            task_args += ["--incremental"]
+        if args.output_dir:
+            task_args += ["--output-dir", os.path.abspath(args.output_dir)]
+        jobs += [(blend_file, 'generate', task_args)]
+
+    results = run_jobs(args.blender, jobs, args.workers, args.timeout)
+    write_summary(args.summary, results)
+
+    return 0 if all(r['status'] == 'FINISHED' for r in results) else 1
+
+
+def convert_main(argv):
+    parser = argparse.ArgumentParser(prog="batch.py convert-rotations",
+                                     description="Convert the rotation mode of the actions of a file "
+                                                 "in background Blender processes.")
+    parser.add_argument("blend_file", help="File with the actions and the armature")
+    parser.add_argument("armature", help="Name of the armature object the actions animate")
+    parser.add_argument("--order", required=True, choices=['QUATERNION', 'XYZ', 'XZY', 'YXZ', 'YZX', 'ZXY', 'ZYX'],
+                        help="Rotation mode to convert to")
+    parser.add_argument("--output", required=True, help="Library file to write the converted actions into")
+    parser.add_argument("--bones", nargs="*", default=[], help="Only convert these bones")
+    parser.add_argument("--blender", default="blender", help="Blender executable")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of Blender processes")
+    parser.add_argument("--timeout", type=float, default=None, help="Seconds after which a job is killed")
+    parser.add_argument("--summary", default="rigify_convert_summary.json", help="Where to write the summary")
+    args = parser.parse_args(argv)
+
+    results, timings = convert_rotations(args.blender, args.blend_file, args.armature, args.order, args.output,
+                                         bones=args.bones, workers=args.workers, timeout=args.timeout)
+    write_summary(args.summary, results)
+
+    return 0 if all(r['status'] == 'FINISHED' for r in results) else 1
+
+
+if __name__ == "__main__":
+    if "--worker" in sys.argv:
+        # Inside Blender, the script arguments come after '--'
+        worker_main(sys.argv[sys.argv.index("--worker") + 1:])
+    elif sys.argv[1:2] == ["convert-rotations"]:
+        sys.exit(convert_main(sys.argv[2:]))
+    else:
+        sys.exit(main(sys.argv[1:]))
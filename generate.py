@@ -19,6 +19,8 @@
 # <pep8 compliant>
 
 import bpy
+import hashlib
+import json
 import re
 import time
 import traceback
@@ -26,13 +28,15 @@ import sys
 from rna_prop_ui import rna_idprop_ui_prop_get
 
 from .utils import MetarigError, new_bone, get_rig_type
-from .utils import ORG_PREFIX, MCH_PREFIX, DEF_PREFIX, WGT_PREFIX, ROOT_NAME, make_original_name
+from .utils import ORG_PREFIX, MCH_PREFIX, DEF_PREFIX, WGT_PREFIX, ROOT_NAME, make_original_name, strip_org
 from .utils import RIG_DIR
-from .utils import create_root_widget
+from .utils import create_root_widget, share_widgets, remove_widgets, remove_unused_widgets
+from .utils import start_widget_queue, finish_widget_queue, widget_queue_length, WGT_HASH
 from .utils import random_id
-from .utils import copy_attributes
+from .utils import copy_attributes, get_copy_attributes_plan
 from .utils import gamma_correct
-from .rig_ui_template import UI_SLIDERS, layers_ui, UI_REGISTER
+from .rig_ui_template import UI_SLIDERS, ui_fragments, layers_ui, UI_REGISTER
+from . import rig_lists
 
 
 RIG_MODULE = "rigs"
@@ -42,23 +46,139 @@ DEF_LAYER = [n == 29 for n in range(0, 32)]  # Armature layer that deformation b
 ROOT_LAYER = [n == 28 for n in range(0, 32)]  # Armature layer that root bone should be moved to.
 WGT_LAYERS = [x == 19 for x in range(0, 20)]  # Widgets go on the last scene layer.
 
-
-class Timer:
-    def __init__(self):
+# Stages of the staged rig protocol, in the order they are run, paired with
+# the mode the armature is in while a stage runs across all the rigs.
+GENERATE_STAGES = (('generate_bones', 'EDIT'),      # create bones
+                   ('parent_bones', 'EDIT'),        # parenting and edit bone settings
+                   ('rig_bones', 'OBJECT'),         # pose bone settings, constraints and drivers
+                   ('generate_widgets', 'OBJECT'))  # control widgets
+
+# Bone settings shared by Bone and EditBone that are copied from the metarig.
+METARIG_BONE_ATTRIBUTES = ('use_deform', 'use_inherit_rotation', 'use_inherit_scale',
+                           'use_local_location', 'use_relative_parent', 'use_envelope_multiply',
+                           'envelope_distance', 'envelope_weight', 'head_radius', 'tail_radius',
+                           'bbone_x', 'bbone_z', 'bbone_segments', 'bbone_easein', 'bbone_easeout',
+                           'bbone_curveinx', 'bbone_curveiny', 'bbone_curveoutx', 'bbone_curveouty',
+                           'bbone_rollin', 'bbone_rollout', 'use_endroll_as_inroll',
+                           'bbone_scalein', 'bbone_scaleout', 'show_wire', 'hide', 'hide_select')
+
+# Pose bone settings copied from the metarig, besides the rotation mode,
+# transform locks, custom shape and bone group. Arrays are copied as tuples.
+METARIG_POSE_ATTRIBUTES = ('location', 'rotation_quaternion', 'rotation_euler', 'rotation_axis_angle',
+                           'scale', 'lock_ik_x', 'lock_ik_y', 'lock_ik_z',
+                           'use_ik_limit_x', 'use_ik_limit_y', 'use_ik_limit_z',
+                           'ik_min_x', 'ik_min_y', 'ik_min_z', 'ik_max_x', 'ik_max_y', 'ik_max_z',
+                           'ik_stiffness_x', 'ik_stiffness_y', 'ik_stiffness_z', 'ik_stretch',
+                           'use_ik_rotation_control', 'ik_rotation_weight',
+                           'use_ik_linear_control', 'ik_linear_weight',
+                           'custom_shape_scale', 'use_custom_shape_bone_size',
+                           'bbone_curveinx', 'bbone_curveiny', 'bbone_curveoutx', 'bbone_curveouty',
+                           'bbone_rollin', 'bbone_rollout', 'bbone_scalein', 'bbone_scaleout')
+
+# Keyframe attributes copied in bulk with foreach_get/set, with their size
+# and the value to fill the buffer with.
+KEYFRAME_ARRAY_ATTRIBUTES = (('co', 2, 0.0), ('handle_left', 2, 0.0), ('handle_right', 2, 0.0),
+                             ('amplitude', 1, 0.0), ('back', 1, 0.0), ('period', 1, 0.0),
+                             ('select_control_point', 1, False), ('select_left_handle', 1, False),
+                             ('select_right_handle', 1, False))
+KEYFRAME_ENUM_ATTRIBUTES = ('interpolation', 'easing', 'type', 'handle_left_type', 'handle_right_type')
+
+# Armature custom property holding what was generated, for incremental updates.
+GENERATION_CACHE = "rigify_generation"
+GENERATION_CACHE_VERSION = 3
+
+
+# Armature custom property holding the profile of the last generation.
+GENERATION_PROFILE = "rigify_profile"
+
+# What the profiler counts for each rig, when counting is enabled.
+PROFILE_COUNTS = ('bones', 'constraints', 'drivers', 'widgets')
+
+
+class Profiler:
+    """ Records the time taken by the phases of the generation, and by
+        each rig in each generation stage.
+        With count_data it also records how many bones, constraints,
+        drivers and widgets each rig created, which costs a pass over
+        the pose bones per rig and stage.
+        With verbose it also prints the time of each phase as it ends.
+    """
+    def __init__(self, count_data=False, verbose=False):
         self.timez = time.time()
+        self.start = self.timez
+        self.count_data = count_data
+        self.verbose = verbose
+        self.phases = []
+        self.rigs = {}
 
     def tick(self, string):
         t = time.time()
-        print(string + "%.3f" % (t - self.timez))
+        if self.verbose:
+            print(string + "%.3f" % (t - self.timez))
+        self.phases += [(string.strip(": "), t - self.timez)]
         self.timez = t
 
+    def snapshot(self, obj):
+        """ Returns the counts of what is in the rig, or None if not
+            counting.
+        """
+        if not self.count_data:
+            return None
+        if obj.mode == 'EDIT':
+            bones = len(obj.data.edit_bones)
+        else:
+            bones = len(obj.data.bones)
+        constraints = sum(len(pb.constraints) for pb in obj.pose.bones)
+        drivers = len(obj.animation_data.drivers) if obj.animation_data else 0
+        widgets = widget_queue_length()
+        return bones, constraints, drivers, widgets
+
+    def rig_stage(self, name, rig_type, stage, seconds, before=None, after=None):
+        """ Records one generation stage of a rig.
+        """
+        entry = self.rigs.get(name)
+        if entry is None:
+            entry = {'name': name, 'type': rig_type, 'time': 0.0, 'stages': {}}
+            entry.update((key, 0) for key in PROFILE_COUNTS)
+            self.rigs[name] = entry
+        entry['time'] += seconds
+        entry['stages'][stage] = entry['stages'].get(stage, 0.0) + seconds
+        if before is not None and after is not None:
+            for key, b, a in zip(PROFILE_COUNTS, before, after):
+                entry[key] += a - b
+
+    def report(self):
+        """ Returns the profile as a dict that can be saved as JSON.
+        """
+        rigs = sorted(self.rigs.values(), key=lambda r: r['time'], reverse=True)
+
+        stages = {}
+        types = {}
+        for rig in rigs:
+            for stage, seconds in rig['stages'].items():
+                stages[stage] = stages.get(stage, 0.0) + seconds
+            rig_type = types.setdefault(rig['type'], {'count': 0, 'time': 0.0})
+            rig_type['count'] += 1
+            rig_type['time'] += rig['time']
+            for key in PROFILE_COUNTS:
+                rig_type[key] = rig_type.get(key, 0) + rig[key]
+
+        return {'date': time.strftime("%Y-%m-%d %H:%M:%S"),
+                'total': time.time() - self.start,
+                'counted': self.count_data,
+                'phases': self.phases,
+                'stages': stages,
+                'types': types,
+                'rigs': rigs}
+
 
 # TODO: generalize to take a group as input instead of an armature.
 def generate_rig(context, metarig):
     """ Generates a rig from a metarig.
-
+        Returns the number of widget datablocks that were freed.
     """
-    t = Timer()
+    profile = context.window_manager.rigify_profile_generation
+    t = Profiler(count_data=profile, verbose=profile)
 
     # Random string with time appended so that
     # different rigs don't collide id's
@@ -107,9 +227,31 @@ def generate_rig(context, metarig):
     id_store.rigify_target_rig = obj.name
     obj.data.pose_position = 'POSE'
 
-    # Get rid of anim data in case the rig already existed
-    print("Clear rig animation data.")
-    obj.animation_data_clear()
+    # Find out which rigs need to be (re)generated. Incremental updates
+    # only regenerate the rigs whose metarig inputs changed.
+    hierarchy_owners = get_bone_owners(metarig)
+    owners = dict(hierarchy_owners)
+    incremental = id_store.rigify_generate_mode == 'overwrite' \
+        and id_store.rigify_incremental_generation
+    cache = None
+    if incremental and not id_store.rigify_force_widget_update:
+        cache = get_generation_cache(obj)
+    if cache is not None:
+        # Bones rigs took from outside their hierarchy the last time
+        owners.update(get_cached_claims(metarig, owners, cache))
+    fingerprints = get_rig_fingerprints(metarig, owners)
+    if cache is not None and cache['fingerprints'].get('') != fingerprints['']:
+        cache = None
+
+    if cache is None:
+        # Get rid of anim data in case the rig already existed
+        print("Clear rig animation data.")
+        obj.animation_data_clear()
+        remove_bone_drivers(obj.data, None)
+    else:
+        rig_id = cache['rig_id']
+        dirty_rigs = get_dirty_rigs(metarig, obj, fingerprints, owners, cache)
+        print("Regenerate rigs: " + ", ".join(sorted(dirty_rigs)))
 
     # Select generated rig object
     metarig.select = False
@@ -117,19 +259,10 @@ def generate_rig(context, metarig):
     scene.objects.active = obj
 
     # Remove wgts if force update is set
+    freed_widgets = 0
     wgts_group_name = "WGTS_" + (rig_old_name or obj.name)
     if wgts_group_name in scene.objects and id_store.rigify_force_widget_update:
-        bpy.ops.object.mode_set(mode='OBJECT')
-        bpy.ops.object.select_all(action='DESELECT')
-        for i, lyr in enumerate(WGT_LAYERS):
-            if lyr:
-                context.scene.layers[i] = True
-        for wgt in bpy.data.objects[wgts_group_name].children:
-            wgt.select = True
-        bpy.ops.object.delete(use_global=False)
-        for i, lyr in enumerate(WGT_LAYERS):
-            if lyr:
-                context.scene.layers[i] = False
+        freed_widgets += remove_widgets(bpy.data.objects[wgts_group_name])
         if rig_old_name:
             bpy.data.objects[wgts_group_name].name = "WGTS_" + obj.name
 
@@ -140,165 +273,63 @@ def generate_rig(context, metarig):
     for child in obj.children:
         childs[child] = child.parent_bone
 
-    # Remove all bones from the generated rig armature.
-    bpy.ops.object.mode_set(mode='EDIT')
-    for bone in obj.data.edit_bones:
-        obj.data.edit_bones.remove(bone)
-    bpy.ops.object.mode_set(mode='OBJECT')
-
-    # Create temporary duplicates for merging
-    temp_rig_1 = metarig.copy()
-    temp_rig_1.data = metarig.data.copy()
-    scene.objects.link(temp_rig_1)
-
-    temp_rig_2 = metarig.copy()
-    temp_rig_2.data = obj.data
-    scene.objects.link(temp_rig_2)
-
-    # Select the temp rigs for merging
-    for objt in scene.objects:
-        objt.select = False  # deselect all objects
-    temp_rig_1.select = True
-    temp_rig_2.select = True
-    scene.objects.active = temp_rig_2
-
-    # Merge the temporary rigs
-    bpy.ops.object.join()
-
-    # Delete the second temp rig
-    bpy.ops.object.delete()
-
-    # Select the generated rig
-    for objt in scene.objects:
-        objt.select = False  # deselect all objects
-    obj.select = True
-    scene.objects.active = obj
-
-    # Copy over bone properties
-    for bone in metarig.data.bones:
-        bone_gen = obj.data.bones[bone.name]
-
-        # B-bone stuff
-        bone_gen.bbone_segments = bone.bbone_segments
-        bone_gen.bbone_easein = bone.bbone_easein
-        bone_gen.bbone_easeout = bone.bbone_easeout
-
-    # Copy over the pose_bone properties
-    for bone in metarig.pose.bones:
-        bone_gen = obj.pose.bones[bone.name]
-
-        # Rotation mode and transform locks
-        bone_gen.rotation_mode = bone.rotation_mode
-        bone_gen.lock_rotation = tuple(bone.lock_rotation)
-        bone_gen.lock_rotation_w = bone.lock_rotation_w
-        bone_gen.lock_rotations_4d = bone.lock_rotations_4d
-        bone_gen.lock_location = tuple(bone.lock_location)
-        bone_gen.lock_scale = tuple(bone.lock_scale)
-
-        # rigify_type and rigify_parameters
-        bone_gen.rigify_type = bone.rigify_type
-        for prop in dir(bone_gen.rigify_parameters):
-            if (not prop.startswith("_")) \
-            and (not prop.startswith("bl_")) \
-            and (prop != "rna_type"):
-                try:
-                    setattr(bone_gen.rigify_parameters, prop, \
-                            getattr(bone.rigify_parameters, prop))
-                except AttributeError:
-                    print("FAILED TO COPY PARAMETER: " + str(prop))
-
-        # Custom properties
-        for prop in bone.keys():
-            try:
-                bone_gen[prop] = bone[prop]
-            except KeyError:
-                pass
-
-        # Constraints
-        for con1 in bone.constraints:
-            con2 = bone_gen.constraints.new(type=con1.type)
-            copy_attributes(con1, con2)
-
-            # Set metarig target to rig target
-            if "target" in dir(con2):
-                if con2.target == metarig:
-                    con2.target = obj
-
-    # Copy drivers
-    if metarig.animation_data:
-        for d1 in metarig.animation_data.drivers:
-            d2 = obj.driver_add(d1.data_path)
-            copy_attributes(d1, d2)
-            copy_attributes(d1.driver, d2.driver)
-
-            # Remove default modifiers, variables, etc.
-            for m in d2.modifiers:
-                d2.modifiers.remove(m)
-            for v in d2.driver.variables:
-                d2.driver.variables.remove(v)
-
-            # Copy modifiers
-            for m1 in d1.modifiers:
-                m2 = d2.modifiers.new(type=m1.type)
-                copy_attributes(m1, m2)
+    if cache is None:
+        # Remove all bones from the generated rig armature.
+        bpy.ops.object.mode_set(mode='EDIT')
+        for bone in obj.data.edit_bones:
+            obj.data.edit_bones.remove(bone)
+        bpy.ops.object.mode_set(mode='OBJECT')
 
-            # Copy variables
-            for v1 in d1.driver.variables:
-                v2 = d2.driver.variables.new()
-                copy_attributes(v1, v2)
-                for i in range(len(v1.targets)):
-                    copy_attributes(v1.targets[i], v2.targets[i])
-                    # Switch metarig targets to rig targets
-                    if v2.targets[i].id == metarig:
-                        v2.targets[i].id = obj
+        copied_bones = [bone.name for bone in metarig.data.bones]
+        orphan_bones = {}
+    else:
+        # Remove the bones of the rigs that get regenerated or no longer exist
+        removed_bones = []
+        for name, entry in cache['rigs'].items():
+            if name in dirty_rigs or name not in fingerprints:
+                removed_bones += entry['bones']
+        orphan_bones = remove_bones(obj, removed_bones)
 
-                    # Mark targets that may need to be altered after rig generation
-                    tar = v2.targets[i]
-                    # If a custom property
-                    if v2.type == 'SINGLE_PROP' \
-                    and re.match('^pose.bones\["[^"\]]*"\]\["[^"\]]*"\]$', tar.data_path):
-                        tar.data_path = "RIGIFY-" + tar.data_path
+        copied_bones = [name for name, owner in owners.items() if owner in dirty_rigs]
 
-            # Copy key frames
-            for i in range(len(d1.keyframe_points)):
-                d2.keyframe_points.add()
-                k1 = d1.keyframe_points[i]
-                k2 = d2.keyframe_points[i]
-                copy_attributes(k1, k2)
+    # Copy the metarig bones, their settings, constraints and drivers
+    copy_metarig(metarig, obj, None if cache is None else copied_bones)
 
     t.tick("Duplicate rig: ")
     #----------------------------------
-    # Make a list of the original bones so we can keep track of them.
-    original_bones = [bone.name for bone in obj.data.bones]
-
-    # Add the ORG_PREFIX to the original bones.
+    # Add the ORG_PREFIX to the copied bones.
     bpy.ops.object.mode_set(mode='OBJECT')
-    for i in range(0, len(original_bones)):
-        obj.data.bones[original_bones[i]].name = make_original_name(original_bones[i])
-        original_bones[i] = make_original_name(original_bones[i])
+    for name in copied_bones:
+        obj.data.bones[name].name = make_original_name(name)
+
+    # Make a list of the original bones so we can keep track of them.
+    original_bones = [make_original_name(bone.name) for bone in metarig.data.bones]
 
-    # Create a sorted list of the original bones, sorted in the order we're
-    # going to traverse them for rigging.
+    # Create a sorted list of the original bones to rig, sorted in the order
+    # we're going to traverse them for rigging.
     # (root-most -> leaf-most, alphabetical)
     bones_sorted = []
-    for name in original_bones:
-        bones_sorted += [name]
+    for name in copied_bones:
+        bones_sorted += [make_original_name(name)]
     bones_sorted.sort()  # first sort by names
     bones_sorted.sort(key=lambda bone: len(obj.pose.bones[bone].parent_recursive))  # then parents before children
 
     t.tick("Make list of org bones: ")
     #----------------------------------
     # Create the root bone.
-    bpy.ops.object.mode_set(mode='EDIT')
-    root_bone = new_bone(obj, ROOT_NAME)
-    spread = get_xy_spread(metarig.data.bones) or metarig.data.bones[0].length
-    spread = float('%.3g' % spread)
-    scale = spread/0.589
-    obj.data.edit_bones[root_bone].head = (0, 0, 0)
-    obj.data.edit_bones[root_bone].tail = (0, scale, 0)
-    obj.data.edit_bones[root_bone].roll = 0
-    bpy.ops.object.mode_set(mode='OBJECT')
-    obj.data.bones[root_bone].layers = ROOT_LAYER
+    if cache is None:
+        bpy.ops.object.mode_set(mode='EDIT')
+        root_bone = new_bone(obj, ROOT_NAME)
+        spread = get_xy_spread(metarig.data.bones) or metarig.data.bones[0].length
+        spread = float('%.3g' % spread)
+        scale = spread/0.589
+        obj.data.edit_bones[root_bone].head = (0, 0, 0)
+        obj.data.edit_bones[root_bone].tail = (0, scale, 0)
+        obj.data.edit_bones[root_bone].roll = 0
+        bpy.ops.object.mode_set(mode='OBJECT')
+        obj.data.bones[root_bone].layers = ROOT_LAYER
+    else:
+        root_bone = ROOT_NAME
 
     # Put the rig_name in the armature custom properties
     rna_idprop_ui_prop_get(obj.data, "rig_id", create=True)
@@ -330,27 +361,87 @@ def generate_rig(context, metarig):
     #         if lyr:
     #             context.scene.layers[i] = False
 
+    # Remember the existing objects, to tell the widgets this generation creates
+    old_objects = set(scene.objects.keys())
+
+    # Collect the widgets the rigs create, to build them all at the end
+    start_widget_queue(obj)
+
     #----------------------------------
     try:
         # Collect/initialize all the rigs.
         rigs = []
+        rig_names = []  # metarig name of the bone each rig is on
+        bpy.ops.object.mode_set(mode='EDIT')
         for bone in bones_sorted:
-            bpy.ops.object.mode_set(mode='EDIT')
-            rigs += get_bone_rigs(obj, bone)
+            if obj.mode != 'EDIT':
+                bpy.ops.object.mode_set(mode='EDIT')
+            bone_rigs = get_bone_rigs(obj, bone)
+            rigs += bone_rigs
+            rig_names += [strip_org(bone)] * len(bone_rigs)
         t.tick("Initialize rigs: ")
 
-        # Generate all the rigs.
-        ui_scripts = []
-        for rig in rigs:
-            # Go into editmode in the rig armature
-            bpy.ops.object.mode_set(mode='OBJECT')
-            context.scene.objects.active = obj
-            obj.select = True
+        # Rigs may take original bones outside of their hierarchy, those
+        # belong to them for incremental updates
+        claims = {bone: name for bone, name in get_rig_claims(rigs, rig_names).items() if bone in owners}
+        stolen = [bone for bone, name in claims.items()
+                  if owners.get(bone, name) != name and bone not in copied_bones]
+        if stolen:
+            print("Rigify: bones %s were taken by rigs from rigs that were not regenerated, "
+                  "generate the rig again without incremental updates." % ", ".join(sorted(stolen)))
+            incremental = False
+        owners_changed = any(owners.get(bone, name) != name for bone, name in claims.items())
+        owners.update(claims)
+
+        # Rigs that only implement generate() go through the compatibility shim
+        rigs = [rig if is_staged_rig(rig) else LegacyRigShim(obj, rig) for rig in rigs]
+
+        # Generate all the rigs, one stage at a time across all of them.
+        context.scene.objects.active = obj
+        obj.select = True
+        rig_bones = {name: [] for name in rig_names}
+        rig_scripts = {name: [] for name in rig_names}
+        for stage, mode in GENERATE_STAGES:
+            bpy.ops.object.mode_set(mode=mode)
+            for rig, name in zip(rigs, rig_names):
+                stage_func = getattr(rig, stage, None)
+                if stage_func is None:
+                    continue
+                # Keep track of the bones each rig creates, for incremental updates
+                track_bones = incremental and mode == 'EDIT'
+                if track_bones:
+                    bones_before = set(obj.data.edit_bones.keys())
+                counts_before = t.snapshot(obj)
+                stage_start = time.time()
+                scripts = stage_func()
+                t.rig_stage(name, metarig.pose.bones[name].rigify_type, stage,
+                            time.time() - stage_start, counts_before, t.snapshot(obj))
+                if scripts is not None:
+                    rig_scripts[name] += [scripts[0]]
+                if track_bones:
+                    bone_names = obj.data.edit_bones if obj.mode == 'EDIT' else obj.data.bones
+                    rig_bones[name] += [b for b in bone_names.keys() if b not in bones_before]
+                # Legacy rigs are free to leave the armature in any mode
+                if obj.mode != mode:
+                    bpy.ops.object.mode_set(mode=mode)
+
+        # Restore the parents the removed bones of regenerated rigs had
+        if orphan_bones:
             bpy.ops.object.mode_set(mode='EDIT')
-            scripts = rig.generate()
-            if scripts is not None:
-                ui_scripts += [scripts[0]]
+            edit_bones = obj.data.edit_bones
+            for name, (parent, use_connect) in orphan_bones.items():
+                if name in edit_bones and parent in edit_bones:
+                    edit_bones[name].parent = edit_bones[parent]
+                    edit_bones[name].use_connect = use_connect
         t.tick("Generate rigs: ")
+
+        # Create root bone widget
+        bpy.ops.object.mode_set(mode='OBJECT')
+        create_root_widget(obj, "root")
+
+        # Build the queued widgets, one shared object per unique shape
+        shared_widgets = finish_widget_queue()
+        t.tick("Build widgets: ")
     except Exception as e:
         # Cleanup if something goes wrong
         print("Rigify: failed to generate rig.")
@@ -360,6 +451,9 @@ def generate_rig(context, metarig):
 
         # Continue the exception
         raise e
+    finally:
+        # Never leave a queue behind for widgets created outside generation
+        finish_widget_queue(build=False)
 
     #----------------------------------
     bpy.ops.object.mode_set(mode='OBJECT')
@@ -442,21 +536,27 @@ def generate_rig(context, metarig):
         if obj.data.bones[bone].name.startswith(DEF_PREFIX):
             obj.data.bones[bone].layers = DEF_LAYER
 
-    # Create root bone widget
-    create_root_widget(obj, "root")
+    # Merge the new widgets rigs created themselves with the shared ones.
+    # Widgets that existed before, e.g. edited by the user, are kept as they are.
+    wgt_prefix = WGT_PREFIX + obj.name + '_'
+    new_widgets = [ob for ob in scene.objects if ob.name.startswith(wgt_prefix)
+                   and ob.name not in old_objects and WGT_HASH not in ob]
+    shared_widgets.update(share_widgets(obj, new_widgets))
 
     # Assign shapes to bones
     # Object's with name WGT-<bone_name> get used as that bone's shape.
+    # Index the scene objects by name once, instead of searching them per bone.
+    scene_objects = {ob.name: ob for ob in context.scene.objects}
     for bone in bones:
-        wgt_name = (WGT_PREFIX + obj.name + '_' + obj.data.bones[bone].name)[:63]  # Object names are limited to 63 characters... arg
-        if wgt_name in context.scene.objects:
-            # Weird temp thing because it won't let me index by object name
-            for ob in context.scene.objects:
-                if ob.name == wgt_name:
-                    obj.pose.bones[bone].custom_shape = ob
-                    break
-            # This is what it should do:
-            # obj.pose.bones[bone].custom_shape = context.scene.objects[wgt_name]
+        wgt_name = (wgt_prefix + obj.data.bones[bone].name)[:63]  # Object names are limited to 63 characters... arg
+        wgt = scene_objects.get(wgt_name, shared_widgets.get(wgt_name))
+        if wgt is not None:
+            obj.pose.bones[bone].custom_shape = wgt
+
+    # Clean up the shared widgets nothing uses any more
+    freed_widgets += remove_unused_widgets(obj)
+    print("Freed %d widget datablocks." % freed_widgets)
+    t.tick("Share widgets: ")
     # Reveal all the layers with control bones on them
     vis_layers = [False for n in range(0, 32)]
     for bone in bones:
@@ -495,9 +595,16 @@ def generate_rig(context, metarig):
 
     id_store.rigify_rig_ui = script.name
 
+    # Rigs that were not regenerated keep their cached ui scripts
+    ui_scripts = []
+    for name in sorted_rig_names(metarig, fingerprints):
+        if name in rig_scripts:
+            ui_scripts += rig_scripts[name]
+        elif cache is not None and name in cache['rigs']:
+            ui_scripts += cache['rigs'][name]['scripts']
+
     script.write(UI_SLIDERS % rig_id)
-    for s in ui_scripts:
-        script.write("\n        " + s.replace("\n", "\n        ") + "\n")
+    script.write(ui_fragments(ui_scripts, set(obj.pose.bones.keys())))
     script.write(layers_ui(vis_layers, layer_layout))
     script.write(UI_REGISTER)
     script.use_module = True
@@ -525,7 +632,19 @@ def generate_rig(context, metarig):
         ctrl.text = bpy.data.texts[script.name]
 
 
+    # Remember what was generated for the next incremental update
+    if incremental:
+        if owners_changed:
+            fingerprints = get_rig_fingerprints(metarig, owners)
+        claims = {bone: name for bone, name in owners.items() if hierarchy_owners[bone] != name}
+        save_generation_cache(obj, rig_id, fingerprints, owners, claims, rig_bones, rig_scripts, cache)
+    elif GENERATION_CACHE in obj.data:
+        del obj.data[GENERATION_CACHE]
+
     t.tick("The rest: ")
+
+    # Keep the profile with the rig, for the Rigify panel and for exporting
+    obj.data[GENERATION_PROFILE] = json.dumps(t.report())
     #----------------------------------
     # Deconfigure
     bpy.ops.object.mode_set(mode='OBJECT')
@@ -539,6 +658,8 @@ def generate_rig(context, metarig):
             child.parent_bone = sub_parent
             child.matrix_world = mat
 
+    return freed_widgets
+
 def create_selection_sets(obj, metarig):
 
     # Check if selection sets addon is installed
@@ -608,6 +729,539 @@ def create_bone_groups(obj, metarig):
             b.bone_group = obj.pose.bone_groups[name]
 
 
+def copy_metarig(metarig, obj, bone_names=None):
+    """ Copies the bones of the metarig into the rig armature, along with
+        their bone and pose bone settings, constraints and drivers.
+        bone_names: only copy these bones. Parents outside of them are
+            looked up among the original bones already in the rig.
+        Works directly on the armature data, so nothing is linked to the
+        scene and the selection is left alone.
+        Leaves the armature in object mode.
+    """
+    if bone_names is None:
+        bone_names = set(metarig.data.bones.keys())
+        copy_all = True
+    else:
+        bone_names = set(bone_names)
+        copy_all = False
+
+    # Edit bones, in the same local coordinates as in the metarig
+    bpy.ops.object.mode_set(mode='EDIT')
+    edit_bones = obj.data.edit_bones
+    for bone in metarig.data.bones:
+        if bone.name not in bone_names:
+            continue
+        eb = edit_bones.new(bone.name)
+        # Matrix sets the roll, then head and tail set the actual extent
+        eb.tail = (0, bone.length, 0)
+        eb.matrix = bone.matrix_local
+        eb.head = bone.head_local
+        eb.tail = bone.tail_local
+
+        for attr in METARIG_BONE_ATTRIBUTES:
+            setattr(eb, attr, getattr(bone, attr))
+        eb.layers = tuple(bone.layers)
+
+    for bone in metarig.data.bones:
+        if bone.parent and bone.name in bone_names:
+            if bone.parent.name in bone_names:
+                parent = bone.parent.name
+            else:
+                parent = make_original_name(bone.parent.name)
+            eb = edit_bones[bone.name]
+            eb.parent = edit_bones.get(parent)
+            eb.use_connect = bone.use_connect and eb.parent is not None
+
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+    # Bone custom properties
+    for bone in metarig.data.bones:
+        if bone.name not in bone_names:
+            continue
+        bone_gen = obj.data.bones[bone.name]
+        for prop in bone.keys():
+            try:
+                bone_gen[prop] = bone[prop]
+            except KeyError:
+                pass
+
+    # Bone groups, matched by name
+    bone_groups = obj.pose.bone_groups
+    for group in metarig.pose.bone_groups:
+        if group.name not in bone_groups:
+            group_gen = bone_groups.new(group.name)
+            group_gen.color_set = group.color_set
+            copy_attributes(group.colors, group_gen.colors)
+
+    # Pose bones
+    for bone in metarig.pose.bones:
+        if bone.name not in bone_names:
+            continue
+        bone_gen = obj.pose.bones[bone.name]
+
+        # Rotation mode and transform locks
+        bone_gen.rotation_mode = bone.rotation_mode
+        bone_gen.lock_rotation = tuple(bone.lock_rotation)
+        bone_gen.lock_rotation_w = bone.lock_rotation_w
+        bone_gen.lock_rotations_4d = bone.lock_rotations_4d
+        bone_gen.lock_location = tuple(bone.lock_location)
+        bone_gen.lock_scale = tuple(bone.lock_scale)
+
+        # Pose, IK, custom shape and B-bone settings
+        for attr in METARIG_POSE_ATTRIBUTES:
+            value = getattr(bone, attr)
+            setattr(bone_gen, attr, tuple(value) if hasattr(value, '__len__') else value)
+        bone_gen.custom_shape = bone.custom_shape
+        if bone.custom_shape_transform:
+            bone_gen.custom_shape_transform = obj.pose.bones.get(bone.custom_shape_transform.name)
+        if bone.bone_group:
+            bone_gen.bone_group = bone_groups[bone.bone_group.name]
+
+        # rigify_type and rigify_parameters
+        rig_lists.ensure_parameters(bone.rigify_type)
+        bone_gen.rigify_type = bone.rigify_type
+        for prop in dir(bone_gen.rigify_parameters):
+            if (not prop.startswith("_")) \
+            and (not prop.startswith("bl_")) \
+            and (prop != "rna_type"):
+                try:
+                    setattr(bone_gen.rigify_parameters, prop, \
+                            getattr(bone.rigify_parameters, prop))
+                except AttributeError:
+                    print("FAILED TO COPY PARAMETER: " + str(prop))
+
+        # Custom properties
+        for prop in bone.keys():
+            try:
+                bone_gen[prop] = bone[prop]
+            except KeyError:
+                pass
+
+        # Constraints
+        for con1 in bone.constraints:
+            con2 = bone_gen.constraints.new(type=con1.type)
+            copy_attributes(con1, con2)
+
+            # Set metarig target to rig target
+            if "target" in dir(con2):
+                if con2.target == metarig:
+                    con2.target = obj
+
+    # Drivers
+    if metarig.animation_data:
+        for d1 in metarig.animation_data.drivers:
+            if not copy_all and get_path_bone(d1.data_path) not in bone_names:
+                continue
+            obj.driver_remove(d1.data_path, d1.array_index)
+            d2 = obj.driver_add(d1.data_path, d1.array_index)
+            copy_attributes(d1, d2)
+            copy_attributes(d1.driver, d2.driver)
+
+            # Remove default modifiers, variables, etc.
+            for m in list(d2.modifiers):
+                d2.modifiers.remove(m)
+            for v in list(d2.driver.variables):
+                d2.driver.variables.remove(v)
+
+            # Copy modifiers
+            for m1 in d1.modifiers:
+                m2 = d2.modifiers.new(type=m1.type)
+                copy_attributes(m1, m2)
+
+            # Copy variables
+            for v1 in d1.driver.variables:
+                v2 = d2.driver.variables.new()
+                copy_attributes(v1, v2)
+                for i in range(len(v1.targets)):
+                    copy_attributes(v1.targets[i], v2.targets[i])
+                    # Switch metarig targets to rig targets
+                    if v2.targets[i].id == metarig:
+                        v2.targets[i].id = obj
+
+                    # Mark targets that may need to be altered after rig generation
+                    tar = v2.targets[i]
+                    # If a custom property
+                    if v2.type == 'SINGLE_PROP' \
+                    and re.match('^pose.bones\["[^"\]]*"\]\["[^"\]]*"\]$', tar.data_path):
+                        tar.data_path = "RIGIFY-" + tar.data_path
+
+            # Copy key frames
+            copy_keyframes(d1, d2)
+
+
+def copy_keyframes(fcurve_1, fcurve_2):
+    """ Copies all the keyframes of an F-Curve onto another one with no
+        keyframes, adding them at once and transferring the numeric
+        values as flat arrays.
+    """
+    points_1 = fcurve_1.keyframe_points
+    points_2 = fcurve_2.keyframe_points
+    count = len(points_1)
+    if count == 0:
+        return
+
+    points_2.add(count)
+    for attr, size, fill in KEYFRAME_ARRAY_ATTRIBUTES:
+        values = [fill] * (count * size)
+        points_1.foreach_get(attr, values)
+        points_2.foreach_set(attr, values)
+
+    # Enums don't support foreach access
+    for k1, k2 in zip(points_1, points_2):
+        for attr in KEYFRAME_ENUM_ATTRIBUTES:
+            setattr(k2, attr, getattr(k1, attr))
+
+    fcurve_2.update()
+
+
+def get_path_bone(data_path):
+    """ Returns the name of the pose bone or bone an animation data path
+        of the rig object or armature points into, or None if it isn't a
+        bone path.
+    """
+    match = re.match(r'^(?:pose\.)?bones\["([^"\]]*)"\]', data_path)
+    if match:
+        return match.group(1)
+    return None
+
+
+def get_bone_owners(metarig):
+    """ Maps every metarig bone to the rig it is part of, that is the
+        closest bone up its hierarchy (itself included) with a rig type.
+        Bones that aren't part of any rig map to ''.
+    """
+    owners = {}
+    for pbone in metarig.pose.bones:
+        owner = ''
+        b = pbone
+        while b:
+            if b.rigify_type:
+                owner = b.name
+                break
+            b = b.parent
+        owners[pbone.name] = owner
+    return owners
+
+
+def get_rig_claims(rigs, rig_names):
+    """ Returns {metarig bone: rig} for the original bones each rig took
+        in its org_bones, which may be outside of its hierarchy, e.g. the
+        sibling bones of a palm rig.
+    """
+    claims = {}
+    for rig, name in zip(rigs, rig_names):
+        org_bones = getattr(rig, 'org_bones', ())
+        if isinstance(org_bones, str):
+            org_bones = [org_bones]
+        for bone in org_bones:
+            if isinstance(bone, str) and bone.startswith(ORG_PREFIX):
+                claims.setdefault(strip_org(bone), name)
+    return claims
+
+
+def get_cached_claims(metarig, owners, cache):
+    """ Returns the bones taken by a rig other than their hierarchy owner
+        the last time the rig was generated, as {metarig bone: rig}, for
+        the bones and rigs that are still in the metarig.
+    """
+    pbones = metarig.pose.bones
+    return {bone: name for bone, name in cache['claims'].items()
+            if bone in owners and name in pbones and pbones[name].rigify_type}
+
+
+def _idprop_value(value):
+    """ Converts ID property values to plain python ones.
+    """
+    if hasattr(value, 'to_dict'):
+        return sorted(value.to_dict().items())
+    if hasattr(value, 'to_list'):
+        return value.to_list()
+    return value
+
+
+def _rna_value(value):
+    """ Converts RNA property values to plain python ones, datablocks
+        and bone groups to their names, other structs to their type.
+    """
+    if value is None:
+        return ''
+    if isinstance(value, (str, bool, int)):
+        return value
+    if isinstance(value, float):
+        return round(value, 5)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(value))
+    if hasattr(value, 'name'):
+        return value.name
+    if hasattr(value, 'bl_rna'):
+        return value.bl_rna.identifier
+    if hasattr(value, '__len__'):
+        return tuple(_rna_value(x) for x in value)
+    return value
+
+
+def _rna_attributes(struct):
+    """ Returns the writable RNA properties of a struct, the ones
+        copy_attributes() copies, as plain python values.
+    """
+    return [(key, _rna_value(getattr(struct, key, None))) for key in get_copy_attributes_plan(struct)]
+
+
+def _keyframe_values(fcurve):
+    """ Returns the keyframes of an F-Curve as plain python values,
+        leaving out their selection.
+    """
+    return [(_rna_value(k.co), _rna_value(k.handle_left), _rna_value(k.handle_right),
+             k.interpolation, k.easing, k.handle_left_type, k.handle_right_type,
+             _rna_value(k.amplitude), _rna_value(k.back), _rna_value(k.period))
+            for k in fcurve.keyframe_points]
+
+
+def get_rig_fingerprints(metarig, owners):
+    """ Returns a fingerprint of the metarig inputs of each rig: the
+        type, parameters, geometry and settings of the bones it is made
+        of, and their constraints and drivers.
+        The '' entry covers the bones that aren't part of any rig.
+    """
+    drivers = {}
+    if metarig.animation_data:
+        for d in metarig.animation_data.drivers:
+            variables = []
+            for v in d.driver.variables:
+                targets = [_rna_attributes(t) for t in v.targets]
+                variables += [(v.name, v.type, targets)]
+            bone_name = get_path_bone(d.data_path) or ''
+            drivers.setdefault(bone_name, []).append(
+                (d.data_path, d.array_index, d.extrapolation, d.driver.type, d.driver.expression,
+                 d.driver.use_self, variables, _keyframe_values(d),
+                 [_rna_attributes(m) for m in d.modifiers]))
+
+    data = {'': drivers.get('', [])}
+
+    for pbone in sorted(metarig.pose.bones, key=lambda b: b.name):
+        bone = pbone.bone
+        bone_data = [bone.name,
+                     bone.parent.name if bone.parent else '',
+                     bone.use_connect,
+                     [[round(x, 5) for x in row] for row in bone.matrix_local],
+                     round(bone.length, 5),
+                     tuple(bone.layers)]
+        bone_data += [getattr(bone, attr) for attr in METARIG_BONE_ATTRIBUTES]
+        bone_data += [(key, _idprop_value(bone[key])) for key in sorted(bone.keys())]
+        bone_data += [pbone.rotation_mode,
+                      tuple(pbone.lock_location),
+                      tuple(pbone.lock_rotation),
+                      pbone.lock_rotation_w,
+                      pbone.lock_rotations_4d,
+                      tuple(pbone.lock_scale),
+                      pbone.rigify_type]
+        bone_data += [_rna_value(getattr(pbone, attr)) for attr in METARIG_POSE_ATTRIBUTES]
+        bone_data += [_rna_value(pbone.custom_shape), _rna_value(pbone.custom_shape_transform),
+                      _rna_value(pbone.bone_group)]
+        bone_data += [(key, _idprop_value(pbone[key])) for key in sorted(pbone.keys())
+                      if key not in ("_RNA_UI", "rigify_type")]
+        bone_data += [(con.type, _rna_attributes(con)) for con in pbone.constraints]
+        bone_data += drivers.get(pbone.name, [])
+        data.setdefault(owners[pbone.name], []).append(bone_data)
+
+    return {name: hashlib.md5(repr(value).encode()).hexdigest() for name, value in data.items()}
+
+
+def sorted_rig_names(metarig, fingerprints):
+    """ Returns the names of the rigs in the order they are generated
+        in: root-most -> leaf-most, alphabetical.
+    """
+    names = sorted(name for name in fingerprints if name)
+    names.sort(key=lambda name: len(metarig.pose.bones[name].parent_recursive))
+    return names
+
+
+def get_generation_cache(obj):
+    """ Returns what was stored in the rig the last time it was
+        generated, or None if it can't be updated incrementally.
+        The caller still has to compare the '' fingerprint.
+    """
+    try:
+        cache = json.loads(obj.data[GENERATION_CACHE])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    if cache.get('version') != GENERATION_CACHE_VERSION \
+    or obj.data.get('rig_id') != cache['rig_id'] \
+    or ROOT_NAME not in obj.data.bones:
+        return None
+
+    return cache
+
+
+def get_dirty_rigs(metarig, obj, fingerprints, owners, cache):
+    """ Returns the names of the rigs that need to be regenerated: the
+        ones whose fingerprint changed or whose bones went missing from
+        the rig, the rigs below them in the bone hierarchy, and the rigs
+        whose constraints or drivers use bones of any of those.
+    """
+    bones = obj.data.bones
+    names = sorted_rig_names(metarig, fingerprints)
+
+    # Rigs that are gone from the metarig lose their bones too
+    dirty = set(name for name in cache['rigs'] if name not in fingerprints)
+    for name in names:
+        entry = cache['rigs'].get(name)
+        if entry is None \
+        or cache['fingerprints'].get(name) != fingerprints[name] \
+        or any(b not in bones for b in entry['bones']):
+            dirty.add(name)
+
+    bone_rigs = {b: name for name, entry in cache['rigs'].items() for b in entry['bones']}
+    changed = True
+    while changed:
+        changed = False
+        for name in names:
+            if name in dirty:
+                continue
+            parent = metarig.data.bones[name].parent
+            uses = cache['rigs'][name].get('uses', ())
+            if (parent and owners[parent.name] in dirty) \
+            or any(bone_rigs.get(b) in dirty for b in uses):
+                dirty.add(name)
+                changed = True
+    return dirty
+
+
+def remove_bone_drivers(id_data, bone_names):
+    """ Removes the drivers of the rig object or armature on the given
+        bones, or on all bones if bone_names is None.
+        Rigs add drivers with driver_add(), which hands back a driver that
+        is already there, so stale ones must not survive regeneration.
+    """
+    if not id_data.animation_data:
+        return
+    paths = []
+    for d in id_data.animation_data.drivers:
+        bone_name = get_path_bone(d.data_path)
+        if bone_name is not None and (bone_names is None or bone_name in bone_names):
+            paths.append((d.data_path, d.array_index))
+    for data_path, index in paths:
+        id_data.driver_remove(data_path, index)
+
+
+def remove_bones(obj, bone_names):
+    """ Removes the given bones from the rig, along with the drivers on
+        them.
+        Returns {bone: (parent, use_connect)} for the remaining bones that
+        were parented to one of them, so the parenting can be restored.
+        Leaves the armature in object mode.
+    """
+    bone_names = set(bone_names)
+
+    remove_bone_drivers(obj, bone_names)
+    remove_bone_drivers(obj.data, bone_names)
+
+    bpy.ops.object.mode_set(mode='EDIT')
+    edit_bones = obj.data.edit_bones
+    orphans = {}
+    for eb in edit_bones:
+        if eb.parent and eb.parent.name in bone_names and eb.name not in bone_names:
+            orphans[eb.name] = (eb.parent.name, eb.use_connect)
+    for name in bone_names:
+        if name in edit_bones:
+            edit_bones.remove(edit_bones[name])
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+    return orphans
+
+
+def get_bone_references(obj):
+    """ Returns {bone: set of bone names} with the bones of the rig that
+        the constraints and drivers on each bone use.
+    """
+    references = {}
+    for pb in obj.pose.bones:
+        names = set()
+        for con in pb.constraints:
+            if getattr(con, 'target', None) == obj:
+                names.add(con.subtarget)
+            if getattr(con, 'pole_target', None) == obj:
+                names.add(con.pole_subtarget)
+        references[pb.name] = names
+
+    for id_data in (obj, obj.data):
+        if not id_data.animation_data:
+            continue
+        for d in id_data.animation_data.drivers:
+            names = references.get(get_path_bone(d.data_path))
+            if names is None:
+                continue
+            for var in d.driver.variables:
+                for target in var.targets:
+                    if target.id == obj:
+                        names.add(target.bone_target)
+                        names.add(get_path_bone(target.data_path))
+
+    for names in references.values():
+        names.difference_update(('', None))
+    return references
+
+
+def save_generation_cache(obj, rig_id, fingerprints, owners, claims, rig_bones, rig_scripts, cache):
+    """ Stores the fingerprints, bones, used bones and ui scripts of the
+        rigs in the rig armature, for the next incremental update, and
+        the bones rigs took outside of their hierarchy.
+        Rigs that weren't regenerated keep their entry from the cache.
+    """
+    references = get_bone_references(obj)
+
+    rigs = {}
+    for name in fingerprints:
+        if not name:
+            continue
+        if name in rig_bones:
+            org_bones = [make_original_name(b) for b, owner in owners.items() if owner == name]
+            own_bones = org_bones + rig_bones[name]
+            uses = set()
+            for bone in own_bones:
+                uses.update(references.get(bone, ()))
+            uses.difference_update(own_bones)
+            rigs[name] = {'bones': own_bones, 'uses': sorted(uses), 'scripts': rig_scripts[name]}
+        elif cache is not None and name in cache['rigs']:
+            rigs[name] = cache['rigs'][name]
+
+    obj.data[GENERATION_CACHE] = json.dumps({'version': GENERATION_CACHE_VERSION,
+                                             'rig_id': rig_id,
+                                             'fingerprints': fingerprints,
+                                             'claims': claims,
+                                             'rigs': rigs})
+
+
+def is_staged_rig(rig):
+    """ Returns True if the rig opts in to the GENERATE_STAGES protocol
+        by setting staged = True on its class, False if it is an old
+        style rig with generate().
+        Old rigs may have helper methods named like a stage, so the
+        stage methods alone don't mark a rig as staged.
+    """
+    return getattr(rig, 'staged', False) is True
+
+
+class LegacyRigShim:
+    """ Runs a rig that only implements generate() as part of the
+        bone creation stage.
+        The rig gets the armature in the same state the old per-rig
+        generation loop left it in, and the generator restores the
+        stage mode afterwards.
+    """
+    def __init__(self, obj, rig):
+        self.obj = obj
+        self.rig = rig
+
+    def generate_bones(self):
+        bpy.ops.object.mode_set(mode='OBJECT')
+        bpy.context.scene.objects.active = self.obj
+        self.obj.select = True
+        bpy.ops.object.mode_set(mode='EDIT')
+        return self.rig.generate()
+
+
 def get_bone_rigs(obj, bone_name, halt_on_missing=False):
     """ Fetch all the rigs specified on a bone.
     """
@@ -38,8 +38,11 @@ class ArmatureSubMenu(bpy.types.Menu):
 
 
 def get_metarig_list(path, depth=0):
-    """ Searches for metarig modules, and returns a list of the
-        imported modules.
+    """ Searches for metarig modules and data files, and returns a list
+        of (metarig name, package path) pairs. For data files the path
+        is the path of the .json file.
+        The modules themselves are only imported when a metarig is added.
+        When a metarig has both, the data file is used.
     """
     metarigs = []
     metarigs_dict = dict()
@@ -57,19 +60,22 @@ def get_metarig_list(path, depth=0):
                 metarigs_dict[f] = get_metarig_list(f, depth=1)
             else:
                 continue
+        elif f.endswith(".json"):
+            name = f[:-5]
+            if name not in [m[0] for m in metarigs]:
+                metarigs += [(name, complete_path)]
         elif not f.endswith(".py"):
             continue
         elif f == "__init__.py":
             continue
         else:
             module_name = f[:-3]
-            try:
-                if depth == 1:
-                    metarigs += [utils.get_metarig_module(module_name, utils.METARIG_DIR + '.' + path)]
-                else:
-                    metarigs += [utils.get_metarig_module(module_name, utils.METARIG_DIR)]
-            except (ImportError):
-                pass
+            if module_name in [m[0] for m in metarigs]:
+                continue
+            if depth == 1:
+                metarigs += [(module_name, utils.METARIG_DIR + '.' + path)]
+            else:
+                metarigs += [(module_name, utils.METARIG_DIR)]
 
     if depth == 1:
         return metarigs
@@ -78,10 +84,27 @@ def get_metarig_list(path, depth=0):
     return metarigs_dict
 
 
-def make_metarig_add_execute(m):
+def make_metarig_add_execute(module_name, path):
     """ Create an execute method for a metarig creation operator.
+        The metarig module or data file is loaded when the operator runs.
     """
     def execute(self, context):
+        if path.endswith(".json"):
+            try:
+                with open(path) as f:
+                    data = f.read()
+                data = utils.check_metarig_data(data)
+            except (OSError, utils.MetarigError) as e:
+                self.report({'ERROR'}, "Metarig '%s' could not be loaded: %s" % (module_name, e))
+                return {'CANCELLED'}
+            m = None
+        else:
+            try:
+                m = utils.get_metarig_module(module_name, path)
+            except ImportError as e:
+                self.report({'ERROR'}, "Metarig '%s' could not be loaded: %s" % (module_name, e))
+                return {'CANCELLED'}
+
         # Add armature object
         bpy.ops.object.armature_add()
         obj = context.active_object
@@ -94,7 +117,19 @@ def make_metarig_add_execute(m):
         bones.remove(bones[0])
 
         # Create metarig
-        m.create(obj)
+        if m is None:
+            try:
+                utils.read_metarig_data(obj, data)
+            except (utils.MetarigError, KeyError, TypeError, ValueError) as e:
+                # Don't leave a half built armature behind
+                bpy.ops.object.mode_set(mode='OBJECT')
+                arm = obj.data
+                bpy.data.objects.remove(obj, do_unlink=True)
+                bpy.data.armatures.remove(arm)
+                self.report({'ERROR'}, "Metarig '%s' could not be loaded: %s" % (module_name, e))
+                return {'CANCELLED'}
+        else:
+            m.create(obj)
 
         bpy.ops.object.mode_set(mode='OBJECT')
         return {'FINISHED'}
@@ -124,15 +159,14 @@ armature_submenus = []
 metarig_ops = {}
 for metarig_class in metarigs_dict:
     metarig_ops[metarig_class] = []
-    for m in metarigs_dict[metarig_class]:
-        name = m.__name__.rsplit('.', 1)[1]
+    for name, path in metarigs_dict[metarig_class]:
 
         # Dynamically construct an Operator
         T = type("Add_" + name + "_Metarig", (bpy.types.Operator,), {})
         T.bl_idname = "object.armature_" + name + "_metarig_add"
         T.bl_label = "Add " + name.replace("_", " ").capitalize() + " (metarig)"
         T.bl_options = {'REGISTER', 'UNDO'}
-        T.execute = make_metarig_add_execute(m)
+        T.execute = make_metarig_add_execute(name, path)
 
         metarig_ops[metarig_class].append((T, name))
 
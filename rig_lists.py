@@ -16,14 +16,151 @@
 #
 #======================= END GPL LICENSE BLOCK ========================
 
+import ast
+import json
 import os
 import bpy
 
 from . import utils
 
 
+MANIFEST_NAME = "rig_manifest.json"
+MANIFEST_VERSION = 1
+
+# Optional rig type module functions, which may also be imported from another module
+RIG_MODULE_FUNCTIONS = ('add_parameters', 'parameters_ui', 'create_sample')
+
+
+#=============================================
+# Rig type manifest
+#=============================================
+
+def get_manifest_path():
+    """ Returns the path of the rig type manifest, in Blender's user
+        config folder, or None if there is no such folder.
+    """
+    try:
+        folder = bpy.utils.user_resource('CONFIG', path=utils.MODULE_NAME, create=True)
+    except (OSError, ValueError):
+        return None
+    if not folder:
+        return None
+    return os.path.join(folder, MANIFEST_NAME)
+
+
+def load_manifest():
+    """ Reads the rig type manifest saved by a previous session.
+    """
+    path = get_manifest_path()
+    if path:
+        try:
+            with open(path, encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == MANIFEST_VERSION:
+                return manifest
+        except (OSError, ValueError):
+            pass
+    return {'version': MANIFEST_VERSION, 'files': {}}
+
+
+def save_manifest():
+    """ Writes the rig type manifest if it changed.
+    """
+    global manifest_changed
+
+    path = get_manifest_path()
+    if not manifest_changed or not path:
+        return
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        manifest_changed = False
+    except OSError:
+        pass
+
+
+def scan_module(path):
+    """ Reads what the manifest needs to know about a rig type module from
+        its source, without importing it: whether it defines a Rig, is an
+        implementation rig, which module functions it has and which
+        parameters add_parameters() declares.
+    """
+    info = {'rig': False, 'implementation': False, 'functions': [], 'parameters': []}
+
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), path)
+
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef):
+            if node.name == "Rig":
+                info['rig'] = True
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                name = alias.asname or alias.name
+                if name == "Rig":
+                    info['rig'] = True
+                elif name in RIG_MODULE_FUNCTIONS:
+                    info['functions'] += [name]
+        elif isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name) and target.id == "Rig":
+                    info['rig'] = True
+                elif isinstance(target, ast.Name) and target.id == "IMPLEMENTATION":
+                    info['implementation'] = getattr(node.value, 'value', None) is True
+        elif isinstance(node, ast.FunctionDef):
+            info['functions'] += [node.name]
+            if node.name == "add_parameters" and node.args.args:
+                params = node.args.args[0].arg
+                for sub in ast.walk(node):
+                    if isinstance(sub, ast.Assign):
+                        for target in sub.targets:
+                            if isinstance(target, ast.Attribute) \
+                            and isinstance(target.value, ast.Name) \
+                            and target.value.id == params:
+                                info['parameters'] += [target.attr]
+
+    return info
+
+
+def get_module_info(path):
+    """ Returns the manifest entry of a rig type module, scanning the file
+        again only if it changed since it was last scanned.
+        Returns None if the file doesn't exist or can't be parsed.
+    """
+    global manifest_changed
+
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    info = manifest['files'].get(path)
+    if info is not None and info['mtime'] == mtime:
+        return info
+
+    try:
+        info = scan_module(path)
+    except (OSError, SyntaxError, UnicodeDecodeError) as e:
+        print("Warning: could not read rig type module %r: %s" % (path, e))
+        return None
+
+    info['mtime'] = mtime
+    manifest['files'][path] = info
+    manifest_changed = True
+    return info
+
+
+manifest = load_manifest()
+manifest_changed = False
+
+
+#=============================================
+# Rig type lists
+#=============================================
+
 def get_rig_list(path, mode='relative'):
     """ Recursively searches for rig types, and returns a list.
+        Rig type modules are not imported, the manifest is used instead.
 
     :param path
     :type path:str
@@ -32,12 +169,10 @@ def get_rig_list(path, mode='relative'):
     """
 
     if mode == 'relative':
-        base_path = ''
         MODULE_DIR = os.path.dirname(__file__)
         RIG_DIR_ABS = os.path.join(MODULE_DIR, utils.RIG_DIR)
         SEARCH_DIR_ABS = os.path.join(RIG_DIR_ABS, path)
     elif mode == 'absolute':
-        base_path = path
         SEARCH_DIR_ABS = path
     else:
         return
@@ -61,14 +196,9 @@ def get_rig_list(path, mode='relative'):
 
         if is_dir:
             # Check directories
-            if mode == 'relative':
-                module_name = os.path.join(path, f).replace(os.sep, ".")
-                rig = utils.get_rig_type(module_name, base_path=base_path)
-            else:
-                module_name = "__init__"
-                rig = utils.get_rig_type(module_name, base_path=base_path + f + os.sep)
+            info = get_module_info(os.path.join(SEARCH_DIR_ABS, f, "__init__.py"))
             # Check if it's a rig itself
-            if hasattr(rig, "Rig"):
+            if info is not None and info['rig']:
                 rigs += [f]
             else:
                 # Check for sub-rigs
@@ -78,16 +208,10 @@ def get_rig_list(path, mode='relative'):
         elif f.endswith(".py"):
             # Check straight-up python files
             t = f[:-3]
-            if mode == 'relative':
-                module_name = os.path.join(path, t).replace(os.sep, ".")
-                rig = utils.get_rig_type(module_name, base_path=base_path)
-            else:
-                external_folder = bpy.context.user_preferences.addons['rigify'].preferences.custom_rigs_folder
-                module_name = os.path.join(path, t).replace(external_folder, '').replace(os.sep, ".")
-                rig = utils.get_rig_type(module_name, base_path=external_folder)
-            if hasattr(rig, "Rig"):
+            info = get_module_info(os.path.join(SEARCH_DIR_ABS, f))
+            if info is not None and info['rig']:
                 rigs += [t]
-            if hasattr(rig, 'IMPLEMENTATION') and rig.IMPLEMENTATION:
+            if info is not None and info['implementation']:
                 impl_rigs += [t]
     rigs.sort()
 
@@ -108,14 +232,75 @@ def get_collection_list(rig_list):
 
 # Public variables
 rigs_dict = get_rig_list("")
+# Incremented whenever the rig type lists change, see get_rig_types_list() in ui.py
+registry_version = 0
 rig_list = rigs_dict['rig_list']
 implementation_rigs = rigs_dict['implementation_rigs']
 collection_list = get_collection_list(rig_list)
 col_enum_list = [("All", "All", ""), ("None", "None", "")] + [(c, c, "") for c in collection_list]
+save_manifest()
 
 
 def get_external_rigs():
+    global registry_version
+
     external_folder = bpy.context.user_preferences.addons['rigify'].preferences.custom_rigs_folder
     if external_folder:
         external_rigs_dict = get_rig_list(external_folder, mode='absolute')
-        rigs_dict['external'] = external_rigs_dict
\ No newline at end of file
+        rigs_dict['external'] = external_rigs_dict
+        registry_version += 1
+        save_manifest()
+
+
+def remove_external_rigs():
+    global registry_version
+
+    if 'external' in rigs_dict:
+        rigs_dict.pop('external')
+        registry_version += 1
+
+
+#=============================================
+# Rig type parameters
+#=============================================
+
+# PropertyGroup the rig type parameters are added to, set by register()
+parameters_group = None
+
+# (base_path, rig_type) of the rig types whose parameters were added
+added_parameters = set()
+
+
+def get_rig_type_base_path(rig_type):
+    """ Returns the base_path get_rig_type() needs for a rig type: ''
+        for the bundled ones, the custom rigs folder for external ones.
+    """
+    if rig_type not in rig_list and 'external' in rigs_dict \
+    and rig_type in rigs_dict['external']['rig_list']:
+        return bpy.context.user_preferences.addons[utils.MODULE_NAME].preferences.custom_rigs_folder
+    return ''
+
+
+def ensure_parameters(rig_type):
+    """ Adds the parameters of a rig type to the RigifyParameters group
+        the first time they are needed. The rig type module is only
+        imported if the manifest says it has parameters.
+    """
+    rig_type = rig_type.replace(" ", "")
+    if parameters_group is None or not rig_type:
+        return
+
+    base_path = get_rig_type_base_path(rig_type)
+    if (base_path, rig_type) in added_parameters:
+        return
+    added_parameters.add((base_path, rig_type))
+
+    info = get_module_info(utils.get_rig_type_path(rig_type, base_path))
+    if info is None or 'add_parameters' not in info['functions']:
+        return
+
+    try:
+        rig = utils.get_rig_type(rig_type, base_path)
+        rig.add_parameters(parameters_group)
+    except (ImportError, AttributeError):
+        print("Warning: could not add the parameters of rig type %r" % rig_type)
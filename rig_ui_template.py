@@ -18,13 +18,20 @@
 
 # <pep8 compliant>
 
+import ast
+
 UI_SLIDERS = '''
 import bpy
 from mathutils import Matrix, Vector
-from math import acos, pi, radians
+from math import acos, atan2, pi, radians
 
 rig_id = "%s"
 
+# How far snapped bones may be off before falling back to a numeric
+# search: relative to the bone length, and in radians.
+SNAP_TOLERANCE = 0.01
+SNAP_ANGLE_TOLERANCE = 0.01
+
 
 ############################
 ## Math utility functions ##
@@ -59,6 +66,20 @@ def rotation_difference(mat1, mat2):
         angle = -angle + (2*pi)
     return angle
 
+def signed_angle(v1, v2, axis):
+    """ Returns the angle to rotate v1 by around axis so that it points
+        the same way as v2, looking at both along axis.
+        Returns None when either vector is (nearly) parallel to axis.
+    """
+    if axis.length < 1e-6:
+        return None
+    axis = axis.normalized()
+    p1 = v1 - axis * v1.dot(axis)
+    p2 = v2 - axis * v2.dot(axis)
+    if p1.length < 1e-4 * v1.length or p2.length < 1e-4 * v2.length:
+        return None
+    return atan2(axis.dot(p1.cross(p2)), p1.dot(p2))
+
 def tail_distance(angle,bone_ik,bone_fk):
     """ Returns the distance between the tails of two bones
         after rotating bone_ik in AXIS_ANGLE mode.
@@ -74,6 +95,13 @@ def tail_distance(angle,bone_ik,bone_fk):
     bone_ik.rotation_mode = rot_mod
     return dv
 
+def tails_match(bone_ik, bone_fk):
+    """ Returns True if the tail of bone_ik is on the tail of bone_fk in
+        the evaluated pose.
+    """
+    bpy.context.scene.update()
+    return (bone_fk.tail - bone_ik.tail).length <= SNAP_TOLERANCE * bone_fk.length
+
 def find_min_range(bone_ik,bone_fk,f=tail_distance,delta=pi/8):
     """ finds the range where lies the minimum of function f applied on bone_ik and bone_fk
         at a certain angle.
@@ -227,7 +255,29 @@ def match_pose_scale(pose_bone, target_bone):
     bpy.ops.object.mode_set(mode='POSE')
 
 def correct_rotation(bone_ik, bone_fk):
-    """ Corrects the ik rotation in ik2fk snapping functions
+    """ Corrects the ik rotation in ik2fk snapping functions.
+        Rotating bone_ik around its axis-angle axis moves its tail on a
+        circle, so the angle that brings it closest to the tail of bone_fk
+        is found directly. The numeric search is used when that circle
+        is degenerate, or when the evaluated pose doesn't put the tails
+        together.
+    """
+    rot_mod = bone_ik.rotation_mode
+    if rot_mod != 'AXIS_ANGLE':
+        bone_ik.rotation_mode = 'AXIS_ANGLE'
+
+    axis = bone_ik.matrix.to_3x3() * Vector(bone_ik.rotation_axis_angle[1:])
+    angle = signed_angle(bone_ik.tail - bone_ik.head, bone_fk.tail - bone_ik.head, axis)
+    if angle is not None:
+        bone_ik.rotation_axis_angle[0] += angle
+    bone_ik.rotation_mode = rot_mod
+
+    if angle is None or not tails_match(bone_ik, bone_fk):
+        correct_rotation_search(bone_ik, bone_fk)
+
+def correct_rotation_search(bone_ik, bone_fk):
+    """ Corrects the ik rotation in ik2fk snapping functions by searching
+        for the angle, updating the scene for every step.
     """
 
     alfarange = find_min_range(bone_ik,bone_fk)
@@ -277,6 +327,24 @@ def match_pole_target(ik_first, ik_last, pole, match_bone, length):
         bpy.ops.object.mode_set(mode='OBJECT')
         bpy.ops.object.mode_set(mode='POSE')
 
+    # Turning the pole around the chain axis turns the solved chain with
+    # it, so the pole is turned by the twist between ik_first and match_bone.
+    # The evaluated pose is checked, and searched numerically if it is off.
+    pvc = pole.matrix.to_translation() - (a + (ikv/2))
+    pvc -= ikv.normalized() * pvc.dot(ikv.normalized())
+    angle = None
+    if pvc.length > 1e-4 * length:
+        for axis in (Vector((1, 0, 0)), Vector((0, 0, 1))):
+            angle = signed_angle(ik_first.matrix.to_3x3() * axis, match_bone.matrix.to_3x3() * axis, ikv)
+            if angle is not None:
+                break
+
+    if angle is not None:
+        set_pole((Matrix.Rotation(angle, 4, ikv) * pvc).normalized() * length)
+        if rotation_difference(ik_first.matrix, match_bone.matrix) <= SNAP_ANGLE_TOLERANCE:
+            return
+
+    # Otherwise search for the pole position numerically
     set_pole(pv)
 
     # Get the rotation difference between ik_first and match_bone
@@ -767,25 +835,102 @@ class RigUI(bpy.types.Panel):
         layout = self.layout
         pose_bones = context.active_object.pose.bones
         try:
-            selected_bones = [bone.name for bone in context.selected_pose_bones]
-            selected_bones += [context.active_pose_bone.name]
+            selected_bones = set(bone.name for bone in context.selected_pose_bones)
+            selected_bones.add(context.active_pose_bone.name)
         except (AttributeError, TypeError):
             return
 
         def is_selected(names):
             # Returns whether any of the named bones are selected.
-            if type(names) == list:
-                for name in names:
-                    if name in selected_bones:
-                        return True
-            elif names in selected_bones:
-                return True
-            return False
+            if isinstance(names, str):
+                return names in selected_bones
+            return not selected_bones.isdisjoint(names)
 
+        # Only run the ui fragments of the selected bones
+        fragments = set(UI_FRAGMENTS_ALWAYS)
+        for name in selected_bones:
+            fragments.update(UI_FRAGMENTS_BY_BONE.get(name, ()))
+        for i in sorted(fragments):
+            UI_FRAGMENTS[i](context, layout, pose_bones, selected_bones, is_selected)
 
 '''
 
 
+def is_selection_test(node):
+    """ Returns whether an expression of a ui script is only true when
+        is_selected() is.
+    """
+    if isinstance(node, ast.Call):
+        return isinstance(node.func, ast.Name) and node.func.id == 'is_selected'
+    if isinstance(node, ast.BoolOp):
+        if isinstance(node.op, ast.Or):
+            return all(is_selection_test(v) for v in node.values)
+        return any(is_selection_test(v) for v in node.values)
+    return False
+
+
+def is_selection_guarded(node):
+    """ Returns whether a statement of a ui script only draws something
+        behind an is_selected() test.
+    """
+    if isinstance(node, ast.Assign):
+        return not any(isinstance(n, ast.Call) for n in ast.walk(node.value))
+    if isinstance(node, ast.Expr):
+        return isinstance(node.value, ast.Str)
+    if isinstance(node, ast.If):
+        return not node.orelse and is_selection_test(node.test)
+    if isinstance(node, ast.For):
+        return not node.orelse and all(is_selection_guarded(n) for n in node.body)
+    return isinstance(node, ast.Pass)
+
+
+def get_script_bones(script, bone_names):
+    """ Returns the names of the bones whose selection a ui script draws
+        for, or None if it may draw something for any selection.
+    """
+    try:
+        tree = ast.parse(script)
+    except SyntaxError:
+        return None
+
+    if not all(is_selection_guarded(n) for n in tree.body):
+        return None
+
+    bones = set(n.s for n in ast.walk(tree) if isinstance(n, ast.Str) and n.s in bone_names)
+    return bones or None
+
+
+def ui_fragments(scripts, bone_names):
+    """ Turns the ui scripts of the rigs into functions for RigUI.draw(),
+        along with a table of which ones to run for each selected bone.
+    """
+    code = "\n"
+    always = []
+    by_bone = {}
+
+    for i, script in enumerate(scripts):
+        code += "\ndef rig_ui_fragment_%d(context, layout, pose_bones, selected_bones, is_selected):\n" % i
+        for line in script.strip("\n").split("\n"):
+            code += ("    " + line).rstrip() + "\n"
+        code += "    pass\n\n"
+
+        bones = get_script_bones(script, bone_names)
+        if bones is None:
+            always += [i]
+        else:
+            for name in bones:
+                by_bone.setdefault(name, []).append(i)
+
+    code += "\nUI_FRAGMENTS = [%s]\n" % ", ".join("rig_ui_fragment_%d" % i for i in range(len(scripts)))
+    code += "UI_FRAGMENTS_ALWAYS = %r\n" % (tuple(always),)
+    code += "UI_FRAGMENTS_BY_BONE = {\n"
+    for name in sorted(by_bone):
+        code += "    %r: %r,\n" % (name, tuple(by_bone[name]))
+    code += "}\n\n"
+
+    return code
+
+
 def layers_ui(layers, layout):
     """ Turn a list of booleans + a list of names into a layer UI.
     """
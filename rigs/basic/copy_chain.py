@@ -21,7 +21,7 @@
 import bpy
 
 from ...utils import MetarigError
-from ...utils import copy_bone
+from ...utils import copy_bone, copy_bone_properties
 from ...utils import connected_children_names
 from ...utils import strip_org, make_deformer_name
 from ...utils import create_bone_widget
@@ -33,6 +33,8 @@ class Rig:
         This is a control and deformation rig.
 
     """
+    staged = True
+
     def __init__(self, obj, bone_name, params):
         """ Gather and validate data about the rig.
         """
@@ -45,81 +47,79 @@ class Rig:
         if len(self.org_bones) <= 1:
             raise MetarigError("RIGIFY ERROR: Bone '%s': input to rig type must be a chain of 2 or more bones" % (strip_org(bone_name)))
 
-    def generate(self):
-        """ Generate the rig.
-            Do NOT modify any of the original bones, except for adding constraints.
-            The main armature should be selected and active before this is called.
-
+    def generate_bones(self):
+        """ Create the deformation and control bone chains.
+            Just copies of the original chain.
+            Runs in edit mode.
         """
-        bpy.ops.object.mode_set(mode='EDIT')
-
-        # Create the deformation and control bone chains.
-        # Just copies of the original chain.
-        def_chain = []
-        ctrl_chain = []
-        for i in range(len(self.org_bones)):
-            name = self.org_bones[i]
+        self.def_chain = []
+        self.ctrl_chain = []
+        for name in self.org_bones:
+            eb = self.obj.data.edit_bones
 
             # Control bone
             if self.make_controls:
-                # Copy
-                ctrl_bone = copy_bone(self.obj, name)
-                eb = self.obj.data.edit_bones
-                ctrl_bone_e = eb[ctrl_bone]
-                # Name
-                ctrl_bone_e.name = strip_org(name)
-                # Parenting
-                if i == 0:
-                    # First bone
-                    ctrl_bone_e.parent = eb[self.org_bones[0]].parent
-                else:
-                    # The rest
-                    ctrl_bone_e.parent = eb[ctrl_chain[-1]]
-                # Add to list
-                ctrl_chain += [ctrl_bone_e.name]
+                ctrl_bone = copy_bone(self.obj, name, copy_properties=False)
+                eb[ctrl_bone].name = strip_org(name)
+                self.ctrl_chain += [eb[ctrl_bone].name]
             else:
-                ctrl_chain += [None]
+                self.ctrl_chain += [None]
 
             # Deformation bone
             if self.make_deforms:
-                # Copy
-                def_bone = copy_bone(self.obj, name)
-                eb = self.obj.data.edit_bones
-                def_bone_e = eb[def_bone]
-                # Name
-                def_bone_e.name = make_deformer_name(strip_org(name))
-                # Parenting
+                def_bone = copy_bone(self.obj, name, copy_properties=False)
+                eb[def_bone].name = make_deformer_name(strip_org(name))
+                self.def_chain += [eb[def_bone].name]
+            else:
+                self.def_chain += [None]
+
+    def parent_bones(self):
+        """ Parent each chain to itself, and its first bone to the
+            parent of the original chain.
+            Runs in edit mode.
+        """
+        eb = self.obj.data.edit_bones
+
+        for chain, make in ((self.ctrl_chain, self.make_controls),
+                            (self.def_chain, self.make_deforms)):
+            if not make:
+                continue
+            for i, name in enumerate(chain):
                 if i == 0:
                     # First bone
-                    def_bone_e.parent = eb[self.org_bones[0]].parent
+                    eb[name].parent = eb[self.org_bones[0]].parent
                 else:
                     # The rest
-                    def_bone_e.parent = eb[def_chain[-1]]
-                # Add to list
-                def_chain += [def_bone_e.name]
-            else:
-                def_chain += [None]
+                    eb[name].parent = eb[chain[i - 1]]
 
-        bpy.ops.object.mode_set(mode='OBJECT')
+    def rig_bones(self):
+        """ Copy the pose bone properties and add the constraints.
+            Runs in object mode.
+        """
         pb = self.obj.pose.bones
 
         # Constraints for org and def
-        for org, ctrl, defrm in zip(self.org_bones, ctrl_chain, def_chain):
+        for org, ctrl, defrm in zip(self.org_bones, self.ctrl_chain, self.def_chain):
             if self.make_controls:
+                copy_bone_properties(self.obj, org, ctrl)
                 con = pb[org].constraints.new('COPY_TRANSFORMS')
                 con.name = "copy_transforms"
                 con.target = self.obj
                 con.subtarget = ctrl
 
             if self.make_deforms:
+                copy_bone_properties(self.obj, org, defrm)
                 con = pb[defrm].constraints.new('COPY_TRANSFORMS')
                 con.name = "copy_transforms"
                 con.target = self.obj
                 con.subtarget = org
 
-        # Create control widgets
+    def generate_widgets(self):
+        """ Create the control widgets.
+            Runs in object mode.
+        """
         if self.make_controls:
-            for bone in ctrl_chain:
+            for bone in self.ctrl_chain:
                 create_bone_widget(self.obj, bone)
 
 
@@ -20,7 +20,7 @@
 
 import bpy
 
-from ...utils import copy_bone
+from ...utils import copy_bone, copy_bone_properties
 from ...utils import strip_org, make_deformer_name
 from ...utils import create_bone_widget, create_circle_widget
 
@@ -31,6 +31,8 @@ class Rig:
         This is a control and deformation rig.
 
     """
+    staged = True
+
     def __init__(self, obj, bone, params):
         """ Gather and validate data about the rig.
         """
@@ -42,36 +44,40 @@ class Rig:
         self.make_widget  = params.make_widget
         self.make_deform  = params.make_deform
 
-    def generate(self):
-        """ Generate the rig.
-            Do NOT modify any of the original bones, except for adding constraints.
-            The main armature should be selected and active before this is called.
-
+    def generate_bones(self):
+        """ Create the control and deformation bones.
+            Runs in edit mode.
         """
-        bpy.ops.object.mode_set(mode='EDIT')
-
         # Make a control bone (copy of original).
         if self.make_control:
-            bone = copy_bone(self.obj, self.org_bone, self.org_name)
+            self.bone = copy_bone(self.obj, self.org_bone, self.org_name,
+                                  copy_properties=False)
 
         # Make a deformation bone (copy of original, child of original).
         if self.make_deform:
-            def_bone = copy_bone(self.obj, self.org_bone, make_deformer_name(self.org_name))
+            self.def_bone = copy_bone(self.obj, self.org_bone, make_deformer_name(self.org_name),
+                                      copy_properties=False)
 
-        # Get edit bones
+    def parent_bones(self):
+        """ Parent the new bones.
+            Runs in edit mode.
+        """
         eb = self.obj.data.edit_bones
-        # UNUSED
-        # if self.make_control:
-        #     bone_e = eb[bone]
-        if self.make_deform:
-            def_bone_e = eb[def_bone]
 
-        # Parent
         if self.make_deform:
+            def_bone_e = eb[self.def_bone]
             def_bone_e.use_connect = False
             def_bone_e.parent = eb[self.org_bone]
 
-        bpy.ops.object.mode_set(mode='OBJECT')
+    def rig_bones(self):
+        """ Copy the pose bone properties and add the constraints.
+            Runs in object mode.
+        """
+        if self.make_control:
+            copy_bone_properties(self.obj, self.org_bone, self.bone)
+        if self.make_deform:
+            copy_bone_properties(self.obj, self.org_bone, self.def_bone)
+
         pb = self.obj.pose.bones
 
         if self.make_control:
@@ -79,13 +85,17 @@ class Rig:
             con = pb[self.org_bone].constraints.new('COPY_TRANSFORMS')
             con.name = "copy_transforms"
             con.target = self.obj
-            con.subtarget = bone
+            con.subtarget = self.bone
 
-            # Create control widget
+    def generate_widgets(self):
+        """ Create the control widget.
+            Runs in object mode.
+        """
+        if self.make_control:
             if self.make_widget:
-                create_circle_widget(self.obj, bone, radius=0.5)
+                create_circle_widget(self.obj, self.bone, radius=0.5)
             else:
-                create_bone_widget(self.obj, bone)
+                create_bone_widget(self.obj, self.bone)
 
 
 def add_parameters(params):
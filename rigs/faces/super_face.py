@@ -1,8 +1,9 @@
 import bpy, re
 from   mathutils      import Vector
-from   ...utils       import copy_bone, flip_bone
+from   ...utils       import copy_bone, copy_bones_properties, flip_bone
 from   ...utils       import org, strip_org, make_deformer_name, connected_children_names, make_mechanism_name
-from   ...utils       import create_circle_widget, create_sphere_widget, create_widget, create_cube_widget
+from   ...utils       import create_circle_widget, create_sphere_widget, create_cube_widget
+from   ...utils       import make_widget_shape, create_widget_shape
 from   ...utils       import MetarigError
 from   rna_prop_ui    import rna_idprop_ui_prop_get
 from   ..widgets import create_face_widget, create_eye_widget, create_eyes_widget, create_ear_widget, create_jaw_widget, create_teeth_widget
@@ -21,8 +22,11 @@ if is_selected(all_controls):
 
 class Rig:
 
+    staged = True
+
     def __init__(self, obj, bone_name, params):
         self.obj = obj
+        self.copied = []    # (original, copy) bone names, see rig_bones()
 
         b = self.obj.data.bones
 
@@ -59,7 +63,6 @@ class Rig:
 
     def orient_org_bones(self):
 
-        bpy.ops.object.mode_set(mode='EDIT')
         eb = self.obj.data.edit_bones
 
         # Adjust eye bones roll
@@ -82,7 +85,6 @@ class Rig:
     def create_deformation(self):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode='EDIT')
         eb = self.obj.data.edit_bones
 
         def_bones = []
@@ -91,7 +93,7 @@ class Rig:
                 continue
 
             def_name = make_deformer_name( strip_org( org ) )
-            def_name = copy_bone( self.obj, org, def_name )
+            def_name = copy_bone( self.obj, org, def_name, copied=self.copied )
             def_bones.append( def_name )
 
             eb[def_name].use_connect = False
@@ -119,16 +121,14 @@ class Rig:
     def create_ctrl(self, bones):
         org_bones = self.org_bones
 
-        ## create control bones
-        bpy.ops.object.mode_set(mode='EDIT')
         eb = self.obj.data.edit_bones
 
         eyeL_ctrl_name = strip_org(bones['eyes'][0])
         eyeR_ctrl_name = strip_org(bones['eyes'][1])
 
-        eyeL_ctrl_name = copy_bone(self.obj, bones['eyes'][0], eyeL_ctrl_name)
-        eyeR_ctrl_name = copy_bone(self.obj, bones['eyes'][1], eyeR_ctrl_name)
-        eyes_ctrl_name = copy_bone(self.obj, bones['eyes'][0], 'eyes')
+        eyeL_ctrl_name = copy_bone(self.obj, bones['eyes'][0], eyeL_ctrl_name, copied=self.copied)
+        eyeR_ctrl_name = copy_bone(self.obj, bones['eyes'][1], eyeR_ctrl_name, copied=self.copied)
+        eyes_ctrl_name = copy_bone(self.obj, bones['eyes'][0], 'eyes', copied=self.copied)
 
         eyeL_ctrl_e = eb[eyeL_ctrl_name]
         eyeR_ctrl_e = eb[eyeR_ctrl_name]
@@ -156,13 +156,14 @@ class Rig:
             eye_master = copy_bone(
                 self.obj,
                 bone,
-                'master_' + strip_org(bone)
+                'master_' + strip_org(bone),
+                copied=self.copied
             )
 
             eye_master_names.append( eye_master )
 
         ## turbo: adding a master nose for transforming the whole nose
-        master_nose = copy_bone(self.obj, 'ORG-nose.004', 'nose_master')
+        master_nose = copy_bone(self.obj, 'ORG-nose.004', 'nose_master', copied=self.copied)
         eb[master_nose].tail[:] = \
             eb[master_nose].head + Vector([0, self.face_length / -4, 0])
 
@@ -170,12 +171,12 @@ class Rig:
         earL_name = strip_org( bones['ears'][0] )
         earR_name = strip_org( bones['ears'][1] )
 
-        earL_ctrl_name = copy_bone( self.obj, org( bones['ears'][0] ), earL_name )
-        earR_ctrl_name = copy_bone( self.obj, org( bones['ears'][1] ), earR_name )
+        earL_ctrl_name = copy_bone( self.obj, org( bones['ears'][0] ), earL_name, copied=self.copied )
+        earR_ctrl_name = copy_bone( self.obj, org( bones['ears'][1] ), earR_name, copied=self.copied )
 
         # jaw ctrl
         jaw_ctrl_name = strip_org( bones['jaw'][2] ) + '_master'
-        jaw_ctrl_name = copy_bone( self.obj, bones['jaw'][2], jaw_ctrl_name )
+        jaw_ctrl_name = copy_bone( self.obj, bones['jaw'][2], jaw_ctrl_name, copied=self.copied )
 
         jawL_org_e = eb[ bones['jaw'][0] ]
         jawR_org_e = eb[ bones['jaw'][1] ]
@@ -187,19 +188,33 @@ class Rig:
         teethT_name = strip_org( bones['teeth'][0] )
         teethB_name = strip_org( bones['teeth'][1] )
 
-        teethT_ctrl_name = copy_bone( self.obj, org( bones['teeth'][0] ), teethT_name )
-        teethB_ctrl_name = copy_bone( self.obj, org( bones['teeth'][1] ), teethB_name )
+        teethT_ctrl_name = copy_bone( self.obj, org( bones['teeth'][0] ), teethT_name, copied=self.copied )
+        teethB_ctrl_name = copy_bone( self.obj, org( bones['teeth'][1] ), teethB_name, copied=self.copied )
 
         # tongue ctrl
         tongue_org  = bones['tongue'].pop()
         tongue_name = strip_org( tongue_org ) + '_master'
 
-        tongue_ctrl_name = copy_bone( self.obj, tongue_org, tongue_name )
+        tongue_ctrl_name = copy_bone( self.obj, tongue_org, tongue_name, copied=self.copied )
 
         flip_bone( self.obj, tongue_ctrl_name )
 
-        ## Assign widgets
-        bpy.ops.object.mode_set(mode ='OBJECT')
+        return {
+            'eyes'   : [
+                eyeL_ctrl_name,
+                eyeR_ctrl_name,
+                eyes_ctrl_name,
+            ] + eye_master_names,
+            'ears'   : [ earL_ctrl_name, earR_ctrl_name     ],
+            'jaw'    : [ jaw_ctrl_name                      ],
+            'teeth'  : [ teethT_ctrl_name, teethB_ctrl_name ],
+            'tongue' : [ tongue_ctrl_name                   ],
+            'nose'   : [ master_nose                        ]
+            }
+
+    def create_ctrl_widgets(self, ctrls):
+
+        eyeL_ctrl_name, eyeR_ctrl_name, eyes_ctrl_name = ctrls['eyes'][:3]
 
         # Assign each eye widgets
         create_eye_widget( self.obj, eyeL_ctrl_name )
@@ -209,44 +224,30 @@ class Rig:
         create_eyes_widget( self.obj, eyes_ctrl_name )
 
         # Assign each eye_master widgets
-        for master in eye_master_names:
+        for master in ctrls['eyes'][3:]:
             create_square_widget(self.obj, master)
 
         # Assign nose_master widget
-        create_square_widget( self.obj, master_nose, size = 1 )
+        create_square_widget( self.obj, ctrls['nose'][0], size = 1 )
 
         # Assign ears widget
-        create_ear_widget( self.obj, earL_ctrl_name )
-        create_ear_widget( self.obj, earR_ctrl_name )
+        for ear in ctrls['ears']:
+            create_ear_widget( self.obj, ear )
 
         # Assign jaw widget
-        create_jaw_widget( self.obj, jaw_ctrl_name )
+        create_jaw_widget( self.obj, ctrls['jaw'][0] )
 
         # Assign teeth widget
-        create_teeth_widget( self.obj, teethT_ctrl_name )
-        create_teeth_widget( self.obj, teethB_ctrl_name )
+        for teeth in ctrls['teeth']:
+            create_teeth_widget( self.obj, teeth )
 
         # Assign tongue widget ( using the jaw widget )
-        create_jaw_widget( self.obj, tongue_ctrl_name )
-
-        return {
-            'eyes'   : [
-                eyeL_ctrl_name,
-                eyeR_ctrl_name,
-                eyes_ctrl_name,
-            ] + eye_master_names,
-            'ears'   : [ earL_ctrl_name, earR_ctrl_name     ],
-            'jaw'    : [ jaw_ctrl_name                      ],
-            'teeth'  : [ teethT_ctrl_name, teethB_ctrl_name ],
-            'tongue' : [ tongue_ctrl_name                   ],
-            'nose'   : [ master_nose                        ]
-            }
+        create_jaw_widget( self.obj, ctrls['tongue'][0] )
 
     def create_tweak(self, bones, uniques, tails):
         org_bones = self.org_bones
 
         ## create tweak bones
-        bpy.ops.object.mode_set(mode ='EDIT')
         eb = self.obj.data.edit_bones
 
         tweaks = []
@@ -259,7 +260,7 @@ class Rig:
             if bone in list( uniques.keys() ):
                 tweak_name = uniques[bone]
 
-            tweak_name = copy_bone( self.obj, bone, tweak_name )
+            tweak_name = copy_bone( self.obj, bone, tweak_name, copied=self.copied )
             eb[ tweak_name ].use_connect = False
             eb[ tweak_name ].parent      = None
 
@@ -281,11 +282,11 @@ class Rig:
             # create tail bone
             if bone in tails:
                 if 'lip.T.L.001' in bone:
-                    tweak_name = copy_bone( self.obj, bone,  'lips.L' )
+                    tweak_name = copy_bone( self.obj, bone,  'lips.L', copied=self.copied )
                 elif 'lip.T.R.001' in bone:
-                    tweak_name = copy_bone( self.obj, bone,  'lips.R' )
+                    tweak_name = copy_bone( self.obj, bone,  'lips.R', copied=self.copied )
                 else:
-                    tweak_name = copy_bone( self.obj, bone,  tweak_name )
+                    tweak_name = copy_bone( self.obj, bone,  tweak_name, copied=self.copied )
 
                 eb[ tweak_name ].use_connect = False
                 eb[ tweak_name ].parent      = None
@@ -296,7 +297,9 @@ class Rig:
 
                 tweaks.append( tweak_name )
 
-        bpy.ops.object.mode_set(mode ='OBJECT')
+        return { 'all' : tweaks }
+
+    def create_tweak_widgets(self, tweaks):
         pb = self.obj.pose.bones
 
         primary_tweaks = [
@@ -318,8 +321,6 @@ class Rig:
                     pb[bone].bone.layers = self.secondary_layers
                 create_face_widget( self.obj, bone )
 
-        return { 'all' : tweaks }
-
     def all_controls(self):
         org_bones = self.org_bones
 
@@ -367,7 +368,6 @@ class Rig:
 
     def create_mch(self, jaw_ctrl, tongue_ctrl):
         org_bones = self.org_bones
-        bpy.ops.object.mode_set(mode ='EDIT')
         eb = self.obj.data.edit_bones
 
         # Create eyes mch bones
@@ -377,13 +377,13 @@ class Rig:
 
         for eye in eyes:
             mch_name = make_mechanism_name( strip_org( eye ) )
-            mch_name = copy_bone( self.obj, eye, mch_name )
+            mch_name = copy_bone( self.obj, eye, mch_name, copied=self.copied )
             eb[ mch_name ].use_connect = False
             eb[ mch_name ].parent      = None
 
             mch_bones[ strip_org( eye ) ].append( mch_name )
 
-            mch_name = copy_bone( self.obj, eye, mch_name )
+            mch_name = copy_bone( self.obj, eye, mch_name, copied=self.copied )
             eb[ mch_name ].use_connect = False
             eb[ mch_name ].parent      = None
 
@@ -397,7 +397,7 @@ class Rig:
 
         mch_name = 'eyes_parent'
         mch_name = make_mechanism_name( mch_name )
-        mch_name = copy_bone( self.obj, face, mch_name )
+        mch_name = copy_bone( self.obj, face, mch_name, copied=self.copied )
         eb[ mch_name ].use_connect = False
         eb[ mch_name ].parent      = None
 
@@ -416,7 +416,7 @@ class Rig:
         for i in range( 2 ):
             for bone in all_lids[i]:
                 mch_name = make_mechanism_name( strip_org( bone ) )
-                mch_name = copy_bone( self.obj, eyes[i], mch_name  )
+                mch_name = copy_bone( self.obj, eyes[i], mch_name, copied=self.copied  )
 
                 eb[ mch_name ].use_connect = False
                 eb[ mch_name ].parent      = None
@@ -435,7 +435,7 @@ class Rig:
             else:
                 mch_name = make_mechanism_name( jaw_ctrl )
 
-            mch_name = copy_bone( self.obj, jaw_ctrl, mch_name  )
+            mch_name = copy_bone( self.obj, jaw_ctrl, mch_name, copied=self.copied  )
 
             eb[ mch_name ].use_connect = False
             eb[ mch_name ].parent      = None
@@ -451,7 +451,7 @@ class Rig:
         # create mch bones for all tongue org_bones except the first one
         for bone in sorted([ org for org in org_bones if 'tongue' in org ])[1:]:
             mch_name = make_mechanism_name( strip_org( bone ) )
-            mch_name = copy_bone( self.obj, tongue_ctrl, mch_name )
+            mch_name = copy_bone( self.obj, tongue_ctrl, mch_name, copied=self.copied )
 
             eb[ mch_name ].use_connect = False
             eb[ mch_name ].parent      = None
@@ -460,9 +460,14 @@ class Rig:
 
         return mch_bones
 
-    def parent_bones(self, all_bones, tweak_unique):
+    def parent_bones(self):
+        """ Parent the new bones and the ORG bones.
+            Runs in edit mode.
+        """
+        all_bones = self.all_bones
+        tweak_unique = self.tweak_unique
+
         org_bones = self.org_bones
-        bpy.ops.object.mode_set(mode ='EDIT')
         eb = self.obj.data.edit_bones
 
         face_name = [ bone for bone in org_bones if 'face' in bone ].pop()
@@ -641,7 +646,6 @@ class Rig:
 
     def make_constraits(self, constraint_type, bone, subtarget, influence = 1):
         org_bones = self.org_bones
-        bpy.ops.object.mode_set(mode ='OBJECT')
         pb = self.obj.pose.bones
 
         owner_pb = pb[bone]
@@ -922,7 +926,6 @@ class Rig:
 
     def drivers_and_props( self, all_bones ):
 
-        bpy.ops.object.mode_set(mode ='OBJECT')
         pb = self.obj.pose.bones
 
         jaw_ctrl  = all_bones['ctrls']['jaw'][0]
@@ -974,7 +977,6 @@ class Rig:
 
     def create_bones(self):
         org_bones = self.org_bones
-        bpy.ops.object.mode_set(mode ='EDIT')
         eb = self.obj.data.edit_bones
 
         # Clear parents for org bones
@@ -997,14 +999,30 @@ class Rig:
             'mch'    : mchs
             }, tweak_unique
 
-    def generate(self):
-
+    def generate_bones(self):
+        """ Create the bones.
+            Runs in edit mode.
+        """
         self.orient_org_bones()
-        all_bones, tweak_unique = self.create_bones()
-        self.parent_bones(all_bones, tweak_unique)
-        self.constraints(all_bones)
-        jaw_prop, eyes_prop = self.drivers_and_props(all_bones)
+        self.all_bones, self.tweak_unique = self.create_bones()
+
+    def rig_bones(self):
+        """ Copy the pose bone properties, add the constraints and drivers.
+            Runs in object mode.
+        """
+        copy_bones_properties(self.obj, self.copied)
+
+        self.constraints(self.all_bones)
+        self.jaw_prop, self.eyes_prop = self.drivers_and_props(self.all_bones)
 
+    def generate_widgets(self):
+        """ Create the control widgets and the rig UI.
+            Runs in object mode.
+        """
+        all_bones = self.all_bones
+
+        self.create_ctrl_widgets(all_bones['ctrls'])
+        self.create_tweak_widgets(all_bones['tweaks']['all'])
 
         # Create UI
         all_controls = []
@@ -1021,8 +1039,8 @@ class Rig:
             controls_string,
             all_bones['ctrls']['jaw'][0],
             all_bones['ctrls']['eyes'][2],
-            jaw_prop,
-            eyes_prop )
+            self.jaw_prop,
+            self.eyes_prop )
             ]
 
 
@@ -2407,24 +2425,13 @@ def create_sample(obj):
         arm.edit_bones.active = bone
 
 
-def create_square_widget(rig, bone_name, size=1.0, bone_transform_name=None):
-    obj = create_widget(rig, bone_name, bone_transform_name)
-    if obj is not None:
-        verts = [
-            (  0.5 * size, -2.9802322387695312e-08 * size,  0.5 * size ),
-            ( -0.5 * size, -2.9802322387695312e-08 * size,  0.5 * size ),
-            (  0.5 * size,  2.9802322387695312e-08 * size, -0.5 * size ),
-            ( -0.5 * size,  2.9802322387695312e-08 * size, -0.5 * size ),
-        ]
+SQUARE_SHAPE = make_widget_shape([
+    (  0.5, -2.9802322387695312e-08,  0.5 ),
+    ( -0.5, -2.9802322387695312e-08,  0.5 ),
+    (  0.5,  2.9802322387695312e-08, -0.5 ),
+    ( -0.5,  2.9802322387695312e-08, -0.5 ),
+], [(0, 1), (2, 3), (0, 2), (3, 1) ])
 
-        edges = [(0, 1), (2, 3), (0, 2), (3, 1) ]
-        faces = []
-
-        mesh = obj.data
-        mesh.from_pydata(verts, edges, faces)
-        mesh.update()
-        mesh.update()
-        return obj
-    else:
-        return None
 
+def create_square_widget(rig, bone_name, size=1.0, bone_transform_name=None):
+    return create_widget_shape(rig, bone_name, SQUARE_SHAPE, size, bone_transform_name=bone_transform_name)
@@ -3,7 +3,7 @@ from ..widgets import create_hand_widget, create_gear_widget
 from .ui             import create_script
 from .limb_utils     import *
 from mathutils       import Vector
-from ...utils       import copy_bone, flip_bone, put_bone, create_cube_widget
+from ...utils       import copy_bone, copy_bones_properties, flip_bone, put_bone, create_cube_widget
 from ...utils       import strip_org, strip_mch, make_deformer_name, create_widget
 from ...utils       import create_circle_widget, create_sphere_widget, create_line_widget
 from ...utils       import MetarigError, make_mechanism_name, org
@@ -31,10 +31,13 @@ IMPLEMENTATION = True   # Include and set True if Rig is just an implementation
 
 class Rig:
 
+    staged = True
+
     def __init__(self, obj, bone_name, params):
         """ Initialize arm rig and key rig properties """
         self.obj = obj
         self.params = params
+        self.copied = []    # (original, copy) bone names, see rig_bones()
 
         self.org_bones = list(
             [bone_name] + connected_children_names(obj, bone_name)
@@ -59,7 +62,6 @@ class Rig:
 
     def orient_org_bones(self):
 
-        bpy.ops.object.mode_set(mode='EDIT')
         eb = self.obj.data.edit_bones
 
         thigh = self.org_bones[0]
@@ -91,12 +93,11 @@ class Rig:
 
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode='EDIT')
         eb = self.obj.data.edit_bones
 
         name = get_bone_name( strip_org( org_bones[0] ), 'mch', 'parent' )
 
-        mch = copy_bone( self.obj, org_bones[0], name )
+        mch = copy_bone( self.obj, org_bones[0], name, copied=self.copied )
         orient_bone( self, eb[mch], 'y' )
         eb[ mch ].length = eb[ org_bones[0] ].length / 4
 
@@ -106,11 +107,15 @@ class Rig:
 
         # Add non-MCH main limb control
         name = get_bone_name(strip_org(org_bones[0]), 'ctrl', 'parent')
-        main_parent = copy_bone(self.obj, org_bones[0], name)
+        main_parent = copy_bone(self.obj, org_bones[0], name, copied=self.copied)
         eb[main_parent].length = eb[org_bones[0]].length / 4
         eb[main_parent].parent = None
         eb[main_parent].roll = 0.0
 
+        return [mch, main_parent]
+
+    def rig_parent(self, mch, main_parent):
+
         # Constraints
         make_constraint( self, mch, {
             'constraint'  : 'COPY_ROTATION',
@@ -148,15 +153,9 @@ class Rig:
         var.targets[0].data_path = pb[main_parent].path_from_id() + \
                                    '[' + '"' + name + '"' + ']'
 
-        size = pb[main_parent].bone.y_axis.length * 10
-        create_gear_widget(self.obj, main_parent, size=size, bone_transform_name=None)
-
-        return [mch, main_parent]
-
     def create_tweak(self):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode ='EDIT')
         eb = self.obj.data.edit_bones
 
         tweaks         = {}
@@ -170,11 +169,11 @@ class Rig:
                 for j in range( self.segments ):
                     # MCH
                     name = get_bone_name( strip_org(org), 'mch', 'tweak' )
-                    mch = copy_bone( self.obj, org, name )
+                    mch = copy_bone( self.obj, org, name, copied=self.copied )
 
                     # CTRL
                     name = get_bone_name( strip_org(org), 'ctrl', 'tweak' )
-                    ctrl = copy_bone( self.obj, org, name )
+                    ctrl = copy_bone( self.obj, org, name, copied=self.copied )
 
                     eb[ mch  ].length /= self.segments
                     eb[ ctrl ].length /= self.segments
@@ -194,7 +193,7 @@ class Rig:
 
             else: # Last limb bone - is not subdivided
                 name = get_bone_name( strip_org(org), 'mch', 'tweak' )
-                mch = copy_bone( self.obj, org_bones[i-1], name )
+                mch = copy_bone( self.obj, org_bones[i-1], name, copied=self.copied )
                 eb[ mch ].length = eb[org].length / 4
                 put_bone(
                     self.obj,
@@ -203,7 +202,7 @@ class Rig:
                 )
 
                 ctrl = get_bone_name( strip_org(org), 'ctrl', 'tweak' )
-                ctrl = copy_bone( self.obj, org, ctrl )
+                ctrl = copy_bone( self.obj, org, ctrl, copied=self.copied )
                 eb[ ctrl ].length = eb[org].length / 2
 
                 tweaks['mch']  += [ mch  ]
@@ -218,6 +217,10 @@ class Rig:
             eb[ mch  ].length /= 4
             eb[ ctrl ].length /= 2
 
+        return tweaks
+
+    def rig_tweak(self, tweaks):
+
         # Contraints
 
         for i,b in enumerate( tweaks['mch'] ):
@@ -258,23 +261,18 @@ class Rig:
                     'subtarget'   : tweaks['ctrl'][ dt_target_idx ],
                 })
 
-        # Ctrl bones Locks and Widgets
+        # Ctrl bones Locks
         pb = self.obj.pose.bones
         for t in tweaks['ctrl']:
             pb[t].lock_rotation = True, False, True
             pb[t].lock_scale    = False, True, False
 
-            create_sphere_widget(self.obj, t, bone_transform_name=None)
-
             if self.tweak_layers:
                 pb[t].bone.layers = self.tweak_layers
 
-        return tweaks
-
-    def create_def(self, tweaks):
+    def create_def(self):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode ='EDIT')
         eb = self.obj.data.edit_bones
 
         def_bones = []
@@ -283,7 +281,7 @@ class Rig:
                 # Create segments if specified
                 for j in range(self.segments):
                     name = get_bone_name(strip_org(org), 'def')
-                    def_name = copy_bone(self.obj, org, name)
+                    def_name = copy_bone(self.obj, org, name, copied=self.copied)
 
                     eb[def_name].length /= self.segments
 
@@ -295,7 +293,7 @@ class Rig:
                     def_bones += [def_name]
             else:
                 name = get_bone_name(strip_org(org), 'def')
-                def_name = copy_bone(self.obj, org, name)
+                def_name = copy_bone(self.obj, org, name, copied=self.copied)
                 def_bones.append(def_name)
 
         # Parent deform bones
@@ -304,6 +302,10 @@ class Rig:
                 eb[b].parent      = eb[ def_bones[i-1] ] # to previous
                 eb[b].use_connect = True
 
+        return def_bones
+
+    def rig_def(self, def_bones, tweaks):
+
         # Constraint def to tweaks
         for d,t in zip(def_bones, tweaks):
             tidx = tweaks.index(t)
@@ -374,12 +376,9 @@ class Rig:
                 var.targets[0].data_path = pb[tweaks[d]].path_from_id() + \
                                            '[' + '"' + name + '"' + ']'
 
-        return def_bones
-
     def create_ik(self, parent):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode ='EDIT')
         eb = self.obj.data.edit_bones
 
         ctrl = get_bone_name(org_bones[0], 'ctrl', 'ik')
@@ -387,7 +386,7 @@ class Rig:
         mch_target = get_bone_name(org_bones[0], 'mch', 'ik_target')
 
         for o, ik in zip( org_bones, [ ctrl, mch_ik, mch_target ] ):
-            bone = copy_bone( self.obj, o, ik )
+            bone = copy_bone( self.obj, o, ik, copied=self.copied )
 
             if org_bones.index(o) == len( org_bones ) - 1:
                 eb[ bone ].length /= 4
@@ -396,7 +395,8 @@ class Rig:
         mch_str = copy_bone(
             self.obj,
             org_bones[0],
-            get_bone_name( org_bones[0], 'mch', 'ik_stretch' )
+            get_bone_name( org_bones[0], 'mch', 'ik_stretch' ),
+            copied=self.copied
         )
 
         eb[ mch_str ].tail = eb[ org_bones[-1] ].head
@@ -408,7 +408,7 @@ class Rig:
 
         # Make standard pole target bone
         pole_name = get_bone_name(org_bones[0], 'ctrl', 'ik_target')
-        pole_target = copy_bone(self.obj, org_bones[0], pole_name)
+        pole_target = copy_bone(self.obj, org_bones[0], pole_name, copied=self.copied)
 
         lo_vector = eb[org_bones[1]].tail - eb[org_bones[1]].head
         tot_vector = eb[org_bones[0]].head - eb[org_bones[1]].tail
@@ -438,12 +438,28 @@ class Rig:
 
         # Make visual pole
         vispole_name = 'VIS_' + get_bone_name(org_bones[0], 'ctrl', 'ik_pole')
-        vispole = copy_bone(self.obj, org_bones[1], vispole_name)
+        vispole = copy_bone(self.obj, org_bones[1], vispole_name, copied=self.copied)
         eb[vispole].tail = eb[vispole].head + Vector((0.0, 0.0, eb[org_bones[1]].length/10))
         eb[vispole].use_connect = False
         eb[vispole].hide_select = True
         eb[vispole].parent = None
 
+        return {'ctrl': {'limb': ctrl, 'ik_target': pole_target},
+                'mch_ik': mch_ik,
+                'mch_target': mch_target,
+                'mch_str': mch_str,
+                'visuals': {'vispole': vispole},
+                'pole_angle': pole_angle
+        }
+
+    def rig_ik(self, ik):
+        ctrl = ik['ctrl']['limb']
+        pole_target = ik['ctrl']['ik_target']
+        mch_ik = ik['mch_ik']
+        mch_target = ik['mch_target']
+        vispole = ik['visuals']['vispole']
+        org_bones = self.org_bones
+
         make_constraint(self, mch_ik, {
             'constraint': 'IK',
             'subtarget': mch_target,
@@ -475,7 +491,7 @@ class Rig:
 
         pb[mch_ik].constraints[-1].pole_target = self.obj
         pb[mch_ik].constraints[-1].pole_subtarget = pole_target
-        pb[mch_ik].constraints[-1].pole_angle = pole_angle
+        pb[mch_ik].constraints[-1].pole_angle = ik['pole_angle']
 
         pb[ mch_ik ].ik_stretch = 0.1
         pb[ ctrl   ].ik_stretch = 0.1
@@ -488,8 +504,14 @@ class Rig:
             pb[mch_ik].lock_ik_y = True
             pb[mch_ik].lock_ik_z = True
 
-        # Locks and Widget
+        # Locks
         pb[ctrl].lock_rotation = True, False, True
+
+    def create_ik_widgets(self, ik):
+        ctrl = ik['ctrl']['limb']
+        pole_target = ik['ctrl']['ik_target']
+        vispole = ik['visuals']['vispole']
+
         if self.rot_axis == 'x' or self.rot_axis == 'automatic':
             roll = 0
         else:
@@ -498,28 +520,21 @@ class Rig:
         create_sphere_widget(self.obj, pole_target, bone_transform_name=None)
         create_line_widget(self.obj, vispole)
 
-        return {'ctrl': {'limb': ctrl, 'ik_target': pole_target},
-                'mch_ik': mch_ik,
-                'mch_target': mch_target,
-                'mch_str': mch_str,
-                'visuals': {'vispole': vispole}
-        }
-
     def create_fk(self, parent):
         org_bones = self.org_bones.copy()
 
-        bpy.ops.object.mode_set(mode='EDIT')
         eb = self.obj.data.edit_bones
 
         ctrls = []
 
         for o in org_bones:
-            bone = copy_bone(self.obj, o, get_bone_name( o, 'ctrl', 'fk'))
+            bone = copy_bone(self.obj, o, get_bone_name( o, 'ctrl', 'fk'), copied=self.copied)
             ctrls.append(bone)
 
         # MCH
         mch = copy_bone(
-            self.obj, org_bones[-1], get_bone_name(o, 'mch', 'fk')
+            self.obj, org_bones[-1], get_bone_name(o, 'mch', 'fk'),
+            copied=self.copied
         )
 
         eb[mch].length /= 4
@@ -532,29 +547,35 @@ class Rig:
         eb[mch].parent = eb[ctrls[1]]
         eb[mch].use_connect = True
 
+        return {'ctrl': ctrls, 'mch': mch}
+
+    def rig_fk(self, fk):
+        ctrls = fk['ctrl']
+        mch = fk['mch']
+
         # Constrain MCH's scale to root
         make_constraint(self, mch, {
             'constraint': 'COPY_SCALE',
             'subtarget': 'root'
         })
 
-        # Locks and widgets
+        # Locks and layers
         pb = self.obj.pose.bones
         pb[ctrls[2]].lock_location = True, True, True
 
-        create_limb_widget(self.obj, ctrls[0])
-        create_limb_widget(self.obj, ctrls[1])
-
-        create_circle_widget(self.obj, ctrls[2], radius=0.4, head_tail=0.0)
-
         for c in ctrls:
             if self.fk_layers:
                 pb[c].bone.layers = self.fk_layers
 
-        return {'ctrl': ctrls, 'mch': mch}
+    def create_fk_widgets(self, fk):
+        ctrls = fk['ctrl']
 
-    def org_parenting_and_switch(self, org_bones, ik, fk, parent):
-        bpy.ops.object.mode_set(mode='EDIT')
+        create_limb_widget(self.obj, ctrls[0])
+        create_limb_widget(self.obj, ctrls[1])
+
+        create_circle_widget(self.obj, ctrls[2], radius=0.4, head_tail=0.0)
+
+    def org_parenting(self, org_bones):
         eb = self.obj.data.edit_bones
         # re-parent ORGs in a connected chain
         for i, o in enumerate(org_bones):
@@ -563,7 +584,7 @@ class Rig:
                 if i <= len(org_bones)-1:
                     eb[o].use_connect = True
 
-        bpy.ops.object.mode_set(mode='OBJECT')
+    def org_switch(self, org_bones, ik, fk, parent):
         pb = self.obj.pose.bones
         pb_parent = pb[parent]
 
@@ -604,14 +625,13 @@ class Rig:
     def create_arm(self, bones):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode='EDIT')
         eb = self.obj.data.edit_bones
 
         pole_target = get_bone_name(org_bones[0], 'ctrl', 'ik_target')
 
         # Create IK arm control
         ctrl = get_bone_name(org_bones[2], 'ctrl', 'ik')
-        ctrl = copy_bone(self.obj, org_bones[2], ctrl)
+        ctrl = copy_bone(self.obj, org_bones[2], ctrl, copied=self.copied)
 
         # clear parent (so that rigify will parent to root)
         eb[ctrl].parent = None
@@ -622,25 +642,25 @@ class Rig:
         eb[ bones['ik']['mch_target'] ].use_connect = False
 
         # MCH for ik control
-        ctrl_socket = copy_bone(self.obj, org_bones[2], get_bone_name( org_bones[2], 'mch', 'ik_socket'))
+        ctrl_socket = copy_bone(self.obj, org_bones[2], get_bone_name( org_bones[2], 'mch', 'ik_socket'), copied=self.copied)
         eb[ctrl_socket].tail = eb[ctrl_socket].head + 0.8*(eb[ctrl_socket].tail-eb[ctrl_socket].head)
         eb[ctrl_socket].parent = None
         eb[ctrl].parent = eb[ctrl_socket]
 
         # MCH for pole ik control
-        ctrl_pole_socket = copy_bone(self.obj, org_bones[2], get_bone_name(org_bones[2], 'mch', 'pole_ik_socket'))
+        ctrl_pole_socket = copy_bone(self.obj, org_bones[2], get_bone_name(org_bones[2], 'mch', 'pole_ik_socket'), copied=self.copied)
         eb[ctrl_pole_socket].tail = eb[ctrl_pole_socket].head + 0.8 * (eb[ctrl_pole_socket].tail - eb[ctrl_pole_socket].head)
         eb[ctrl_pole_socket].parent = None
         eb[pole_target].parent = eb[ctrl_pole_socket]
 
-        ctrl_root = copy_bone(self.obj, org_bones[2], get_bone_name( org_bones[2], 'mch', 'ik_root'))
+        ctrl_root = copy_bone(self.obj, org_bones[2], get_bone_name( org_bones[2], 'mch', 'ik_root'), copied=self.copied)
         eb[ctrl_root].tail = eb[ctrl_root].head + 0.7*(eb[ctrl_root].tail-eb[ctrl_root].head)
         eb[ctrl_root].use_connect = False
         eb[ctrl_root].parent = eb['root']
 
         if eb[org_bones[0]].parent:
             arm_parent = eb[org_bones[0]].parent
-            ctrl_parent = copy_bone(self.obj, org_bones[2], get_bone_name( org_bones[2], 'mch', 'ik_parent'))
+            ctrl_parent = copy_bone(self.obj, org_bones[2], get_bone_name( org_bones[2], 'mch', 'ik_parent'), copied=self.copied)
             eb[ctrl_parent].tail = eb[ctrl_parent].head + 0.6*(eb[ctrl_parent].tail-eb[ctrl_parent].head)
             eb[ctrl_parent].use_connect = False
             if eb[org_bones[0]].parent_recursive:
@@ -651,12 +671,30 @@ class Rig:
             arm_parent = None
 
         mch_name = get_bone_name(strip_org(org_bones[0]), 'mch', 'parent_socket')
-        mch_main_parent = copy_bone(self.obj, org_bones[0], mch_name)
+        mch_main_parent = copy_bone(self.obj, org_bones[0], mch_name, copied=self.copied)
         eb[mch_main_parent].length = eb[org_bones[0]].length / 12
         eb[mch_main_parent].parent = eb[bones['parent']]
         eb[mch_main_parent].roll = 0.0
         eb[bones['main_parent']].parent = eb[mch_main_parent]
 
+        bones['ik']['ctrl']['terminal'] = [ctrl]
+        if arm_parent:
+            bones['ik']['mch_hand'] = [ctrl_socket, ctrl_pole_socket, ctrl_root, ctrl_parent]
+        else:
+            bones['ik']['mch_hand'] = [ctrl_socket, ctrl_pole_socket, ctrl_root]
+        bones['mch_main_parent'] = mch_main_parent
+
+        return bones
+
+    def rig_arm(self, bones):
+        org_bones = self.org_bones
+        ctrl = bones['ik']['ctrl']['terminal'][0]
+        ctrl_socket, ctrl_pole_socket, ctrl_root = bones['ik']['mch_hand'][:3]
+        arm_parent = len(bones['ik']['mch_hand']) > 3
+        if arm_parent:
+            ctrl_parent = bones['ik']['mch_hand'][3]
+        mch_main_parent = bones['mch_main_parent']
+
         # Set up constraints
 
         # Constrain ik ctrl to root / parent
@@ -751,20 +789,7 @@ class Rig:
         drv_modifier.coefficients[0] = 1.0
         drv_modifier.coefficients[1] = -1.0
 
-        # Create hand widget
-        create_hand_widget(self.obj, ctrl, bone_transform_name=None)
-
-        bones['ik']['ctrl']['terminal'] = [ctrl]
-        if arm_parent:
-            bones['ik']['mch_hand'] = [ctrl_socket, ctrl_pole_socket, ctrl_root, ctrl_parent]
-        else:
-            bones['ik']['mch_hand'] = [ctrl_socket, ctrl_pole_socket, ctrl_root]
-
-        return bones
-
     def create_drivers(self, bones):
-
-        bpy.ops.object.mode_set(mode='OBJECT')
         pb = self.obj.pose.bones
 
         ctrl = pb[bones['ik']['mch_hand'][0]]
@@ -1028,8 +1053,10 @@ class Rig:
 
         return names
 
-    def generate(self):
-        bpy.ops.object.mode_set(mode='EDIT')
+    def generate_bones(self):
+        """ Create the bones.
+            Runs in edit mode.
+        """
         eb = self.obj.data.edit_bones
 
         # Adjust org-bones rotation
@@ -1047,15 +1074,55 @@ class Rig:
         bones['parent'] = mch_parent
         bones['main_parent'] = main_parent
         bones['tweak'] = self.create_tweak()
-        bones['def'] = self.create_def(bones['tweak']['ctrl'])
+        bones['def'] = self.create_def()
         bones['ik'] = self.create_ik(bones['parent'])
         bones['fk'] = self.create_fk(bones['parent'])
 
-        self.org_parenting_and_switch(self.org_bones, bones['ik'], bones['fk']['ctrl'], bones['main_parent'])
-
-        bones = self.create_arm(bones)
+        self.bones = self.create_arm(bones)
+
+    def parent_bones(self):
+        """ Re-parent the ORG bones in a connected chain.
+            Runs in edit mode.
+        """
+        self.org_parenting(self.org_bones)
+
+    def rig_bones(self):
+        """ Copy the pose bone properties, add the constraints and drivers.
+            Runs in object mode.
+        """
+        bones = self.bones
+
+        copy_bones_properties(self.obj, self.copied)
+
+        self.rig_parent(bones['parent'], bones['main_parent'])
+        self.rig_tweak(bones['tweak'])
+        self.rig_def(bones['def'], bones['tweak']['ctrl'])
+        self.rig_ik(bones['ik'])
+        self.rig_fk(bones['fk'])
+        self.org_switch(self.org_bones, bones['ik'], bones['fk']['ctrl'], bones['main_parent'])
+        self.rig_arm(bones)
         self.create_drivers(bones)
 
+    def generate_widgets(self):
+        """ Create the control widgets and the rig UI.
+            Runs in object mode.
+        """
+        bones = self.bones
+        pb = self.obj.pose.bones
+
+        main_parent = bones['main_parent']
+        size = pb[main_parent].bone.y_axis.length * 10
+        create_gear_widget(self.obj, main_parent, size=size, bone_transform_name=None)
+
+        for t in bones['tweak']['ctrl']:
+            create_sphere_widget(self.obj, t, bone_transform_name=None)
+
+        self.create_ik_widgets(bones['ik'])
+        self.create_fk_widgets(bones['fk'])
+
+        # Create hand widget
+        create_hand_widget(self.obj, bones['ik']['ctrl']['terminal'][0], bone_transform_name=None)
+
         controls = [bones['ik']['ctrl']['limb'], bones['ik']['ctrl']['terminal'][0]]
 
         controls.append(bones['main_parent'])
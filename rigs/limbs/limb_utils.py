@@ -21,7 +21,8 @@ def orient_bone( cls, eb, axis, scale = 1.0, reverse = False ):
     eb.roll = 0.0
 
 def make_constraint( cls, bone, constraint ):
-    bpy.ops.object.mode_set(mode = 'OBJECT')
+    if cls.obj.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode = 'OBJECT')
     pb = cls.obj.pose.bones
 
     owner_pb = pb[bone]
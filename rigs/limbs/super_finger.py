@@ -1,7 +1,7 @@
 import bpy
 from ...utils import copy_bone, flip_bone
 from ...utils import strip_org, make_deformer_name, connected_children_names, make_mechanism_name
-from ...utils import create_circle_widget, create_widget
+from ...utils import create_circle_widget, create_widget_mesh
 from ...utils import MetarigError, align_bone_x_axis
 from rna_prop_ui import rna_idprop_ui_prop_get
 
@@ -299,19 +299,15 @@ class Rig:
             create_circle_widget(self.obj, ctrl, radius=0.3, head_tail=0.5)
 
         # Create ctrl master widget
-        w = create_widget(self.obj, master_name)
-        if w is not None:
-            mesh = w.data
-            verts = [(0, 0, 0), (0, 1, 0), (0.05, 1, 0), (0.05, 1.1, 0), (-0.05, 1.1, 0), (-0.05, 1, 0)]
-            if 'Z' in self.params.primary_rotation_axis:
-                # Flip x/z coordinates
-                temp = []
-                for v in verts:
-                    temp += [(v[2], v[1], v[0])]
-                verts = temp
-            edges = [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 1)]
-            mesh.from_pydata(verts, edges, [])
-            mesh.update()
+        verts = [(0, 0, 0), (0, 1, 0), (0.05, 1, 0), (0.05, 1.1, 0), (-0.05, 1.1, 0), (-0.05, 1, 0)]
+        if 'Z' in self.params.primary_rotation_axis:
+            # Flip x/z coordinates
+            temp = []
+            for v in verts:
+                temp += [(v[2], v[1], v[0])]
+            verts = temp
+        edges = [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 1)]
+        create_widget_mesh(self.obj, master_name, verts, edges)
 
         # Create tip control widget
         create_circle_widget(self.obj, tip_name, radius=0.3, head_tail=0.0)
@@ -19,10 +19,27 @@ class Rig:
         elif params.limb_type == 'paw':
             self.limb = pawRig(obj, bone_name, params)
 
+        self.org_bones = self.limb.org_bones
+
+        # Run in stages if the wrapped limb does
+        self.staged = getattr(self.limb, 'staged', False)
+
     def generate(self):
 
         return self.limb.generate()
 
+    def generate_bones(self):
+        return self.limb.generate_bones()
+
+    def parent_bones(self):
+        return self.limb.parent_bones()
+
+    def rig_bones(self):
+        return self.limb.rig_bones()
+
+    def generate_widgets(self):
+        return self.limb.generate_widgets()
+
     @staticmethod
     def get_future_names(bones):
         if bones[0].rigify_parameters.limb_type == 'arm':
@@ -26,7 +26,7 @@ import bpy
 from ...utils import MetarigError
 from ...utils import copy_bone
 from ...utils import strip_org, deformer
-from ...utils import create_widget
+from ...utils import create_widget_mesh
 
 
 def bone_siblings(obj, bone):
@@ -175,43 +175,36 @@ class Rig:
             i += 1
 
         # Create control widget
-        w = create_widget(self.obj, ctrl)
-        if w is not None:
-            mesh = w.data
-            verts = [
-                (0.1578, 0.0, -0.3),
-                (0.1578, 1.0, -0.2),
-                (-0.1578, 1.0, -0.2),
-                (-0.1578, -0.0, -0.3),
-                (-0.1578, -0.0, 0.3),
-                (-0.1578, 1.0, 0.2),
-                (0.1578, 1.0, 0.2),
-                (0.1578, 0.0, 0.3),
-                (0.1578, 0.25, -0.275),
-                (-0.1578, 0.25, -0.275),
-                (0.1578, 0.75, -0.225),
-                (-0.1578, 0.75, -0.225),
-                (0.1578, 0.75, 0.225),
-                (0.1578, 0.25, 0.275),
-                (-0.1578, 0.25, 0.275),
-                (-0.1578, 0.75, 0.225),
-                ]
-
-            if 'Z' in self.palm_rotation_axis:
-                # Flip x/z coordinates
-                verts = [v[::-1] for v in verts]
-
-            edges = [
-                (1, 2), (0, 3), (4, 7), (5, 6),
-                (8, 0), (9, 3), (10, 1), (11, 2),
-                (12, 6), (13, 7), (4, 14), (15, 5),
-                (10, 8), (11, 9), (15, 14), (12, 13),
-                ]
-            mesh.from_pydata(verts, edges, [])
-            mesh.update()
-
-            mod = w.modifiers.new("subsurf", 'SUBSURF')
-            mod.levels = 2
+        verts = [
+            (0.1578, 0.0, -0.3),
+            (0.1578, 1.0, -0.2),
+            (-0.1578, 1.0, -0.2),
+            (-0.1578, -0.0, -0.3),
+            (-0.1578, -0.0, 0.3),
+            (-0.1578, 1.0, 0.2),
+            (0.1578, 1.0, 0.2),
+            (0.1578, 0.0, 0.3),
+            (0.1578, 0.25, -0.275),
+            (-0.1578, 0.25, -0.275),
+            (0.1578, 0.75, -0.225),
+            (-0.1578, 0.75, -0.225),
+            (0.1578, 0.75, 0.225),
+            (0.1578, 0.25, 0.275),
+            (-0.1578, 0.25, 0.275),
+            (-0.1578, 0.75, 0.225),
+            ]
+
+        if 'Z' in self.palm_rotation_axis:
+            # Flip x/z coordinates
+            verts = [v[::-1] for v in verts]
+
+        edges = [
+            (1, 2), (0, 3), (4, 7), (5, 6),
+            (8, 0), (9, 3), (10, 1), (11, 2),
+            (12, 6), (13, 7), (4, 14), (15, 5),
+            (10, 8), (11, 9), (15, 14), (12, 13),
+            ]
+        create_widget_mesh(self.obj, ctrl, verts, edges, subsurf=2)
 
 
 def add_parameters(params):
@@ -1,6 +1,6 @@
 import bpy
 from mathutils import Vector
-from ...utils import copy_bone, flip_bone, put_bone, org, align_bone_y_axis, align_bone_x_axis
+from ...utils import copy_bone, copy_bones_properties, flip_bone, put_bone, org, align_bone_y_axis, align_bone_x_axis
 from ...utils import strip_org, make_deformer_name, connected_children_names
 from ...utils import create_circle_widget, create_sphere_widget, create_neck_bend_widget, create_neck_tweak_widget
 from ..widgets import create_ballsocket_widget
@@ -23,12 +23,15 @@ if is_selected( controls ):
 
 class Rig:
 
+    staged = True
+
     def __init__(self, obj, bone_name, params):
         """ Initialize torso rig and key rig properties """
 
         eb = obj.data.edit_bones
 
         self.obj = obj
+        self.copied = []    # (original, copy) bone names, see rig_bones()
         self.org_bones = [bone_name] + connected_children_names(obj, bone_name)
         self.params = params
         # self.spine_length = sum([eb[b].length for b in self.org_bones])
@@ -135,19 +138,18 @@ class Rig:
         org_bones = self.org_bones
         pivot_name = org_bones[pivot-1]
 
-        bpy.ops.object.mode_set(mode='EDIT')
         eb = self.obj.data.edit_bones
 
         # Create torso control bone
         torso_name = 'torso'
-        ctrl_name = copy_bone(self.obj, pivot_name, torso_name)
+        ctrl_name = copy_bone(self.obj, pivot_name, torso_name, copied=self.copied)
         ctrl_eb = eb[ctrl_name]
 
         self.orient_bone(ctrl_eb, 'y', self.spine_length * 0.6)
 
         # Create mch_pivot
         mch_name = make_mechanism_name('pivot')
-        mch_name = copy_bone(self.obj, ctrl_name, mch_name)
+        mch_name = copy_bone(self.obj, ctrl_name, mch_name, copied=self.copied)
         mch_eb = eb[mch_name]
 
         mch_eb.length /= 4
@@ -171,13 +173,12 @@ class Rig:
     def create_deform(self):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode='EDIT')
         eb = self.obj.data.edit_bones
 
         def_bones = []
         for org_b in org_bones:
             def_name = make_deformer_name(strip_org(org_b))
-            def_name = copy_bone(self.obj, org_b, def_name)
+            def_name = copy_bone(self.obj, org_b, def_name, copied=self.copied)
             def_bones.append(def_name)
 
         return def_bones
@@ -185,7 +186,6 @@ class Rig:
     def create_neck(self, neck_bones):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode='EDIT')
         eb = self.obj.data.edit_bones
 
         if not self.use_head:
@@ -204,7 +204,7 @@ class Rig:
         neck, neck_bend = '', ''
         if len(neck_bones) >= 2:
             # Create neck control
-            neck = copy_bone(self.obj, org(neck_bones[0]), 'neck')
+            neck = copy_bone(self.obj, org(neck_bones[0]), 'neck', copied=self.copied)
             neck_eb = eb[neck]
 
             # Neck spans all neck bones (except head)
@@ -213,7 +213,7 @@ class Rig:
             if len(neck_bones) > 3:
 
                 # Create neck bend control
-                neck_bend = copy_bone(self.obj, org(neck_bones[0]), 'neck_bend')
+                neck_bend = copy_bone(self.obj, org(neck_bones[0]), 'neck_bend', copied=self.copied)
                 neck_bend_eb = eb[neck_bend]
 
                 # Neck pivot position
@@ -229,23 +229,24 @@ class Rig:
                 eb[neck_bend].length = eb[neck].length / 2
 
         # Create head control
-        head = copy_bone(self.obj, org(neck_bones[-1]), 'head')
+        head = copy_bone(self.obj, org(neck_bones[-1]), 'head', copied=self.copied)
 
         # MCH bones
         mch_str, mch_neck = '', ''
         if len(neck_bones) >= 2:
             # Neck MCH stretch
-            mch_str = copy_bone(self.obj, neck, make_mechanism_name('STR-neck'))
+            mch_str = copy_bone(self.obj, neck, make_mechanism_name('STR-neck'), copied=self.copied)
 
             # Neck MCH rotation
             mch_neck = copy_bone(
-                self.obj, neck, make_mechanism_name('ROT-neck')
+                self.obj, neck, make_mechanism_name('ROT-neck'),
+                copied=self.copied
             )
 
             self.orient_bone(eb[mch_neck], 'y', self.spine_length / 10)
 
         # Head MCH rotation
-        mch_head = copy_bone(self.obj, head, make_mechanism_name('ROT-head'))
+        mch_head = copy_bone(self.obj, head, make_mechanism_name('ROT-head'), copied=self.copied)
         self.orient_bone(eb[mch_head], 'y', self.spine_length / 10)
 
         twk, mch = [], []
@@ -253,7 +254,7 @@ class Rig:
         if len(neck_bones) >= 2:
             # Intermediary bones
             for b in neck_bones[1:-1]:  # All except 1st (neck) and last (head)
-                mch_name = copy_bone(self.obj, org(b), make_mechanism_name(b))
+                mch_name = copy_bone(self.obj, org(b), make_mechanism_name(b), copied=self.copied)
                 eb[mch_name].length /= 4
                 align_bone_y_axis(self.obj, mch_name, eb[neck].y_axis)
                 align_bone_x_axis(self.obj, mch_name, eb[neck].x_axis)
@@ -263,7 +264,7 @@ class Rig:
             # Tweak bones
             for b in neck_bones[:-1]:   # All except last bone
                 twk_name = "tweak_" + b
-                twk_name = copy_bone(self.obj, org(b), twk_name)
+                twk_name = copy_bone(self.obj, org(b), twk_name, copied=self.copied)
 
                 eb[twk_name].length /= 2
 
@@ -284,30 +285,30 @@ class Rig:
     def create_chest(self, chest_bones):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode='EDIT')
         eb = self.obj.data.edit_bones
 
         # get total spine length
 
         # Create chest control bone
-        chest = copy_bone(self.obj, org(chest_bones[0]), 'chest')
+        chest = copy_bone(self.obj, org(chest_bones[0]), 'chest', copied=self.copied)
         self.orient_bone(eb[chest], 'y', self.spine_length / 3)
 
         # create chest mch_wgt
         mch_wgt = copy_bone(
             self.obj, org(chest_bones[-1]),
-            make_mechanism_name('WGT-chest')
+            make_mechanism_name('WGT-chest'),
+            copied=self.copied
         )
 
         # Create mch and twk bones
         twk, mch = [], []
 
         for b in chest_bones:
-            mch_name = copy_bone( self.obj, org(b), make_mechanism_name(b) )
+            mch_name = copy_bone( self.obj, org(b), make_mechanism_name(b), copied=self.copied )
             self.orient_bone( eb[mch_name], 'y', self.spine_length / 10 )
 
             twk_name = "tweak_" + b
-            twk_name = copy_bone( self.obj, org(b), twk_name )
+            twk_name = copy_bone( self.obj, org(b), twk_name, copied=self.copied )
             eb[twk_name].length /= 2
 
             mch += [ mch_name ]
@@ -323,11 +324,10 @@ class Rig:
     def create_hips(self, hip_bones):
         org_bones = self.org_bones
 
-        bpy.ops.object.mode_set(mode='EDIT')
         eb = self.obj.data.edit_bones
 
         # Create hips control bone
-        hips = copy_bone(self.obj, org(hip_bones[-1]), 'hips')
+        hips = copy_bone(self.obj, org(hip_bones[-1]), 'hips', copied=self.copied)
         self.orient_bone(
             eb[hips],
             'y',
@@ -338,19 +338,20 @@ class Rig:
         # create hips mch_wgt
         mch_wgt = copy_bone(
             self.obj, org(hip_bones[0]),
-            make_mechanism_name('WGT-hips')
+            make_mechanism_name('WGT-hips'),
+            copied=self.copied
         )
 
         # Create mch and tweak bones
         twk, mch = [], []
         for b in hip_bones:
-            mch_name = copy_bone( self.obj, org(b), make_mechanism_name(b) )
+            mch_name = copy_bone( self.obj, org(b), make_mechanism_name(b), copied=self.copied )
             self.orient_bone(
                 eb[mch_name], 'y', self.spine_length / 10, reverse = True
             )
 
             twk_name = "tweak_" + b
-            twk_name = copy_bone( self.obj, org(b), twk_name )
+            twk_name = copy_bone( self.obj, org(b), twk_name, copied=self.copied )
 
             eb[twk_name].length /= 2
 
@@ -365,7 +366,6 @@ class Rig:
         }
 
     def create_tail(self, tail_bones):
-        bpy.ops.object.mode_set(mode='EDIT')
         eb = self.obj.data.edit_bones
         org_bones = self.org_bones
 
@@ -376,7 +376,8 @@ class Rig:
             ctrl_bone = copy_bone(
                 self.obj,
                 org(name),
-                strip_org(name)
+                strip_org(name),
+                copied=self.copied
             )
 
             flip_bone(self.obj, ctrl_bone)
@@ -387,7 +388,8 @@ class Rig:
         main_ctrl_bone = copy_bone(
             self.obj,
             org(name),
-            strip_org(name).split('.')[0] + "_master"
+            strip_org(name).split('.')[0] + "_master",
+            copied=self.copied
         )
         flip_bone(self.obj, main_ctrl_bone)
 
@@ -396,7 +398,8 @@ class Rig:
         mch_rot_tail = copy_bone(
                 self.obj,
                 org(tail_first),
-                make_mechanism_name("ROT-tail")
+                make_mechanism_name("ROT-tail"),
+                copied=self.copied
             )
 
         self.orient_bone(eb[mch_rot_tail], 'y', eb[tail_first].length)
@@ -410,7 +413,8 @@ class Rig:
             tweak_bone = copy_bone(
                 self.obj,
                 org(name),
-                "tweak_" + strip_org(name)
+                "tweak_" + strip_org(name),
+                copied=self.copied
             )
 
             tweak_e = eb[tweak_bone]
@@ -430,9 +434,15 @@ class Rig:
             'original_names': tail_bones
         }
 
-    def parent_bones(self, bones):
+    def parent_bones(self):
+        """ Parent the new bones.
+            Runs in edit mode.
+        """
+        bones = self.bones
+        if bones is None:
+            return
+
         org_bones = self.org_bones
-        bpy.ops.object.mode_set(mode='EDIT')
         eb = self.obj.data.edit_bones
 
         # Parent deform bones
@@ -564,7 +574,6 @@ class Rig:
             eb[org_bones[-1]].parent = eb[bones['neck']['ctrl']]
 
     def make_constraint(self, bone, constraint):
-        bpy.ops.object.mode_set(mode='OBJECT')
         pb = self.obj.pose.bones
 
         owner_pb = pb[bone]
@@ -750,7 +759,6 @@ class Rig:
                 pb[b].ik_stretch = 0.1
 
     def create_drivers(self, bones):
-        bpy.ops.object.mode_set(mode='OBJECT')
         pb = self.obj.pose.bones
 
         # Setting the torso's props
@@ -802,8 +810,16 @@ class Rig:
             drv_modifier.coefficients[0] = 1.0
             drv_modifier.coefficients[1] = -1.0
 
-    def locks_and_widgets(self, bones):
-        bpy.ops.object.mode_set(mode='OBJECT')
+    def tweak_bones(self, bones):
+        tweaks = bones['neck']['tweak'] + bones['chest']['tweak']
+        tweaks += bones['hips']['tweak']
+
+        if self.use_tail:
+            tweaks += bones['tail']['tweak']
+
+        return tweaks
+
+    def bone_settings(self, bones):
         pb = self.obj.pose.bones
 
         # deform bones bbone segements
@@ -814,19 +830,16 @@ class Rig:
         self.obj.data.bones[bones['def'][-2]].bbone_easeout = 1.0
 
         # Locks
-        tweaks = bones['neck']['tweak'] + bones['chest']['tweak']
-        tweaks += bones['hips']['tweak']
-
         if self.use_tail:
-            tweaks += bones['tail']['tweak']
             pb[bones['tail']['ctrl_tail']].lock_location = True, True, True
 
         # Tweak bones locks
-        for bone in tweaks:
+        for bone in self.tweak_bones(bones):
             pb[bone].lock_rotation = True, False, True
             pb[bone].lock_scale = False, True, False
 
-        # Widgets
+    def create_widgets(self, bones):
+        pb = self.obj.pose.bones
 
         # Assigning a widget to torso bone
         create_cube_widget(
@@ -933,7 +946,7 @@ class Rig:
         pb[bones['hips']['ctrl']].custom_shape_transform = hips_widget_loc
 
         # Assigning widgets to tweak bones and layers
-        for bone in tweaks:
+        for bone in self.tweak_bones(bones):
 
             if bones['neck']['tweak'] and bone == bones['neck']['tweak'][0] \
                     and len(bones['neck']['original_names']) > 3:
@@ -944,16 +957,19 @@ class Rig:
             if self.tweak_layers:
                 pb[bone].bone.layers = self.tweak_layers
 
-    def generate(self):
+    def generate_bones(self):
+        """ Create the bones.
+            Runs in edit mode.
+        """
         # Torso Rig Anatomy:
         # Neck: all bones above neck point, last bone is head
         # Upper torso: all bones between pivot and neck start
         # Lower torso: all bones below pivot until tail point
         # Tail: all bones below tail point
 
+        self.bones = None
         bone_chains = self.build_bone_structure()
 
-        bpy.ops.object.mode_set(mode='EDIT')
         eb = self.obj.data.edit_bones
 
         # Clear parents for org bones
@@ -961,38 +977,53 @@ class Rig:
             eb[bone].use_connect = False
             eb[bone].parent = None
 
-        if bone_chains != 'ERROR':
+        if bone_chains == 'ERROR':
+            return
 
-            # Create lists of bones and strip "ORG" from their names
-            neck_bones = [strip_org(b) for b in bone_chains['neck']]
-            upper_torso_bones = [strip_org(b) for b in bone_chains['upper']]
-            lower_torso_bones = [strip_org(b) for b in bone_chains['lower']]
-            tail_bones = [strip_org(b) for b in bone_chains['tail']]
+        # Create lists of bones and strip "ORG" from their names
+        neck_bones = [strip_org(b) for b in bone_chains['neck']]
+        upper_torso_bones = [strip_org(b) for b in bone_chains['upper']]
+        lower_torso_bones = [strip_org(b) for b in bone_chains['lower']]
+        tail_bones = [strip_org(b) for b in bone_chains['tail']]
 
-            bones = {}
+        bones = {}
 
-            bones['def'] = self.create_deform()     # Gets org bones from self
-            bones['pivot'] = self.create_pivot(self.pivot_pos)
-            bones['neck'] = self.create_neck(neck_bones)
-            bones['chest'] = self.create_chest(upper_torso_bones)
-            bones['hips'] = self.create_hips(lower_torso_bones)
+        bones['def'] = self.create_deform()     # Gets org bones from self
+        bones['pivot'] = self.create_pivot(self.pivot_pos)
+        bones['neck'] = self.create_neck(neck_bones)
+        bones['chest'] = self.create_chest(upper_torso_bones)
+        bones['hips'] = self.create_hips(lower_torso_bones)
 
-            # TODO: Add create tail
-            if tail_bones:
-                bones['tail'] = self.create_tail(tail_bones)
+        # TODO: Add create tail
+        if tail_bones:
+            bones['tail'] = self.create_tail(tail_bones)
 
-            # TEST
-            bpy.ops.object.mode_set(mode='EDIT')
-            eb = self.obj.data.edit_bones
+        self.bones = bones
 
-            self.parent_bones(bones)
-            self.constrain_bones(bones)
-            self.create_drivers(bones)
-            self.locks_and_widgets(bones)
+    def rig_bones(self):
+        """ Copy the pose bone properties, add the constraints and drivers.
+            Runs in object mode.
+        """
+        bones = self.bones
+        if bones is None:
+            return
 
-        else:
+        copy_bones_properties(self.obj, self.copied)
+
+        self.constrain_bones(bones)
+        self.create_drivers(bones)
+        self.bone_settings(bones)
+
+    def generate_widgets(self):
+        """ Create the control widgets and the rig UI.
+            Runs in object mode.
+        """
+        bones = self.bones
+        if bones is None:
             return
 
+        self.create_widgets(bones)
+
         controls = [bones['neck']['ctrl'],  bones['neck']['ctrl_neck']]
         controls += [bones['chest']['ctrl'], bones['hips']['ctrl']]
         controls += [bones['pivot']['ctrl']]
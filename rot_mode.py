@@ -38,42 +38,254 @@ blender.stackexchange.com/questions/40711/how-to-convert-quaternions-keyframes-t
 #     "category": "Animation"}
 
 import bpy
+import os
+import shutil
+import tempfile
+import time
+from math import floor, pi
+from mathutils import Euler, Quaternion
 
-order_list = ['QUATERNION', 'XYZ', 'XZY', 'YXZ', 'YZX', 'ZXY', 'ZYX']
+from . import batch
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-class convert():
-    def get_or_create_fcurve(self, action, data_path, array_index=-1, group=None):
+order_list = ['QUATERNION', 'XYZ', 'XZY', 'YXZ', 'YZX', 'ZXY', 'ZYX']
+
+# Axes (i, j, k) and parity of each euler order, as in Blender's RotOrderInfo
+euler_axes = {'XYZ': ((0, 1, 2), False),
+              'XZY': ((0, 2, 1), True),
+              'YXZ': ((1, 0, 2), True),
+              'YZX': ((1, 2, 0), False),
+              'ZXY': ((2, 0, 1), False),
+              'ZYX': ((2, 1, 0), True)}
+
+
+def quats_to_eulers(quats, order):
+    """ Converts an (n, 4) array of quaternions to an (n, 3) array of
+        eulers, keeping consecutive eulers compatible.
+    """
+    (i, j, k), parity = euler_axes[order]
+
+    norms = np.linalg.norm(quats, axis=1)
+    norms[norms == 0] = 1.0
+    q = quats / norms[:, None]
+    q0, q1, q2, q3 = (q[:, n] * np.sqrt(2) for n in range(4))
+
+    # m[:, column, row], like Blender's quat_to_mat3()
+    m = np.empty((len(q), 3, 3))
+    m[:, 0, 0] = 1 - q2 * q2 - q3 * q3
+    m[:, 0, 1] = q0 * q3 + q1 * q2
+    m[:, 0, 2] = -q0 * q2 + q1 * q3
+    m[:, 1, 0] = -q0 * q3 + q1 * q2
+    m[:, 1, 1] = 1 - q1 * q1 - q3 * q3
+    m[:, 1, 2] = q0 * q1 + q2 * q3
+    m[:, 2, 0] = q0 * q2 + q1 * q3
+    m[:, 2, 1] = -q0 * q1 + q2 * q3
+    m[:, 2, 2] = 1 - q1 * q1 - q2 * q2
+
+    # Both solutions of mat3_normalized_to_eulO2(), keeping the smaller one
+    cy = np.hypot(m[:, i, i], m[:, i, j])
+    gimbal = cy <= 16 * np.finfo(np.float32).eps
+
+    eul1 = np.empty((len(q), 3))
+    eul1[:, i] = np.where(gimbal, np.arctan2(-m[:, k, j], m[:, j, j]), np.arctan2(m[:, j, k], m[:, k, k]))
+    eul1[:, j] = np.arctan2(-m[:, i, k], cy)
+    eul1[:, k] = np.where(gimbal, 0.0, np.arctan2(m[:, i, j], m[:, i, i]))
+
+    eul2 = np.empty((len(q), 3))
+    eul2[:, i] = np.arctan2(-m[:, j, k], -m[:, k, k])
+    eul2[:, j] = np.arctan2(-m[:, i, k], -cy)
+    eul2[:, k] = np.arctan2(-m[:, i, j], -m[:, i, i])
+    eul2[gimbal] = eul1[gimbal]
+    if parity:
+        eul1, eul2 = -eul1, -eul2
+
+    # Pick a solution per frame like mat3_normalized_to_compatible_eulO():
+    # the smaller one for the first frame, then the one closest to the
+    # previous euler, wrapped by compatible_euler().
+    eulers = []
+    euler = None
+    for e1, e2 in zip(eul1.tolist(), eul2.tolist()):
+        if euler is None:
+            euler = e2 if sum(map(abs, e1)) > sum(map(abs, e2)) else e1
+        else:
+            e1 = compatible_euler(e1, euler)
+            e2 = compatible_euler(e2, euler)
+            d1 = sum(abs(a - b) for a, b in zip(e1, euler))
+            d2 = sum(abs(a - b) for a, b in zip(e2, euler))
+            euler = e2 if d1 > d2 else e1
+        eulers.append(euler)
+
+    return np.array(eulers)
+
+
+def compatible_euler(eul, oldrot):
+    """ Returns eul with full turns added or removed to bring it close to
+        oldrot, like Blender's compatible_eul().
+    """
+    pi_thresh = 5.1
+    pi_x2 = 2.0 * pi
+
+    eul = list(eul)
+    deul = [0.0] * 3
+
+    # Correct differences of about 360 degrees first
+    for n in range(3):
+        deul[n] = eul[n] - oldrot[n]
+        if deul[n] > pi_thresh:
+            eul[n] -= floor(deul[n] / pi_x2 + 0.5) * pi_x2
+            deul[n] = eul[n] - oldrot[n]
+        elif deul[n] < -pi_thresh:
+            eul[n] += floor(-deul[n] / pi_x2 + 0.5) * pi_x2
+            deul[n] = eul[n] - oldrot[n]
+
+    # One axis rotated more than 180 degrees while the others are small
+    for n in range(3):
+        o1, o2 = (n + 1) % 3, (n + 2) % 3
+        if abs(deul[n]) > 3.2 and abs(deul[o1]) < 1.6 and abs(deul[o2]) < 1.6:
+            if deul[n] > 0.0:
+                eul[n] -= pi_x2
+            else:
+                eul[n] += pi_x2
+
+    return eul
+
+
+def eulers_to_quats(eulers, order):
+    """ Converts an (n, 3) array of eulers to an (n, 4) array of quaternions.
+    """
+    (i, j, k), parity = euler_axes[order]
+
+    ti = eulers[:, i] * 0.5
+    tj = eulers[:, j] * (-0.5 if parity else 0.5)
+    th = eulers[:, k] * 0.5
+    ci, cj, ch = np.cos(ti), np.cos(tj), np.cos(th)
+    si, sj, sh = np.sin(ti), np.sin(tj), np.sin(th)
+    cc, cs, sc, ss = ci * ch, ci * sh, si * ch, si * sh
+
+    # Like Blender's eulO_to_quat()
+    quats = np.empty((len(eulers), 4))
+    quats[:, 0] = cj * cc + sj * ss
+    quats[:, i + 1] = cj * sc - sj * cs
+    quats[:, j + 1] = cj * ss + sj * cc
+    quats[:, k + 1] = cj * cs - sj * sc
+    if parity:
+        quats[:, j + 1] = -quats[:, j + 1]
+    return quats
+
+
+class ActionCurves():
+    """ The F-curves of an action by (data_path, array_index), by data path
+        and by group name, kept up to date as the converter creates and
+        removes curves.
+    """
+    def __init__(self, action):
+        self.action = action
+        self.count = 0
+        self.fcurves = {}
+        self.paths = {}
+        self.groups = {}
         for fc in action.fcurves:
-            if fc.data_path == data_path and (array_index < 0 or fc.array_index == array_index):
-                return fc
+            self.add(fc)
+
+    def add(self, fc):
+        self.count += 1
+        self.fcurves[(fc.data_path, fc.array_index)] = fc
+        self.paths.setdefault(fc.data_path, []).append(fc)
+        if fc.group:
+            self.groups.setdefault(fc.group.name, []).append(fc)
 
-        fc = action.fcurves.new(data_path, array_index)
+    def new(self, data_path, array_index, group=None):
+        fc = self.action.fcurves.new(data_path, array_index)
         fc.group = group
+        self.add(fc)
         return fc
 
-    def add_keyframe_quat(self, action, quat, frame, bone_prefix, group):
-        for i in range(len(quat)):
-            fc = self.get_or_create_fcurve(action, bone_prefix + "rotation_quaternion", i, group)
-            pos = len(fc.keyframe_points)
-            fc.keyframe_points.add(1)
-            fc.keyframe_points[pos].co = [frame, quat[i]]
-            fc.update()
+    def remove_path(self, data_path):
+        for fc in self.paths.pop(data_path, []):
+            self.count -= 1
+            del self.fcurves[(fc.data_path, fc.array_index)]
+            if fc.group:
+                self.groups[fc.group.name].remove(fc)
+            self.action.fcurves.remove(fc)
 
-    def add_keyframe_euler(self, action, euler, frame, bone_prefix, group):
-        for i in range(len(euler)):
-            fc = self.get_or_create_fcurve(action, bone_prefix + "rotation_euler", i, group)
+    def is_valid(self):
+        return self.count == len(self.action.fcurves)
+
+
+class convert():
+    def __init__(self):
+        # {action pointer: ActionCurves}, see get_action_curves()
+        self.action_curves = {}
+
+    def get_action_curves(self, action):
+        """ Returns the F-curve lookup of an action, building it if the
+            action changed since.
+        """
+        curves = self.action_curves.get(action.as_pointer())
+        if curves is None or not curves.is_valid():
+            curves = self.action_curves[action.as_pointer()] = ActionCurves(action)
+        return curves
+
+    def get_or_create_fcurve(self, action, data_path, array_index=-1, group=None):
+        curves = self.get_action_curves(action)
+        if array_index < 0:
+            fcurves = curves.paths.get(data_path)
+            if fcurves:
+                return fcurves[0]
+        else:
+            fc = curves.fcurves.get((data_path, array_index))
+            if fc is not None:
+                return fc
+
+        return curves.new(data_path, array_index, group)
+
+    def sample_fcurves(self, action, data_path, frames, default):
+        """ Returns the values of the curves of a data path on the frames,
+            as a list of values per frame. The keys are read in bulk, and
+            the curves are only evaluated on the frames they have no key on.
+        """
+        columns = []
+        curves = self.get_action_curves(action).fcurves
+        fcurves = {index: curves[(data_path, index)] for index in range(len(default)) if (data_path, index) in curves}
+        for index, value in enumerate(default):
+            fc = fcurves.get(index)
+            if fc is None:
+                columns.append([value] * len(frames))
+                continue
+
+            co = [0.0] * (2 * len(fc.keyframe_points))
+            fc.keyframe_points.foreach_get('co', co)
+            keys = dict(zip(co[::2], co[1::2]))
+            columns.append([keys[fr] if fr in keys else fc.evaluate(fr) for fr in frames])
+
+        return [list(values) for values in zip(*columns)]
+
+    def add_keyframes(self, action, frames, values, data_path, group):
+        """ Adds keys for each frame to the curves of a data path, with one
+            bulk insert per curve.
+        """
+        for i in range(len(values[0]) if values else 0):
+            fc = self.get_or_create_fcurve(action, data_path, i, group)
             pos = len(fc.keyframe_points)
-            fc.keyframe_points.add(1)
-            fc.keyframe_points[pos].co = [frame, euler[i]]
+            fc.keyframe_points.add(len(frames))
+            co = [0.0] * (2 * len(fc.keyframe_points))
+            fc.keyframe_points.foreach_get('co', co)
+            for n, fr in enumerate(frames):
+                co[2 * (pos + n)] = fr
+                co[2 * (pos + n) + 1] = values[n][i]
+            fc.keyframe_points.foreach_set('co', co)
             fc.update()
 
     def frames_matching(self, action, data_path):
         frames = set()
-        for fc in action.fcurves:
-            if fc.data_path == data_path:
-                fri = [kp.co[0] for kp in fc.keyframe_points]
-                frames.update(fri)
+        for fc in self.get_action_curves(action).paths.get(data_path, []):
+            co = [0.0] * (2 * len(fc.keyframe_points))
+            fc.keyframe_points.foreach_get('co', co)
+            frames.update(co[::2])
         return frames
 
     # Converts only one group/bone in one action - Quat to euler
@@ -81,36 +293,42 @@ class convert():
 
         pose_bone = bone
         data_path = bone_prefix + "rotation_quaternion"
-        frames = self.frames_matching(action, data_path)
+        frames = sorted(self.frames_matching(action, data_path))
         group = action.groups[bone.name]
 
-        for fr in frames:
-            quat = bone.rotation_quaternion.copy()
-            for fc in action.fcurves:
-                if fc.data_path == data_path:
-                    quat[fc.array_index] = fc.evaluate(fr)
-            euler = quat.to_euler(order)
+        quats = self.sample_fcurves(action, data_path, frames, bone.rotation_quaternion)
+        if np is not None and quats:
+            eulers = quats_to_eulers(np.array(quats), order).tolist()
+        else:
+            eulers = []
+            euler = None
+            for quat in quats:
+                if euler is None:
+                    euler = Quaternion(quat).to_euler(order)
+                else:
+                    euler = Quaternion(quat).to_euler(order, euler)
+                eulers.append(euler)
 
-            self.add_keyframe_euler(action, euler, fr, bone_prefix, group)
-            bone.rotation_mode = order
+        self.add_keyframes(action, frames, eulers, bone_prefix + "rotation_euler", group)
+        bone.rotation_mode = order
 
     # Converts only one group/bone in one action - Euler to Quat
     def group_eq(self, obj, action, bone, bone_prefix, order):
 
         pose_bone = bone
         data_path = bone_prefix + "rotation_euler"
-        frames = self.frames_matching(action, data_path)
+        frames = sorted(self.frames_matching(action, data_path))
         group = action.groups[bone.name]
+        euler_order = bone.rotation_euler.order
 
-        for fr in frames:
-            euler = bone.rotation_euler.copy()
-            for fc in action.fcurves:
-                if fc.data_path == data_path:
-                    euler[fc.array_index] = fc.evaluate(fr)
-            quat = euler.to_quaternion()
+        eulers = self.sample_fcurves(action, data_path, frames, bone.rotation_euler)
+        if np is not None and eulers:
+            quats = eulers_to_quats(np.array(eulers), euler_order).tolist()
+        else:
+            quats = [Euler(euler, euler_order).to_quaternion() for euler in eulers]
 
-            self.add_keyframe_quat(action, quat, fr, bone_prefix, group)
-            bone.rotation_mode = order
+        self.add_keyframes(action, frames, quats, bone_prefix + "rotation_quaternion", group)
+        bone.rotation_mode = order
 
     # One Action - One Bone
     def one_act_one_bon(self, obj, action, bone, order):
@@ -128,22 +346,21 @@ class convert():
         order_euler = cond1 or cond2 or cond3 or cond4 or cond5 or cond6
         order_quat = order == 'QUATERNION'
 
-        for fcurve in action.fcurves:
-            if fcurve.group.name == bone.name:
-
-                # If To-Euler conversion
-                if order != 'QUATERNION':
-                    if fcurve.data_path.endswith('rotation_quaternion'):
-                        do = True
-                        bone_prefix = fcurve.data_path[:-len('rotation_quaternion')]
-                        break
+        curves = self.get_action_curves(action)
+        for fcurve in curves.groups.get(bone.name, []):
+            # If To-Euler conversion
+            if order != 'QUATERNION':
+                if fcurve.data_path.endswith('rotation_quaternion'):
+                    do = True
+                    bone_prefix = fcurve.data_path[:-len('rotation_quaternion')]
+                    break
 
-                # If To-Quat conversion
-                else:
-                    if fcurve.data_path.endswith('rotation_euler'):
-                        do = True
-                        bone_prefix = fcurve.data_path[:-len('rotation_euler')]
-                        break
+            # If To-Quat conversion
+            else:
+                if fcurve.data_path.endswith('rotation_euler'):
+                    do = True
+                    bone_prefix = fcurve.data_path[:-len('rotation_euler')]
+                    break
 
         # If To-Euler conversion
         if do and order != 'QUATERNION':
@@ -151,9 +368,7 @@ class convert():
             self.group_qe(obj, action, bone, bone_prefix, order)
 
             # Removes quaternion fcurves
-            for key in action.fcurves:
-                if key.data_path == 'pose.bones["' + bone.name + '"].rotation_quaternion':
-                    action.fcurves.remove(key)
+            curves.remove_path('pose.bones["' + bone.name + '"].rotation_quaternion')
 
         # If To-Quat conversion
         elif do:
@@ -161,20 +376,21 @@ class convert():
             self.group_eq(obj, action, bone, bone_prefix, order)
 
             # Removes euler fcurves
-            for key in action.fcurves:
-                if key.data_path == 'pose.bones["' + bone.name + '"].rotation_euler':
-                    action.fcurves.remove(key)
+            curves.remove_path('pose.bones["' + bone.name + '"].rotation_euler')
 
         # Changes rotation mode to new one
         bone.rotation_mode = order
 
     # One Action, selected bones
     def one_act_sel_bon(self, obj, action, pose_bones, order):
+        self.action_curves.clear()
         for bone in pose_bones:
             self.one_act_one_bon(obj, action, bone, order)
+        self.action_curves.clear()
 
     # One action, all Bones (in Action)
     def one_act_every_bon(self, obj, action, order):
+        self.action_curves.clear()
 
         # Collects pose_bones that are in the action
         pose_bones = set()
@@ -203,12 +419,12 @@ class convert():
         # Convert current action and pose_bones that are in each action
         for bone in pose_bones:
             self.one_act_one_bon(obj, action, bone, order)
+        self.action_curves.clear()
 
     # All Actions, selected bones
     def all_act_sel_bon(self, obj, pose_bones, order):
         for action in bpy.data.actions:
-            for bone in pose_bones:
-                self.one_act_one_bon(obj, action, bone, order)
+            self.one_act_sel_bon(obj, action, pose_bones, order)
 
     # All actions, All Bones (in each Action)
     def all_act_every_bon(self, obj, order):
@@ -219,6 +435,37 @@ class convert():
 convert = convert()
 
 
+def load_converted_actions(obj, path, names, order, bone_names=()):
+    """ Replaces actions by the converted ones from a library file, and
+        sets the rotation mode of the bones they were converted for.
+    """
+    source = 'rotation_euler' if order == 'QUATERNION' else 'rotation_quaternion'
+    names = [name for name in names if name in bpy.data.actions]
+
+    bones = set(name for name in bone_names if name in obj.pose.bones)
+    if not bone_names:
+        for name in names:
+            for fcurve in bpy.data.actions[name].fcurves:
+                if fcurve.data_path.endswith(source) and fcurve.group and fcurve.group.name in obj.pose.bones:
+                    bones.add(fcurve.group.name)
+
+    with bpy.data.libraries.load(path) as (data_from, data_to):
+        names = [name for name in names if name in data_from.actions]
+        data_to.actions = names
+
+    for name, action in zip(names, data_to.actions):
+        if action is None:
+            continue
+        old_action = bpy.data.actions[name]
+        old_action.user_remap(action)
+        action.use_fake_user = old_action.use_fake_user
+        bpy.data.actions.remove(old_action, do_unlink=True)
+        action.name = name
+
+    for name in bones:
+        obj.pose.bones[name].rotation_mode = order
+
+
 # def initSceneProperties(scn):
 #
 # 	bpy.types.Scene.order_list = bpy.props.EnumProperty(
@@ -273,6 +520,8 @@ class ToolsPanel(bpy.types.Panel):
         row.operator('rigify_quat2eu.current', icon='ACTION')
         row = col.row(align=True)
         row.operator('rigify_quat2eu.all', icon='NLA')
+        row = col.row(align=True)
+        row.operator('rigify_quat2eu.batch', icon='NLA')
 
 
 class CONVERT_OT_quat2eu_current_action(bpy.types.Operator):
@@ -326,6 +575,69 @@ class CONVERT_OT_quat2eu_all_actions(bpy.types.Operator):
         return {'FINISHED'}
 
 
+class CONVERT_OT_quat2eu_batch(bpy.types.Operator):
+    bl_label = 'Convert All Actions in Background'
+    bl_idname = 'rigify_quat2eu.batch'
+    bl_description = 'Converts bones in every Action of the saved file, split across background Blender processes'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    workers = bpy.props.IntProperty(name="Workers", description="Number of background Blender processes",
+                                    default=os.cpu_count() or 1, min=1)
+
+    def execute(op, context):
+        obj = bpy.context.active_object
+        order = order_list[bpy.context.scene['order_list']]
+        id_store = context.window_manager
+
+        if not bpy.data.filepath or bpy.data.is_dirty:
+            op.report({'ERROR'}, "Save the file first, the background processes convert the saved actions")
+            return {'CANCELLED'}
+
+        bones = []
+        if id_store.rigify_convert_only_selected:
+            bones = [bone.name for bone in bpy.context.selected_pose_bones]
+
+        actions = {action.name: sum(len(fcurve.keyframe_points) for fcurve in action.fcurves)
+                   for action in bpy.data.actions}
+
+        start = time.time()
+        wm = context.window_manager
+        wm.progress_begin(0, 1)
+        folder = tempfile.mkdtemp()
+        try:
+            output = os.path.join(folder, "converted_actions.blend")
+            results, timings = batch.convert_rotations(
+                bpy.app.binary_path, bpy.data.filepath, obj.name, order, output, actions, bones,
+                workers=op.workers, progress=lambda done, total: wm.progress_update(done / total))
+            if timings:
+                load_converted_actions(obj, output, timings.keys(), order, bones)
+        except Exception:
+            shutil.rmtree(folder, ignore_errors=True)
+            raise
+        finally:
+            wm.progress_end()
+
+        # Keep the converted parts around if they couldn't be merged
+        merge = [r for r in results if r['task'] == 'merge_actions' and r['status'] != 'FINISHED']
+        if merge:
+            op.report({'ERROR'}, "Merging the converted actions failed, the parts are kept in %s: %s" %
+                      (folder, merge[0]['error']))
+            return {'CANCELLED'}
+        shutil.rmtree(folder, ignore_errors=True)
+
+        for name in sorted(timings, key=lambda name: -timings[name]):
+            print("%8.2fs  %s" % (timings[name], name))
+
+        failed = [r for r in results if r['status'] != 'FINISHED']
+        if failed:
+            op.report({'WARNING'}, "Converted %d actions, %d background jobs failed: %s" %
+                      (len(timings), len(failed), failed[0]['error']))
+        else:
+            op.report({'INFO'}, "Converted %d actions in %.1fs" % (len(timings), time.time() - start))
+
+        return {'FINISHED'}
+
+
 def register():
     IDStore = bpy.types.WindowManager
 
@@ -346,6 +658,7 @@ def register():
     bpy.utils.register_class(ToolsPanel)
     bpy.utils.register_class(CONVERT_OT_quat2eu_current_action)
     bpy.utils.register_class(CONVERT_OT_quat2eu_all_actions)
+    bpy.utils.register_class(CONVERT_OT_quat2eu_batch)
 
 def unregister():
     IDStore = bpy.types.WindowManager
@@ -353,6 +666,7 @@ def unregister():
     bpy.utils.unregister_class(ToolsPanel)
     bpy.utils.unregister_class(CONVERT_OT_quat2eu_current_action)
     bpy.utils.unregister_class(CONVERT_OT_quat2eu_all_actions)
+    bpy.utils.unregister_class(CONVERT_OT_quat2eu_batch)
 
     del IDStore.rigify_convert_only_selected
 
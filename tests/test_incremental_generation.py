@@ -0,0 +1,103 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+# <pep8 compliant>
+""" Tests of incremental rig generation.
+
+    They need Blender, with the rigify add-on installed:
+
+        blender --background --factory-startup --python tests/test_incremental_generation.py
+"""
+
+import importlib
+import json
+import os
+import sys
+import unittest
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+# Name of the add-on package these tests are part of.
+ADDON_NAME = os.path.basename(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+PALM_BONES = ['ORG-palm.01.L', 'ORG-palm.02.L', 'ORG-palm.03.L', 'ORG-palm.04.L']
+
+
+@unittest.skipIf(bpy is None, "needs Blender")
+class IncrementalGenerationTest(unittest.TestCase):
+
+    def setUp(self):
+        import addon_utils
+
+        addon_utils.enable(ADDON_NAME, default_set=True)
+        self.generate = importlib.import_module(ADDON_NAME + ".generate")
+        human = importlib.import_module(ADDON_NAME + ".metarigs.human")
+
+        scene = bpy.context.scene
+        for ob in list(scene.objects):
+            bpy.data.objects.remove(ob, do_unlink=True)
+
+        self.metarig = bpy.data.objects.new("metarig", bpy.data.armatures.new("metarig"))
+        scene.objects.link(self.metarig)
+        scene.objects.active = self.metarig
+        human.create(self.metarig)
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+        id_store = bpy.context.window_manager
+        id_store.rigify_generate_mode = 'overwrite'
+        id_store.rigify_target_rig = ""
+        id_store.rigify_incremental_generation = True
+        id_store.rigify_force_widget_update = False
+
+    def generate_rig(self):
+        scene = bpy.context.scene
+        for ob in scene.objects:
+            ob.select = False
+        scene.objects.active = self.metarig
+        self.metarig.select = True
+        self.generate.generate_rig(bpy.context, self.metarig)
+        return scene.objects[bpy.context.window_manager.rigify_target_rig]
+
+    def test_regenerate_palm_only(self):
+        rig = self.generate_rig()
+
+        # The palm rig owns the sibling bones it takes, not the arm
+        cache = json.loads(rig.data[self.generate.GENERATION_CACHE])
+        for bone in PALM_BONES:
+            self.assertIn(bone, cache['rigs']['palm.01.L']['bones'])
+            self.assertNotIn(bone, cache['rigs']['upper_arm.L']['bones'])
+
+        constraints = {b: [c.type for c in rig.pose.bones[b].constraints] for b in PALM_BONES}
+        rig.pose.bones['upper_arm_fk.L']['test_marker'] = 1
+
+        self.metarig.pose.bones['palm.01.L'].rigify_parameters.palm_rotation_axis = 'Z'
+        rig = self.generate_rig()
+
+        # The arm was left alone, and the palm constraints weren't added twice
+        self.assertIn('test_marker', rig.pose.bones['upper_arm_fk.L'])
+        for bone in PALM_BONES:
+            self.assertEqual([c.type for c in rig.pose.bones[bone].constraints], constraints[bone])
+
+
+if __name__ == "__main__":
+    # Inside Blender, sys.argv holds the arguments of Blender itself
+    result = unittest.main(argv=[sys.argv[0]], exit=False).result
+    sys.exit(0 if result.wasSuccessful() else 1)
@@ -19,14 +19,17 @@
 # <pep8 compliant>
 
 import bpy
+import json
 from bpy.props import StringProperty
+from bpy.app.handlers import persistent
+from bpy_extras.io_utils import ExportHelper
 from mathutils import Color
 
-from .utils import get_rig_type, MetarigError
+from .utils import get_rig_type, clear_rig_type_cache, use_rig_hot_reload, MetarigError
 from .utils import write_metarig, write_widget
 from .utils import unique_name
 from .utils import upgradeMetarigTypes, outdated_types
-from .utils import get_keyed_frames, bones_in_frame
+from .utils import get_keyed_frames, bones_in_frame, get_action_index, ActionIndex, PoseBake
 from .utils import overwrite_prop_animation
 from .rigs.utils import get_limb_generated_names
 from . import rig_lists
@@ -34,6 +37,267 @@ from . import generate
 from . import rot_mode
 
 
+# The metarig status of each armature object, by name, and of the whole file.
+# See get_metarig_status() and get_file_metarig_status().
+metarig_status_cache = {}
+file_metarig_status = None
+# The object names the file status was computed for.
+metarig_status_names = None
+
+# Bone properties that may behave differently after generation
+CHECK_PROPS = {'IK_follow', 'root/parent', 'FK_limb_follow', 'IK_Stretch'}
+
+
+def get_metarig_status(obj):
+    """ Returns (show_warning, outdated) for an armature object, where
+        outdated is None, 'UPDATE' if it uses old rig types that can be
+        upgraded, or 'NOT_UPDATABLE'.
+        The status is cached until the armature changes.
+    """
+    status = metarig_status_cache.get(obj.name)
+    if status is None:
+        show_warning = False
+        for bone in obj.pose.bones:
+            if bone.bone.layers[30] and CHECK_PROPS.intersection(bone.keys()):
+                show_warning = True
+                break
+
+        outdated = None
+        for b in obj.pose.bones:
+            if b.rigify_type in outdated_types.keys():
+                if outdated_types[b.rigify_type]:
+                    outdated = 'UPDATE'
+                else:
+                    outdated = 'NOT_UPDATABLE'
+                    break
+
+        status = metarig_status_cache[obj.name] = (show_warning, outdated)
+    return status
+
+
+def get_file_metarig_status():
+    """ Returns (show_warning, show_update_metarig, show_not_updatable)
+        over all the armatures of the file.
+    """
+    global file_metarig_status, metarig_status_names
+
+    if file_metarig_status is None:
+        metarig_status_names = set(bpy.data.objects.keys())
+        show_warning = False
+        show_update_metarig = False
+        show_not_updatable = False
+
+        for obj in bpy.data.objects:
+            if type(obj.data) != bpy.types.Armature:
+                continue
+            warning, outdated = get_metarig_status(obj)
+            show_warning = show_warning or warning
+            if outdated == 'UPDATE':
+                show_update_metarig = True
+            elif outdated == 'NOT_UPDATABLE':
+                show_update_metarig = False
+                show_not_updatable = True
+
+        file_metarig_status = (show_warning, show_update_metarig, show_not_updatable)
+    return file_metarig_status
+
+
+def forget_metarig_status(obj=None):
+    """ Drops the cached metarig status of an armature, or of all of them.
+    """
+    global file_metarig_status, metarig_status_names
+
+    if obj is None:
+        metarig_status_cache.clear()
+        metarig_status_names = None
+    else:
+        metarig_status_cache.pop(obj.name, None)
+    file_metarig_status = None
+
+
+@persistent
+def update_metarig_status(scene):
+    """ Drops the cached metarig status of the armatures that changed.
+    """
+    global file_metarig_status, metarig_status_names
+
+    if file_metarig_status is None and not metarig_status_cache:
+        return
+
+    # Objects being added, removed or renamed only affect the file status
+    if bpy.data.objects.is_updated:
+        names = set(bpy.data.objects.keys())
+        if names != metarig_status_names:
+            metarig_status_names = names
+            file_metarig_status = None
+
+    for name in list(metarig_status_cache.keys()):
+        obj = bpy.data.objects.get(name)
+        if obj is None or obj.is_updated or obj.is_updated_data:
+            del metarig_status_cache[name]
+            file_metarig_status = None
+
+
+@persistent
+def clear_metarig_status(dummy):
+    forget_metarig_status()
+
+
+# Filtered rig type names by (collection name, for_bones, registry version),
+# and the (window manager pointer, names) last filled into rigify_types.
+rig_types_lists = {}
+filled_rig_types = None
+
+# Rig modules by rig type for the bone panel, None for the missing ones,
+# valid for the registry version in rig_type_modules_version.
+rig_type_modules = {}
+rig_type_modules_version = None
+
+
+def filter_rig_types(rig_list, collection_name, skip=()):
+    """ Yields the rig types of a list that belong to a collection.
+    """
+    prefix = collection_name + '.'
+    for r in rig_list:
+        if r in skip:
+            continue
+        if collection_name == "All" or r.startswith(prefix) or (collection_name == "None" and "." not in r):
+            yield r
+
+
+def get_rig_types_list(collection_name, for_bones=False):
+    """ Returns the names of the rig types of a collection, as a tuple.
+        The bone panel list leaves out the implementation rigs.
+        The lists are only built again when the rig types change.
+    """
+    key = (collection_name, for_bones, rig_lists.registry_version)
+    names = rig_types_lists.get(key)
+    if names is None:
+        for old_key in [k for k in rig_types_lists if k[2] != rig_lists.registry_version]:
+            del rig_types_lists[old_key]
+
+        skip = set(rig_lists.implementation_rigs) if for_bones else set()
+        names = list(filter_rig_types(rig_lists.rig_list, collection_name, skip))
+
+        external = rig_lists.rigs_dict.get('external')
+        if external:
+            skip = set(external['implementation_rigs']) if for_bones else set()
+            names += filter_rig_types(external['rig_list'], collection_name, skip)
+
+        names = rig_types_lists[key] = tuple(names)
+    return names
+
+
+def fill_rig_types(id_store, names):
+    """ Fills the rigify_types collection with rig type names, unless it
+        already holds them.
+    """
+    global filled_rig_types
+
+    if filled_rig_types is not None and filled_rig_types[0] == id_store.as_pointer() \
+            and filled_rig_types[1] is names and len(id_store.rigify_types) == len(names):
+        return
+
+    id_store.rigify_types.clear()
+    for r in names:
+        a = id_store.rigify_types.add()
+        a.name = r
+
+    filled_rig_types = (id_store.as_pointer(), names)
+
+
+def get_panel_rig_type(rig_name):
+    """ Returns the module of a rig type for drawing its parameters, or
+        None if it doesn't exist.
+        The module is cached per rig type until the rig types change,
+        unless hot reloading is enabled.
+    """
+    global rig_type_modules_version
+
+    if rig_type_modules_version != rig_lists.registry_version:
+        rig_type_modules.clear()
+        rig_type_modules_version = rig_lists.registry_version
+
+    if rig_name in rig_type_modules and not use_rig_hot_reload():
+        return rig_type_modules[rig_name]
+
+    try:
+        if 'external' in rig_lists.rigs_dict and rig_name in rig_lists.rigs_dict['external']['rig_list']:
+            custom_rigs_folder = bpy.context.user_preferences.addons['rigify'].preferences.custom_rigs_folder
+            rig = get_rig_type(rig_name, custom_rigs_folder)
+        else:
+            rig = get_rig_type(rig_name)
+        rig.Rig
+    except (ImportError, AttributeError):
+        rig = None
+
+    rig_type_modules[rig_name] = rig
+    return rig
+
+
+# The last generation profile decoded for the panel, as (raw json, report).
+decoded_profile = (None, None)
+
+
+def get_generation_profile(obj):
+    """ Returns the generation profile stored in a rig, decoded once for
+        as long as it doesn't change.
+    """
+    global decoded_profile
+
+    raw = obj.data.get(generate.GENERATION_PROFILE)
+    if raw != decoded_profile[0]:
+        decoded_profile = (raw, json.loads(raw))
+    return decoded_profile[1]
+
+
+class DATA_PT_rigify_generation_profile(bpy.types.Panel):
+    bl_label = "Rigify Generation Profile"
+    bl_space_type = 'PROPERTIES'
+    bl_region_type = 'WINDOW'
+    bl_context = "data"
+    bl_options = {'DEFAULT_CLOSED'}
+
+    @classmethod
+    def poll(cls, context):
+        return context.object and context.object.type == 'ARMATURE' \
+            and context.object.data.get(generate.GENERATION_PROFILE) is not None
+
+    def draw(self, context):
+        layout = self.layout
+        report = get_generation_profile(context.object)
+
+        row = layout.row()
+        row.label(text="Generated %s in %.3fs" % (report['date'], report['total']))
+        row.operator("pose.rigify_export_profile", text="", icon='EXPORT')
+
+        box = layout.box()
+        box.label(text="Stages")
+        for stage, mode in generate.GENERATE_STAGES:
+            if stage in report['stages']:
+                row = box.row()
+                row.label(text=stage)
+                row.label(text="%.3fs" % report['stages'][stage])
+
+        box = layout.box()
+        box.label(text="Rig Types")
+        types = sorted(report['types'].items(), key=lambda t: t[1]['time'], reverse=True)
+        for rig_type, entry in types:
+            row = box.row()
+            row.label(text="%s (%d)" % (rig_type, entry['count']))
+            row.label(text="%.3fs" % entry['time'])
+            if report['counted']:
+                row = box.row()
+                row.label(text="    " + ", ".join("%s: %d" % (key, entry[key]) for key in generate.PROFILE_COUNTS))
+
+        box = layout.box()
+        box.label(text="Slowest Rigs")
+        for rig in report['rigs'][:10]:
+            row = box.row()
+            row.label(text="%s (%s)" % (rig['name'], rig['type']))
+            row.label(text="%.3fs" % rig['time'])
+
+
 class DATA_PT_rigify_buttons(bpy.types.Panel):
     bl_label = "Rigify Buttons"
     bl_space_type = 'PROPERTIES'
@@ -53,27 +317,7 @@ class DATA_PT_rigify_buttons(bpy.types.Panel):
         if obj.mode in {'POSE', 'OBJECT'}:
 
             WARNING = "Warning: Some features may change after generation"
-            show_warning = False
-            show_update_metarig = False
-            show_not_updatable = False
-
-            check_props = ['IK_follow', 'root/parent', 'FK_limb_follow', 'IK_Stretch']
-
-            for obj in bpy.data.objects:
-                if type(obj.data) != bpy.types.Armature:
-                    continue
-                for bone in obj.pose.bones:
-                    if bone.bone.layers[30] and (list(set(bone.keys()) & set(check_props))):
-                        show_warning = True
-                        break
-                for b in obj.pose.bones:
-                    if b.rigify_type in outdated_types.keys():
-                        if outdated_types[b.rigify_type]:
-                            show_update_metarig = True
-                        else:
-                            show_update_metarig = False
-                            show_not_updatable = True
-                            break
+            show_warning, show_update_metarig, show_not_updatable = get_file_metarig_status()
 
             if show_warning:
                 layout.label(text=WARNING, icon='ERROR')
@@ -154,36 +398,18 @@ class DATA_PT_rigify_buttons(bpy.types.Panel):
                 if id_store.rigify_generate_mode == 'new':
                     row.enabled = False
 
+                row = col.row()
+                row.prop(id_store, "rigify_incremental_generation")
+                if id_store.rigify_generate_mode == 'new':
+                    row.enabled = False
+
+                row = col.row()
+                row.prop(id_store, "rigify_profile_generation")
+
         elif obj.mode == 'EDIT':
             # Build types list
             collection_name = str(id_store.rigify_collection).replace(" ", "")
-
-            for i in range(0, len(id_store.rigify_types)):
-                id_store.rigify_types.remove(0)
-
-            for r in rig_lists.rig_list:
-
-                if collection_name == "All":
-                    a = id_store.rigify_types.add()
-                    a.name = r
-                elif r.startswith(collection_name + '.'):
-                    a = id_store.rigify_types.add()
-                    a.name = r
-                elif (collection_name == "None") and ("." not in r):
-                    a = id_store.rigify_types.add()
-                    a.name = r
-
-            if 'external' in rig_lists.rigs_dict and rig_lists.rigs_dict['external']:
-                for r in rig_lists.rigs_dict['external']['rig_list']:
-                    if collection_name == "All":
-                        a = id_store.rigify_types.add()
-                        a.name = r
-                    elif r.startswith(collection_name + '.'):
-                        a = id_store.rigify_types.add()
-                        a.name = r
-                    elif (collection_name == "None") and ("." not in r):
-                        a = id_store.rigify_types.add()
-                        a.name = r
+            fill_rig_types(id_store, get_rig_types_list(collection_name))
 
             # Rig type list
             row = layout.row()
@@ -593,36 +819,7 @@ class BONE_PT_rigify_buttons(bpy.types.Panel):
         layout = self.layout
 
         # Build types list
-        for i in range(0, len(id_store.rigify_types)):
-            id_store.rigify_types.remove(0)
-
-        for r in rig_lists.rig_list:
-            if r in rig_lists.implementation_rigs:
-                continue
-            # collection = r.split('.')[0]  # UNUSED
-            if collection_name == "All":
-                a = id_store.rigify_types.add()
-                a.name = r
-            elif r.startswith(collection_name + '.'):
-                a = id_store.rigify_types.add()
-                a.name = r
-            elif collection_name == "None" and len(r.split('.')) == 1:
-                a = id_store.rigify_types.add()
-                a.name = r
-
-        if 'external' in rig_lists.rigs_dict:
-            for r in rig_lists.rigs_dict['external']['rig_list']:
-                if r in rig_lists.rigs_dict['external']['implementation_rigs']:
-                    continue
-                if collection_name == "All":
-                    a = id_store.rigify_types.add()
-                    a.name = r
-                elif r.startswith(collection_name + '.'):
-                    a = id_store.rigify_types.add()
-                    a.name = r
-                elif collection_name == "None" and len(r.split('.')) == 1:
-                    a = id_store.rigify_types.add()
-                    a.name = r
+        fill_rig_types(id_store, get_rig_types_list(collection_name, for_bones=True))
 
         # Rig type field
         row = layout.row()
@@ -630,14 +827,8 @@ class BONE_PT_rigify_buttons(bpy.types.Panel):
 
         # Rig type parameters / Rig type non-exist alert
         if rig_name != "":
-            try:
-                if 'external' in rig_lists.rigs_dict and rig_name in rig_lists.rigs_dict['external']['rig_list']:
-                    custom_rigs_folder = bpy.context.user_preferences.addons['rigify'].preferences.custom_rigs_folder
-                    rig = get_rig_type(rig_name, custom_rigs_folder)
-                else:
-                    rig = get_rig_type(rig_name)
-                rig.Rig
-            except (ImportError, AttributeError):
+            rig = get_panel_rig_type(rig_name)
+            if rig is None:
                 row = layout.row()
                 box = row.box()
                 box.label(text="ALERT: type \"%s\" does not exist!" % rig_name)
@@ -672,6 +863,10 @@ class VIEW3D_PT_tools_rigify_dev(bpy.types.Panel):
                 r.operator("armature.rigify_encode_metarig", text="Encode Metarig to Python")
                 r = self.layout.row()
                 r.operator("armature.rigify_encode_metarig_sample", text="Encode Sample to Python")
+                r = self.layout.row()
+                r.operator("armature.rigify_encode_metarig_data", text="Encode Metarig to Data")
+                r = self.layout.row()
+                r.operator("armature.rigify_reload_rig_types", text="Reload Rig Types")
 
             if context.mode == 'EDIT_MESH':
                 r = self.layout.row()
@@ -783,7 +978,9 @@ class Generate(bpy.types.Operator):
         use_global_undo = context.user_preferences.edit.use_global_undo
         context.user_preferences.edit.use_global_undo = False
         try:
-            generate.generate_rig(context, context.object)
+            freed_widgets = generate.generate_rig(context, context.object)
+            if freed_widgets:
+                self.report({'INFO'}, "Freed %d widget datablocks" % freed_widgets)
         except MetarigError as rig_exception:
             rigify_report_exception(self, rig_exception)
         finally:
@@ -792,6 +989,31 @@ class Generate(bpy.types.Operator):
         return {'FINISHED'}
 
 
+class ExportProfile(bpy.types.Operator, ExportHelper):
+    """ Saves the generation profile of the active rig as JSON.
+    """
+    bl_idname = "pose.rigify_export_profile"
+    bl_label = "Export Rigify Generation Profile"
+
+    filename_ext = ".json"
+    filter_glob = StringProperty(default="*.json", options={'HIDDEN'})
+
+    @classmethod
+    def poll(self, context):
+        return context.active_object is not None \
+            and context.active_object.type == 'ARMATURE' \
+            and context.active_object.data.get(generate.GENERATION_PROFILE) is not None
+
+    def execute(self, context):
+        report = json.loads(context.active_object.data[generate.GENERATION_PROFILE])
+        report['rig'] = context.active_object.name
+
+        with open(self.filepath, 'w') as f:
+            json.dump(report, f, indent=4)
+
+        return {'FINISHED'}
+
+
 class UpgradeMetarigTypes(bpy.types.Operator):
     """Upgrades metarig bones rigify_types"""
 
@@ -851,6 +1073,7 @@ class Sample(bpy.types.Operator):
             except (ImportError, AttributeError):
                 raise Exception("rig type '" + self.metarig_type + "' has no sample.")
             else:
+                rig_lists.ensure_parameters(self.metarig_type)
                 create_sample(context.active_object)
             finally:
                 context.user_preferences.edit.use_global_undo = use_global_undo
@@ -859,6 +1082,18 @@ class Sample(bpy.types.Operator):
         return {'FINISHED'}
 
 
+class ReloadRigTypes(bpy.types.Operator):
+    """ Reloads the rig type modules from their files on next use.
+    """
+    bl_idname = "armature.rigify_reload_rig_types"
+    bl_label = "Rigify Reload Rig Types"
+
+    def execute(self, context):
+        clear_rig_type_cache()
+        rig_type_modules.clear()
+        return {'FINISHED'}
+
+
 class EncodeMetarig(bpy.types.Operator):
     """ Creates Python code that will generate the selected metarig.
     """
@@ -886,6 +1121,35 @@ class EncodeMetarig(bpy.types.Operator):
         return {'FINISHED'}
 
 
+class EncodeMetarigData(bpy.types.Operator):
+    """ Creates a compact data file that will generate the selected metarig.
+        Save it as a .json file next to the metarig modules to add it
+        to the metarig menu.
+    """
+    bl_idname = "armature.rigify_encode_metarig_data"
+    bl_label = "Rigify Encode Metarig Data"
+    bl_options = {'UNDO'}
+
+    @classmethod
+    def poll(self, context):
+        return context.mode == 'EDIT_ARMATURE'
+
+    def execute(self, context):
+        name = "metarig.json"
+
+        if name in bpy.data.texts:
+            text_block = bpy.data.texts[name]
+            text_block.clear()
+        else:
+            text_block = bpy.data.texts.new(name)
+
+        text = write_metarig(context.active_object, layers=True, groups=True, format='DATA')
+        text_block.write(text)
+        bpy.ops.object.mode_set(mode='EDIT')
+
+        return {'FINISHED'}
+
+
 class EncodeMetarigSample(bpy.types.Operator):
     """ Creates Python code that will generate the selected metarig
         as a sample.
@@ -956,159 +1220,118 @@ class OBJECT_OT_GetFrameRange(bpy.types.Operator):
         return {'FINISHED'}
 
 
-def FktoIk(rig, window='ALL'):
+def get_limb_snap(rig, names, to_ik):
+    """ Returns the snapping operator the rig ui script registered for a
+        limb and its keyword arguments, to snap the ik bones to the fk
+        ones if to_ik is True, or the other way round.
+        The rig's own script is used, so baking snaps the same way as
+        the buttons of the rig.
+    """
+    ops = bpy.ops.pose
+    rig_id = rig.data['rig_id']
+    controls = names['controls']
+    ik_ctrl = names['ik_ctrl']
+    parent = names['parent']
+    pole = names['pole']
+
+    if names['limb_type'] == 'arm':
+        kwargs = {'uarm_fk': controls[1], 'farm_fk': controls[2], 'hand_fk': controls[3],
+                  'uarm_ik': controls[0], 'farm_ik': ik_ctrl[1], 'hand_ik': controls[4]}
+        if to_ik:
+            kwargs.update(pole=pole, main_parent=parent)
+            return getattr(ops, 'rigify_arm_ik2fk_' + rig_id), kwargs
+        return getattr(ops, 'rigify_arm_fk2ik_' + rig_id), kwargs
+    else:
+        kwargs = {'thigh_fk': controls[1], 'shin_fk': controls[2], 'foot_fk': controls[3],
+                  'mfoot_fk': controls[7], 'thigh_ik': controls[0], 'shin_ik': ik_ctrl[1],
+                  'mfoot_ik': ik_ctrl[2]}
+        if to_ik:
+            kwargs.update(foot_ik=controls[6], pole=pole, footroll=controls[5], main_parent=parent)
+            return getattr(ops, 'rigify_leg_ik2fk_' + rig_id), kwargs
+        kwargs.update(foot_ik=ik_ctrl[2])
+        return getattr(ops, 'rigify_leg_fk2ik_' + rig_id), kwargs
 
+
+def get_transfer_frames(rig, window, index=None):
     scn = bpy.context.scene
     id_store = bpy.context.window_manager
 
-    rig_id = rig.data['rig_id']
-    leg_ik2fk = eval('bpy.ops.pose.rigify_leg_ik2fk_' + rig_id)
-    arm_ik2fk = eval('bpy.ops.pose.rigify_arm_ik2fk_' + rig_id)
-    limb_generated_names = get_limb_generated_names(rig)
-
     if window == 'ALL':
-        frames = get_keyed_frames(rig)
+        frames = get_keyed_frames(rig, index)
         frames = [f for f in frames if f in range(id_store.rigify_transfer_start_frame, id_store.rigify_transfer_end_frame+1)]
-    elif window == 'CURRENT':
-        frames = [scn.frame_current]
     else:
         frames = [scn.frame_current]
+    return frames
+
+
+def get_transfer_bones(rig):
+    id_store = bpy.context.window_manager
 
     if not id_store.rigify_transfer_only_selected:
         pbones = rig.pose.bones
-        bpy.ops.pose.select_all(action='DESELECT')
     else:
         pbones = bpy.context.selected_pose_bones
-        bpy.ops.pose.select_all(action='DESELECT')
+    bpy.ops.pose.select_all(action='DESELECT')
+    return pbones
+
+
+def transfer_limbs(rig, window, to_ik):
+    """ Snaps the limbs of the transferred bones to IK or to FK on every
+        frame of the window, and keys the snapped bones.
+        The snapped transforms are recorded frame by frame and written
+        into the action at the end.
+    """
+    scn = bpy.context.scene
+    limb_generated_names = get_limb_generated_names(rig)
+    index = get_action_index(rig)
+    frames = get_transfer_frames(rig, window, index)
+    bake = PoseBake(rig)
 
-    for b in pbones:
+    for b in get_transfer_bones(rig):
         for group in limb_generated_names:
             if b.name in limb_generated_names[group].values() or b.name in limb_generated_names[group]['controls']\
                     or b.name in limb_generated_names[group]['ik_ctrl']:
                 names = limb_generated_names[group]
+                controls = names['controls']
+                parent = names['parent']
+                pole = names['pole']
+                func, kwargs = get_limb_snap(rig, names, to_ik)
+
                 if names['limb_type'] == 'arm':
-                    func = arm_ik2fk
-                    controls = names['controls']
-                    ik_ctrl = names['ik_ctrl']
-                    fk_ctrl = names['fk_ctrl']
-                    parent = names['parent']
-                    pole = names['pole']
-                    rig.pose.bones[controls[0]].bone.select = True
-                    rig.pose.bones[controls[4]].bone.select = True
-                    rig.pose.bones[pole].bone.select = True
-                    rig.pose.bones[parent].bone.select = True
-                    kwargs = {'uarm_fk': controls[1], 'farm_fk': controls[2], 'hand_fk': controls[3],
-                              'uarm_ik': controls[0], 'farm_ik': ik_ctrl[1], 'hand_ik': controls[4],
-                              'pole': pole, 'main_parent': parent}
                     args = (controls[0], controls[1], controls[2], controls[3],
                             controls[4], pole, parent)
+                    if to_ik:
+                        keyed = [controls[0], controls[4], pole, parent]
                 else:
-                    func = leg_ik2fk
-                    controls = names['controls']
-                    ik_ctrl = names['ik_ctrl']
-                    fk_ctrl = names['fk_ctrl']
-                    parent = names['parent']
-                    pole = names['pole']
-                    rig.pose.bones[controls[0]].bone.select = True
-                    rig.pose.bones[controls[6]].bone.select = True
-                    rig.pose.bones[controls[5]].bone.select = True
-                    rig.pose.bones[pole].bone.select = True
-                    rig.pose.bones[parent].bone.select = True
-                    kwargs = {'thigh_fk': controls[1], 'shin_fk': controls[2], 'foot_fk': controls[3],
-                              'mfoot_fk': controls[7], 'thigh_ik': controls[0], 'shin_ik': ik_ctrl[1],
-                              'foot_ik': controls[6], 'pole': pole, 'footroll': controls[5], 'mfoot_ik': ik_ctrl[2],
-                              'main_parent': parent}
                     args = (controls[0], controls[1], controls[2], controls[3],
                             controls[6], controls[5], pole, parent)
+                    if to_ik:
+                        keyed = [controls[0], controls[6], controls[5], pole, parent]
+                if not to_ik:
+                    keyed = [controls[1], controls[2], controls[3]]
 
                 for f in frames:
-                    if not bones_in_frame(f, rig, *args):
+                    if not bones_in_frame(f, rig, *args, index=index):
                         continue
                     scn.frame_set(f)
                     func(**kwargs)
-                    bpy.ops.anim.keyframe_insert_menu(type='BUILTIN_KSI_VisualLocRot')
-                    bpy.ops.anim.keyframe_insert_menu(type='Scaling')
+                    bake.record(f, keyed)
 
-                bpy.ops.pose.select_all(action='DESELECT')
                 limb_generated_names.pop(group)
                 break
 
+    bake.write()
 
-def IktoFk(rig, window='ALL'):
-
-    scn = bpy.context.scene
-    id_store = bpy.context.window_manager
-
-    rig_id = rig.data['rig_id']
-    leg_fk2ik = eval('bpy.ops.pose.rigify_leg_fk2ik_' + rig_id)
-    arm_fk2ik = eval('bpy.ops.pose.rigify_arm_fk2ik_' + rig_id)
-    limb_generated_names = get_limb_generated_names(rig)
-
-    if window == 'ALL':
-        frames = get_keyed_frames(rig)
-        frames = [f for f in frames if f in range(id_store.rigify_transfer_start_frame, id_store.rigify_transfer_end_frame+1)]
-    elif window == 'CURRENT':
-        frames = [scn.frame_current]
-    else:
-        frames = [scn.frame_current]
 
-    if not id_store.rigify_transfer_only_selected:
-        bpy.ops.pose.select_all(action='DESELECT')
-        pbones = rig.pose.bones
-    else:
-        pbones = bpy.context.selected_pose_bones
-        bpy.ops.pose.select_all(action='DESELECT')
+def FktoIk(rig, window='ALL'):
+    transfer_limbs(rig, window, to_ik=True)
 
-    for b in pbones:
-        for group in limb_generated_names:
-            if b.name in limb_generated_names[group].values() or b.name in limb_generated_names[group]['controls']\
-                    or b.name in limb_generated_names[group]['ik_ctrl']:
-                names = limb_generated_names[group]
-                if names['limb_type'] == 'arm':
-                    func = arm_fk2ik
-                    controls = names['controls']
-                    ik_ctrl = names['ik_ctrl']
-                    fk_ctrl = names['fk_ctrl']
-                    parent = names['parent']
-                    pole = names['pole']
-                    rig.pose.bones[controls[1]].bone.select = True
-                    rig.pose.bones[controls[2]].bone.select = True
-                    rig.pose.bones[controls[3]].bone.select = True
-                    kwargs = {'uarm_fk': controls[1], 'farm_fk': controls[2], 'hand_fk': controls[3],
-                              'uarm_ik': controls[0], 'farm_ik': ik_ctrl[1],
-                              'hand_ik': controls[4]}
-                    args = (controls[0], controls[1], controls[2], controls[3],
-                            controls[4], pole, parent)
-                else:
-                    func = leg_fk2ik
-                    controls = names['controls']
-                    ik_ctrl = names['ik_ctrl']
-                    fk_ctrl = names['fk_ctrl']
-                    parent = names['parent']
-                    pole = names['pole']
-                    rig.pose.bones[controls[1]].bone.select = True
-                    rig.pose.bones[controls[2]].bone.select = True
-                    rig.pose.bones[controls[3]].bone.select = True
-                    kwargs = {'thigh_fk': controls[1], 'shin_fk': controls[2], 'foot_fk': controls[3],
-                              'mfoot_fk': controls[7], 'thigh_ik': controls[0], 'shin_ik': ik_ctrl[1],
-                              'foot_ik': ik_ctrl[2], 'mfoot_ik': ik_ctrl[2]}
-                    args = (controls[0], controls[1], controls[2], controls[3],
-                            controls[6], controls[5], pole, parent)
 
-                for f in frames:
-                    if not bones_in_frame(f, rig, *args):
-                        continue
-                    scn.frame_set(f)
-                    func(**kwargs)
-                    bpy.ops.anim.keyframe_insert_menu(type='BUILTIN_KSI_VisualLocRot')
-                    bpy.ops.anim.keyframe_insert_menu(type='Scaling')
-
-                bpy.ops.pose.select_all(action='DESELECT')
-                limb_generated_names.pop(group)
-                break
+def IktoFk(rig, window='ALL'):
+    transfer_limbs(rig, window, to_ik=False)
 
 
-def clearAnimation(act, type, names):
+def clearAnimation(act, type, names, index=None):
 
     bones = []
     for group in names:
@@ -1124,12 +1347,12 @@ def clearAnimation(act, type, names):
             elif type == 'FK':
                 bones.extend([names[group]['controls'][1], names[group]['controls'][2], names[group]['controls'][3],
                               names[group]['controls'][4]])
+    if index is None:
+        index = ActionIndex(act)
+
     FCurves = []
-    for fcu in act.fcurves:
-        words = fcu.data_path.split('"')
-        if (words[0] == "pose.bones[" and
-                    words[1] in bones):
-            FCurves.append(fcu)
+    for bone in set(bones):
+        FCurves.extend(index.bone_fcurves.get(bone, []))
 
     if FCurves == []:
         return
@@ -1148,31 +1371,13 @@ def clearAnimation(act, type, names):
 def rotPoleToggle(rig, window='ALL', value=False, toggle=False, bake=False):
 
     scn = bpy.context.scene
-    id_store = bpy.context.window_manager
-
-    rig_id = rig.data['rig_id']
-    leg_fk2ik = eval('bpy.ops.pose.rigify_leg_fk2ik_' + rig_id)
-    arm_fk2ik = eval('bpy.ops.pose.rigify_arm_fk2ik_' + rig_id)
-    leg_ik2fk = eval('bpy.ops.pose.rigify_leg_ik2fk_' + rig_id)
-    arm_ik2fk = eval('bpy.ops.pose.rigify_arm_ik2fk_' + rig_id)
     limb_generated_names = get_limb_generated_names(rig)
+    index = get_action_index(rig)
+    frames = get_transfer_frames(rig, window, index)
+    pose_bake = PoseBake(rig)
+    baked_props = []
 
-    if window == 'ALL':
-        frames = get_keyed_frames(rig)
-        frames = [f for f in frames if f in range(id_store.rigify_transfer_start_frame, id_store.rigify_transfer_end_frame+1)]
-    elif window == 'CURRENT':
-        frames = [scn.frame_current]
-    else:
-        frames = [scn.frame_current]
-
-    if not id_store.rigify_transfer_only_selected:
-        bpy.ops.pose.select_all(action='DESELECT')
-        pbones = rig.pose.bones
-    else:
-        pbones = bpy.context.selected_pose_bones
-        bpy.ops.pose.select_all(action='DESELECT')
-
-    for b in pbones:
+    for b in get_transfer_bones(rig):
         for group in limb_generated_names:
             names = limb_generated_names[group]
 
@@ -1182,64 +1387,42 @@ def rotPoleToggle(rig, window='ALL', value=False, toggle=False, bake=False):
                 new_pole_vector_value = value
 
             if b.name in names.values() or b.name in names['controls'] or b.name in names['ik_ctrl']:
+                controls = names['controls']
+                parent = names['parent']
+                pole = names['pole']
+                func1, kwargs1 = get_limb_snap(rig, names, to_ik=False)
+                func2, kwargs2 = get_limb_snap(rig, names, to_ik=True)
+
                 if names['limb_type'] == 'arm':
-                    func1 = arm_fk2ik
-                    func2 = arm_ik2fk
-                    controls = names['controls']
-                    ik_ctrl = names['ik_ctrl']
-                    fk_ctrl = names['fk_ctrl']
-                    parent = names['parent']
-                    pole = names['pole']
-                    rig.pose.bones[controls[0]].bone.select = not new_pole_vector_value
-                    rig.pose.bones[controls[4]].bone.select = not new_pole_vector_value
-                    rig.pose.bones[parent].bone.select = not new_pole_vector_value
-                    rig.pose.bones[pole].bone.select = new_pole_vector_value
-
-                    kwargs1 = {'uarm_fk': controls[1], 'farm_fk': controls[2], 'hand_fk': controls[3],
-                              'uarm_ik': controls[0], 'farm_ik': ik_ctrl[1],
-                              'hand_ik': controls[4]}
-                    kwargs2 = {'uarm_fk': controls[1], 'farm_fk': controls[2], 'hand_fk': controls[3],
-                              'uarm_ik': controls[0], 'farm_ik': ik_ctrl[1], 'hand_ik': controls[4],
-                              'pole': pole, 'main_parent': parent}
                     args = (controls[0], controls[4], pole, parent)
+                    keyed = [controls[0], controls[4], parent]
                 else:
-                    func1 = leg_fk2ik
-                    func2 = leg_ik2fk
-                    controls = names['controls']
-                    ik_ctrl = names['ik_ctrl']
-                    fk_ctrl = names['fk_ctrl']
-                    parent = names['parent']
-                    pole = names['pole']
-                    rig.pose.bones[controls[0]].bone.select = not new_pole_vector_value
-                    rig.pose.bones[controls[6]].bone.select = not new_pole_vector_value
-                    rig.pose.bones[controls[5]].bone.select = not new_pole_vector_value
-                    rig.pose.bones[parent].bone.select = not new_pole_vector_value
-                    rig.pose.bones[pole].bone.select = new_pole_vector_value
-
-                    kwargs1 = {'thigh_fk': controls[1], 'shin_fk': controls[2], 'foot_fk': controls[3],
-                              'mfoot_fk': controls[7], 'thigh_ik': controls[0], 'shin_ik': ik_ctrl[1],
-                              'foot_ik': ik_ctrl[2], 'mfoot_ik': ik_ctrl[2]}
-                    kwargs2 = {'thigh_fk': controls[1], 'shin_fk': controls[2], 'foot_fk': controls[3],
-                              'mfoot_fk': controls[7], 'thigh_ik': controls[0], 'shin_ik': ik_ctrl[1],
-                              'foot_ik': controls[6], 'pole': pole, 'footroll': controls[5], 'mfoot_ik': ik_ctrl[2],
-                              'main_parent': parent}
                     args = (controls[0], controls[6], controls[5], pole, parent)
+                    keyed = [controls[0], controls[6], controls[5], parent]
+                if new_pole_vector_value:
+                    keyed = [pole]
 
+                baked_frames = []
                 for f in frames:
-                    if bake and not bones_in_frame(f, rig, *args):
+                    if bake and not bones_in_frame(f, rig, *args, index=index):
                         continue
                     scn.frame_set(f)
                     func1(**kwargs1)
-                    rig.pose.bones[names['parent']]['pole_vector'] = new_pole_vector_value
+                    rig.pose.bones[parent]['pole_vector'] = new_pole_vector_value
                     func2(**kwargs2)
                     if bake:
-                        bpy.ops.anim.keyframe_insert_menu(type='BUILTIN_KSI_VisualLocRot')
-                        bpy.ops.anim.keyframe_insert_menu(type='Scaling')
-                        overwrite_prop_animation(rig, rig.pose.bones[parent], 'pole_vector', new_pole_vector_value, [f])
+                        pose_bake.record(f, keyed)
+                        baked_frames.append(f)
 
-                bpy.ops.pose.select_all(action='DESELECT')
+                baked_props.append((parent, new_pole_vector_value, baked_frames))
                 limb_generated_names.pop(group)
                 break
+
+    if bake:
+        pose_bake.write()
+        for parent, new_pole_vector_value, baked_frames in baked_props:
+            overwrite_prop_animation(rig, rig.pose.bones[parent], 'pole_vector', new_pole_vector_value, baked_frames,
+                                     index=index)
     scn.frame_set(0)
 
 
@@ -1349,6 +1532,9 @@ class OBJECT_OT_Rot2Pole(bpy.types.Operator):
 
 def register():
 
+    bpy.app.handlers.scene_update_post.append(update_metarig_status)
+    bpy.app.handlers.load_post.append(clear_metarig_status)
+
     bpy.utils.register_class(DATA_OT_rigify_add_bone_groups)
     bpy.utils.register_class(DATA_OT_rigify_use_standard_colors)
     bpy.utils.register_class(DATA_OT_rigify_apply_selection_colors)
@@ -1361,15 +1547,19 @@ def register():
     bpy.utils.register_class(DATA_PT_rigify_bone_groups)
     bpy.utils.register_class(DATA_PT_rigify_layer_names)
     bpy.utils.register_class(DATA_PT_rigify_buttons)
+    bpy.utils.register_class(DATA_PT_rigify_generation_profile)
     bpy.utils.register_class(BONE_PT_rigify_buttons)
     bpy.utils.register_class(VIEW3D_PT_rigify_animation_tools)
     bpy.utils.register_class(VIEW3D_PT_tools_rigify_dev)
     bpy.utils.register_class(LayerInit)
     bpy.utils.register_class(Generate)
+    bpy.utils.register_class(ExportProfile)
     bpy.utils.register_class(UpgradeMetarigTypes)
     bpy.utils.register_class(SwitchToLegacy)
     bpy.utils.register_class(Sample)
+    bpy.utils.register_class(ReloadRigTypes)
     bpy.utils.register_class(EncodeMetarig)
+    bpy.utils.register_class(EncodeMetarigData)
     bpy.utils.register_class(EncodeMetarigSample)
     bpy.utils.register_class(EncodeWidget)
     bpy.utils.register_class(OBJECT_OT_GetFrameRange)
@@ -1385,6 +1575,9 @@ def register():
 
 def unregister():
 
+    bpy.app.handlers.scene_update_post.remove(update_metarig_status)
+    bpy.app.handlers.load_post.remove(clear_metarig_status)
+
     bpy.utils.unregister_class(DATA_OT_rigify_add_bone_groups)
     bpy.utils.unregister_class(DATA_OT_rigify_use_standard_colors)
     bpy.utils.unregister_class(DATA_OT_rigify_apply_selection_colors)
@@ -1397,15 +1590,19 @@ def unregister():
     bpy.utils.unregister_class(DATA_PT_rigify_bone_groups)
     bpy.utils.unregister_class(DATA_PT_rigify_layer_names)
     bpy.utils.unregister_class(DATA_PT_rigify_buttons)
+    bpy.utils.unregister_class(DATA_PT_rigify_generation_profile)
     bpy.utils.unregister_class(BONE_PT_rigify_buttons)
     bpy.utils.unregister_class(VIEW3D_PT_rigify_animation_tools)
     bpy.utils.unregister_class(VIEW3D_PT_tools_rigify_dev)
     bpy.utils.unregister_class(LayerInit)
     bpy.utils.unregister_class(Generate)
+    bpy.utils.unregister_class(ExportProfile)
     bpy.utils.unregister_class(UpgradeMetarigTypes)
     bpy.utils.unregister_class(SwitchToLegacy)
     bpy.utils.unregister_class(Sample)
+    bpy.utils.unregister_class(ReloadRigTypes)
     bpy.utils.unregister_class(EncodeMetarig)
+    bpy.utils.unregister_class(EncodeMetarigData)
     bpy.utils.unregister_class(EncodeMetarigSample)
     bpy.utils.unregister_class(EncodeWidget)
     bpy.utils.unregister_class(OBJECT_OT_GetFrameRange)
@@ -27,6 +27,8 @@ import random
 import time
 import re
 import os
+import json
+import hashlib
 from mathutils import Vector, Matrix, Color
 from rna_prop_ui import rna_idprop_ui_prop_get
 
@@ -40,6 +42,7 @@ WGT_PREFIX = "WGT-"  # Prefix for widget objects
 ROOT_NAME = "root"   # Name of the root bone.
 
 WGT_LAYERS = [x == 19 for x in range(0, 20)]  # Widgets go on the last scene layer.
+WGT_HASH = "rigify_widget_hash"  # Custom property marking shared widget objects and meshes
 
 MODULE_NAME = "rigify"  # Windows/Mac blender is weird, so __package__ doesn't work
 
@@ -251,9 +254,14 @@ def copy_bone_simple(obj, bone_name, assign_name=''):
         raise MetarigError("Cannot copy bones outside of edit mode")
 
 
-def copy_bone(obj, bone_name, assign_name=''):
+def copy_bone(obj, bone_name, assign_name='', copy_properties=True, copied=None):
     """ Makes a copy of the given bone in the given armature object.
         Returns the resulting bone's name.
+        copy_properties: also copy the pose bone properties, which needs a
+            round trip through object mode. Staged rigs pass False and call
+            copy_bone_properties() from their object mode stage instead.
+        copied: a list to append the (original, copy) bone names to instead
+            of copying the pose bone properties, for copy_bones_properties().
     """
     #if bone_name not in obj.data.bones:
     if bone_name not in obj.data.edit_bones:
@@ -287,46 +295,66 @@ def copy_bone(obj, bone_name, assign_name=''):
         edit_bone_2.bbone_easein = edit_bone_1.bbone_easein
         edit_bone_2.bbone_easeout = edit_bone_1.bbone_easeout
 
-        bpy.ops.object.mode_set(mode='OBJECT')
-
-        # Get the pose bones
-        pose_bone_1 = obj.pose.bones[bone_name_1]
-        pose_bone_2 = obj.pose.bones[bone_name_2]
-
-        # Copy pose bone attributes
-        pose_bone_2.rotation_mode = pose_bone_1.rotation_mode
-        pose_bone_2.rotation_axis_angle = tuple(pose_bone_1.rotation_axis_angle)
-        pose_bone_2.rotation_euler = tuple(pose_bone_1.rotation_euler)
-        pose_bone_2.rotation_quaternion = tuple(pose_bone_1.rotation_quaternion)
-
-        pose_bone_2.lock_location = tuple(pose_bone_1.lock_location)
-        pose_bone_2.lock_scale = tuple(pose_bone_1.lock_scale)
-        pose_bone_2.lock_rotation = tuple(pose_bone_1.lock_rotation)
-        pose_bone_2.lock_rotation_w = pose_bone_1.lock_rotation_w
-        pose_bone_2.lock_rotations_4d = pose_bone_1.lock_rotations_4d
-
-        # Copy custom properties
-        for key in pose_bone_1.keys():
-            if key != "_RNA_UI" \
-            and key != "rigify_parameters" \
-            and key != "rigify_type":
-                prop1 = rna_idprop_ui_prop_get(pose_bone_1, key, create=False)
-                prop2 = rna_idprop_ui_prop_get(pose_bone_2, key, create=True)
-                pose_bone_2[key] = pose_bone_1[key]
-                for key in prop1.keys():
-                    prop2[key] = prop1[key]
-
-        bpy.ops.object.mode_set(mode='EDIT')
+        if copied is not None:
+            copied.append((bone_name_1, bone_name_2))
+        elif copy_properties:
+            bpy.ops.object.mode_set(mode='OBJECT')
+            copy_bone_properties(obj, bone_name_1, bone_name_2)
+            bpy.ops.object.mode_set(mode='EDIT')
 
         return bone_name_2
     else:
         raise MetarigError("Cannot copy bones outside of edit mode")
 
 
+def copy_bone_properties(obj, bone_name_1, bone_name_2):
+    """ Copies the pose bone attributes and custom properties of a bone
+        onto another one.
+        Must be in object or pose mode.
+    """
+    if bpy.context.mode == 'EDIT_ARMATURE':
+        raise MetarigError("copy_bone_properties(): does not work while in edit mode")
+
+    # Get the pose bones
+    pose_bone_1 = obj.pose.bones[bone_name_1]
+    pose_bone_2 = obj.pose.bones[bone_name_2]
+
+    # Copy pose bone attributes
+    pose_bone_2.rotation_mode = pose_bone_1.rotation_mode
+    pose_bone_2.rotation_axis_angle = tuple(pose_bone_1.rotation_axis_angle)
+    pose_bone_2.rotation_euler = tuple(pose_bone_1.rotation_euler)
+    pose_bone_2.rotation_quaternion = tuple(pose_bone_1.rotation_quaternion)
+
+    pose_bone_2.lock_location = tuple(pose_bone_1.lock_location)
+    pose_bone_2.lock_scale = tuple(pose_bone_1.lock_scale)
+    pose_bone_2.lock_rotation = tuple(pose_bone_1.lock_rotation)
+    pose_bone_2.lock_rotation_w = pose_bone_1.lock_rotation_w
+    pose_bone_2.lock_rotations_4d = pose_bone_1.lock_rotations_4d
+
+    # Copy custom properties
+    for key in pose_bone_1.keys():
+        if key != "_RNA_UI" \
+        and key != "rigify_parameters" \
+        and key != "rigify_type":
+            prop1 = rna_idprop_ui_prop_get(pose_bone_1, key, create=False)
+            prop2 = rna_idprop_ui_prop_get(pose_bone_2, key, create=True)
+            pose_bone_2[key] = pose_bone_1[key]
+            for key in prop1.keys():
+                prop2[key] = prop1[key]
+
+
+def copy_bones_properties(obj, copied):
+    """ Copies the pose bone properties of the bones copied with the
+        copied argument of copy_bone(), in the order they were copied.
+        Must be in object or pose mode.
+    """
+    for bone_name_1, bone_name_2 in copied:
+        copy_bone_properties(obj, bone_name_1, bone_name_2)
+
 def flip_bone(obj, bone_name):
     """ Flips an edit bone.
     """
-    if bone_name not in obj.data.bones:
+    if bone_name not in obj.data.edit_bones:
         raise MetarigError("flip_bone(): bone '%s' not found, cannot copy it" % bone_name)
 
     if obj == bpy.context.active_object and bpy.context.mode == 'EDIT_ARMATURE':
@@ -343,7 +371,7 @@ def flip_bone(obj, bone_name):
 def put_bone(obj, bone_name, pos):
     """ Places a bone at the given position.
     """
-    if bone_name not in obj.data.bones:
+    if bone_name not in obj.data.edit_bones:
         raise MetarigError("put_bone(): bone '%s' not found, cannot move it" % bone_name)
 
     if obj == bpy.context.active_object and bpy.context.mode == 'EDIT_ARMATURE':
@@ -421,8 +449,9 @@ def make_nonscaling_child(obj, bone_name, location, child_name_postfix=""):
 # Widget creation
 #=============================================
 
-def adjust_widget(mesh, axis='y', offset=0.0):
-
+def get_adjust_widget_matrix(axis='y', offset=0.0):
+    """ Returns the matrix adjust_widget() transforms the vertices with.
+    """
     if axis[0] == '-':
         s = -1
         axis = axis[1]
@@ -443,8 +472,15 @@ def adjust_widget(mesh, axis='y', offset=0.0):
         rot_matrix = Matrix.Rotation(s*math.pi/2, 4, 'X')
         trans_matrix = Matrix.Translation((0.0, 0.0, offset))
 
+    return trans_matrix * rot_matrix
+
+
+def adjust_widget(mesh, axis='y', offset=0.0):
+
+    matrix = get_adjust_widget_matrix(axis, offset)
+
     for vert in mesh.vertices:
-        vert.co = (trans_matrix * rot_matrix * vert.co.to_4d()).to_3d()
+        vert.co = (matrix * vert.co.to_4d()).to_3d()
 
 
 def obj_to_bone(obj, rig, bone_name):
@@ -467,8 +503,31 @@ def obj_to_bone(obj, rig, bone_name):
     obj.scale = (bone.length * scl_avg), (bone.length * scl_avg), (bone.length * scl_avg)
 
 
+def place_widget(obj, rig, bone_name):
+    """ Places a widget object at a bone. During generation this is
+        deferred, and done for all the widgets in one pass at the end.
+    """
+    if widget_queue is not None and widget_queue.rig == rig:
+        widget_queue.placements.append((obj, bone_name))
+    else:
+        obj_to_bone(obj, rig, bone_name)
+
+
+def link_widget(obj, rig):
+    """ Links a new widget object into the scene, under the widgets
+        group object of the rig.
+    """
+    bpy.context.scene.objects.link(obj)
+    wgts_group_name = 'WGTS_' + rig.name
+    if wgts_group_name in bpy.data.objects.keys():
+        obj.parent = bpy.data.objects[wgts_group_name]
+    obj.layers = WGT_LAYERS
+
+
 def create_widget(rig, bone_name, bone_transform_name=None):
     """ Creates an empty widget object for a bone, and returns the object.
+        Prefer create_widget_mesh(), which batches the widgets created
+        during generation.
     """
     if bone_transform_name is None:
         bone_transform_name = bone_name
@@ -481,7 +540,7 @@ def create_widget(rig, bone_name, bone_transform_name=None):
     if obj_name in scene.objects:
         # Move object to bone position, in case it changed
         obj = scene.objects[obj_name]
-        obj_to_bone(obj, rig, bone_transform_name)
+        place_widget(obj, rig, bone_transform_name)
 
         return None
     else:
@@ -495,28 +554,376 @@ def create_widget(rig, bone_name, bone_transform_name=None):
         # Create mesh object
         mesh = bpy.data.meshes.new(obj_name)
         obj = bpy.data.objects.new(obj_name, mesh)
-        scene.objects.link(obj)
 
         # Move object to bone position and set layers
-        obj_to_bone(obj, rig, bone_transform_name)
-        wgts_group_name = 'WGTS_' + rig.name
-        if wgts_group_name in bpy.data.objects.keys():
-            obj.parent = bpy.data.objects[wgts_group_name]
-        obj.layers = WGT_LAYERS
+        link_widget(obj, rig)
+        place_widget(obj, rig, bone_transform_name)
 
         return obj
 
 
+def set_widget_geometry(mesh, co, edges, faces=()):
+    """ Fills an empty mesh from flat vertex coordinate and edge index
+        arrays, and a list of faces, with foreach_set.
+    """
+    mesh.vertices.add(len(co) // 3)
+    mesh.vertices.foreach_set('co', co)
+    mesh.edges.add(len(edges) // 2)
+    mesh.edges.foreach_set('vertices', edges)
+
+    if faces:
+        loops = [i for face in faces for i in face]
+        loop_starts = []
+        start = 0
+        for face in faces:
+            loop_starts.append(start)
+            start += len(face)
+        mesh.loops.add(len(loops))
+        mesh.loops.foreach_set('vertex_index', loops)
+        mesh.polygons.add(len(faces))
+        mesh.polygons.foreach_set('loop_start', loop_starts)
+        mesh.polygons.foreach_set('loop_total', [len(face) for face in faces])
+
+    mesh.update(calc_edges=bool(faces))
+
+
+def add_widget_subsurf(obj, levels):
+    """ Adds a subdivision surface modifier to a widget object.
+    """
+    mod = obj.modifiers.new("subsurf", 'SUBSURF')
+    mod.levels = levels
+
+
+def create_widget_mesh(rig, bone_name, verts, edges, faces=(), bone_transform_name=None, subsurf=0):
+    """ Creates a widget with the given geometry for a bone.
+        subsurf: subdivision levels to smooth the widget with, if any
+        During generation the widget is queued, and built together with
+        the others at the end, so None is returned. Otherwise the widget
+        object is built right away and returned.
+    """
+    co = [x for v in verts for x in v]
+    edges = [i for e in edges for i in e]
+    return create_widget_arrays(rig, bone_name, co, edges, faces, bone_transform_name, subsurf)
+
+
+def create_widget_arrays(rig, bone_name, co, edges, faces=(), bone_transform_name=None, subsurf=0):
+    """ Same as create_widget_mesh(), with the vertex coordinates and
+        edge indices given as flat arrays.
+    """
+    if bone_transform_name is None:
+        bone_transform_name = bone_name
+
+    if widget_queue is not None and widget_queue.rig == rig:
+        widget_queue.add(bone_name, bone_transform_name, co, edges, faces, subsurf)
+        return None
+
+    obj = create_widget(rig, bone_name, bone_transform_name)
+    if obj is not None:
+        set_widget_geometry(obj.data, co, edges, faces)
+        if subsurf:
+            add_widget_subsurf(obj, subsurf)
+    return obj
+
+
+def make_widget_shape(verts, edges):
+    """ Returns the geometry of a widget shape as flat vertex coordinate
+        and edge index tuples. The built-in shapes are made once, at
+        unit size, and sized per bone by create_widget_shape().
+    """
+    return tuple(x for v in verts for x in v), tuple(i for e in edges for i in e)
+
+
+def transform_widget_shape(co, scale=1.0, offset=(0.0, 0.0, 0.0), matrix=None):
+    """ Scales flat vertex coordinates, per axis if scale is a sequence,
+        moves them by offset and then transforms them by matrix, if any.
+    """
+    if isinstance(scale, (int, float)):
+        scale = (scale, scale, scale)
+
+    result = [0.0] * len(co)
+    for axis in range(3):
+        s, o = scale[axis], offset[axis]
+        result[axis::3] = [x * s + o for x in co[axis::3]]
+
+    if matrix is not None:
+        result = [x for i in range(0, len(result), 3) for x in (matrix * Vector(result[i:i + 3]).to_4d()).to_3d()]
+
+    return result
+
+
+def create_widget_shape(rig, bone_name, shape, scale=1.0, offset=(0.0, 0.0, 0.0), matrix=None,
+                        bone_transform_name=None, subsurf=0):
+    """ Creates a widget for a bone from a shape made by make_widget_shape(),
+        transformed by transform_widget_shape().
+    """
+    co, edges = shape
+    co = transform_widget_shape(co, scale, offset, matrix)
+    return create_widget_arrays(rig, bone_name, co, edges, (), bone_transform_name, subsurf)
+
+
+def get_geometry_hash(co, edges, faces, subsurf=0):
+    """ Returns a hash of widget geometry given as flat vertex coordinate
+        and edge index arrays, a list of faces and subdivision levels.
+        Widgets with the same shape and size get the same hash.
+    """
+    # Round away float noise, so equal shapes built differently match
+    geometry = ([round(x, 5) + 0.0 for x in co], list(edges), [tuple(f) for f in faces], subsurf)
+    return hashlib.md5(repr(geometry).encode()).hexdigest()
+
+
+def get_mesh_hash(mesh, subsurf=0):
+    """ Returns a hash of the geometry of a widget mesh, smoothed with
+        the given subdivision levels.
+    """
+    co = [0.0] * (len(mesh.vertices) * 3)
+    mesh.vertices.foreach_get('co', co)
+    edges = [0] * (len(mesh.edges) * 2)
+    mesh.edges.foreach_get('vertices', edges)
+    faces = [tuple(p.vertices) for p in mesh.polygons]
+    return get_geometry_hash(co, edges, faces, subsurf)
+
+
+def get_widget_subsurf(obj):
+    """ Returns the subdivision levels a widget object is smoothed with.
+    """
+    return sum(mod.levels for mod in obj.modifiers if mod.type == 'SUBSURF')
+
+
+def get_widget_hash(obj):
+    """ Returns a hash of the geometry of a widget object.
+    """
+    return get_mesh_hash(obj.data, get_widget_subsurf(obj))
+
+
+class WidgetLibrary:
+    """ The shared widgets: one mesh per unique widget shape across all
+        rigs, and one widget object per shape in each rig.
+        Widgets edited by hand since they were shared no longer match
+        their hash, and are dropped from the library the first time
+        they are looked up.
+    """
+    def __init__(self, rig):
+        self.rig = rig
+        self.objects = {}
+        wgts_group = bpy.data.objects.get('WGTS_' + rig.name)
+        if wgts_group is not None:
+            for child in wgts_group.children:
+                if WGT_HASH in child:
+                    self.objects[child[WGT_HASH]] = child
+        self.meshes = {mesh[WGT_HASH]: mesh for mesh in bpy.data.meshes if WGT_HASH in mesh}
+        self.checked_objects = set()
+        self.checked_meshes = set()
+
+    def get_mesh(self, key, subsurf=0):
+        """ Returns the shared mesh of a shape, or None.
+        """
+        mesh = self.meshes.get(key)
+        if mesh is not None and key not in self.checked_meshes:
+            if get_mesh_hash(mesh, subsurf) != key:
+                del mesh[WGT_HASH]
+                del self.meshes[key]
+                return None
+            self.checked_meshes.add(key)
+        return mesh
+
+    def get_object(self, key):
+        """ Returns the shared widget object of a shape in the rig, or None.
+        """
+        obj = self.objects.get(key)
+        if obj is not None and key not in self.checked_objects:
+            if obj.type != 'MESH' or get_widget_hash(obj) != key:
+                del obj[WGT_HASH]
+                del self.objects[key]
+                return None
+            self.checked_objects.add(key)
+        return obj
+
+    def add_mesh(self, key, mesh):
+        mesh.name = WGT_PREFIX + "shape_" + key[:12]
+        mesh[WGT_HASH] = key
+        self.meshes[key] = mesh
+        self.checked_meshes.add(key)
+
+    def add_object(self, key, obj):
+        obj.name = WGT_PREFIX + self.rig.name + "_shape_" + key[:8]
+        obj[WGT_HASH] = key
+        self.objects[key] = obj
+        self.checked_objects.add(key)
+
+
+class WidgetQueue:
+    """ Collects the widgets rigs create during generation, to build all
+        their meshes and place all their objects in one pass at the end.
+    """
+    def __init__(self, rig):
+        self.rig = rig
+        self.scene_objects = {ob.name: ob for ob in bpy.context.scene.objects}
+        self.shapes = []      # [(widget name, bone transform name, co, edges, faces, subsurf)]
+        self.placements = []  # [(object, bone transform name)]
+
+    def add(self, bone_name, bone_transform_name, co, edges, faces, subsurf=0):
+        obj_name = (WGT_PREFIX + self.rig.name + '_' + bone_name)[:63]
+
+        # Widgets that already exist are kept, and only moved
+        if obj_name in self.scene_objects:
+            self.placements.append((self.scene_objects[obj_name], bone_transform_name))
+        else:
+            self.shapes.append((obj_name, bone_transform_name, co, edges, faces, subsurf))
+
+    def build(self):
+        """ Creates the queued widgets, one shared object per unique
+            shape, and places all the widget objects.
+            Returns a dictionary of {widget name: shared object}.
+        """
+        library = WidgetLibrary(self.rig)
+
+        widgets = {}
+        for name, bone_transform_name, co, edges, faces, subsurf in self.shapes:
+            key = get_geometry_hash(co, edges, faces, subsurf)
+            obj = library.get_object(key)
+            if obj is None:
+                mesh = library.get_mesh(key, subsurf)
+                if mesh is None:
+                    mesh = bpy.data.meshes.new(name)
+                    set_widget_geometry(mesh, co, edges, faces)
+                    library.add_mesh(key, mesh)
+                obj = bpy.data.objects.new(name, mesh)
+                if subsurf:
+                    add_widget_subsurf(obj, subsurf)
+                link_widget(obj, self.rig)
+                library.add_object(key, obj)
+                self.placements.append((obj, bone_transform_name))
+            widgets[name] = obj
+
+        for obj, bone_name in self.placements:
+            obj_to_bone(obj, self.rig, bone_name)
+
+        return widgets
+
+
+# The queue the widgets of the rig being generated go to, if any
+widget_queue = None
+
+
+def start_widget_queue(rig):
+    """ Starts queueing the widgets created for a rig.
+    """
+    global widget_queue
+    widget_queue = WidgetQueue(rig)
+
+
+def widget_queue_length():
+    """ Returns the number of widgets queued so far, or 0 if widgets
+        aren't being queued.
+    """
+    if widget_queue is None:
+        return 0
+    return len(widget_queue.shapes) + len(widget_queue.placements)
+
+
+def finish_widget_queue(build=True):
+    """ Stops queueing widgets, and builds the queued ones.
+        Returns a dictionary of {widget name: shared object}.
+    """
+    global widget_queue
+    queue, widget_queue = widget_queue, None
+    if queue is None or not build:
+        return {}
+    return queue.build()
+
+
+def share_widgets(rig, widgets):
+    """ Replaces widget objects with shared ones, so that there is only
+        one mesh per unique widget shape across all rigs, and one widget
+        object per shape in each rig.
+        Returns a dictionary of {replaced widget name: shared object}.
+    """
+    library = WidgetLibrary(rig)
+
+    shared = {}
+    for wgt in widgets:
+        name = wgt.name
+        key = get_widget_hash(wgt)
+
+        if library.get_object(key) is not None:
+            # Drop the duplicate
+            mesh = wgt.data
+            bpy.data.objects.remove(wgt, do_unlink=True)
+            bpy.data.meshes.remove(mesh, do_unlink=True)
+        else:
+            # Keep this object as the shared one for its shape
+            if library.get_mesh(key, get_widget_subsurf(wgt)) is not None:
+                mesh = wgt.data
+                wgt.data = library.meshes[key]
+                bpy.data.meshes.remove(mesh, do_unlink=True)
+            else:
+                library.add_mesh(key, wgt.data)
+            library.add_object(key, wgt)
+
+        shared[name] = library.objects[key]
+
+    return shared
+
+
+def remove_widgets(wgts_group):
+    """ Removes all the widget objects under a widgets group object, and
+        their meshes once nothing else uses them.
+        Works on the blend data directly, so it doesn't depend on the
+        selection or on the visible layers.
+        Returns the number of removed datablocks.
+    """
+    objects = list(wgts_group.children)
+    meshes = {ob.data.name: ob.data for ob in objects if ob.type == 'MESH'}
+
+    for ob in objects:
+        bpy.data.objects.remove(ob, do_unlink=True)
+    removed = len(objects)
+
+    for mesh in meshes.values():
+        if mesh.users == 0:
+            bpy.data.meshes.remove(mesh)
+            removed += 1
+
+    return removed
+
+
+def remove_unused_widgets(rig):
+    """ Removes the shared widget objects of a rig that no bone uses any
+        more, and the shared widget meshes left without users.
+        Returns the number of removed datablocks.
+    """
+    wgts_group = bpy.data.objects.get('WGTS_' + rig.name)
+    used = {pb.custom_shape.name for pb in rig.pose.bones if pb.custom_shape is not None}
+
+    removed = 0
+    if wgts_group is not None:
+        for child in list(wgts_group.children):
+            if WGT_HASH in child and child.name not in used:
+                bpy.data.objects.remove(child, do_unlink=True)
+                removed += 1
+
+    for mesh in list(bpy.data.meshes):
+        if WGT_HASH in mesh and mesh.users == 0:
+            bpy.data.meshes.remove(mesh)
+            removed += 1
+
+    return removed
+
+
 # Common Widgets
 
+LINE_SHAPE = make_widget_shape([(0, 0, 0), (0, 1, 0)], [(0, 1)])
+
+
 def create_line_widget(rig, bone_name, bone_transform_name=None):
     """ Creates a basic line widget, a line that spans the length of the bone.
     """
-    obj = create_widget(rig, bone_name, bone_transform_name)
-    if obj is not None:
-        mesh = obj.data
-        mesh.from_pydata([(0, 0, 0), (0, 1, 0)], [(0, 1)], [])
-        mesh.update()
+    return create_widget_shape(rig, bone_name, LINE_SHAPE, bone_transform_name=bone_transform_name)
+
+
+CIRCLE_VERTS = [(0.7071068286895752, 2.980232238769531e-07, -0.7071065306663513), (0.8314696550369263, 2.980232238769531e-07, -0.5555699467658997), (0.9238795042037964, 2.682209014892578e-07, -0.3826831877231598), (0.9807852506637573, 2.5331974029541016e-07, -0.19509011507034302), (1.0, 2.365559055306221e-07, 1.6105803979371558e-07), (0.9807853698730469, 2.2351741790771484e-07, 0.19509044289588928), (0.9238796234130859, 2.086162567138672e-07, 0.38268351554870605), (0.8314696550369263, 1.7881393432617188e-07, 0.5555704236030579), (0.7071068286895752, 1.7881393432617188e-07, 0.7071070075035095), (0.5555702447891235, 1.7881393432617188e-07, 0.8314698934555054), (0.38268327713012695, 1.7881393432617188e-07, 0.923879861831665), (0.19509008526802063, 1.7881393432617188e-07, 0.9807855486869812), (-3.2584136988589307e-07, 1.1920928955078125e-07, 1.000000238418579), (-0.19509072601795197, 1.7881393432617188e-07, 0.9807854294776917), (-0.3826838731765747, 1.7881393432617188e-07, 0.9238795638084412), (-0.5555707216262817, 1.7881393432617188e-07, 0.8314695358276367), (-0.7071071863174438, 1.7881393432617188e-07, 0.7071065902709961), (-0.8314700126647949, 1.7881393432617188e-07, 0.5555698871612549), (-0.923879861831665, 2.086162567138672e-07, 0.3826829195022583), (-0.9807853698730469, 2.2351741790771484e-07, 0.1950896978378296), (-1.0, 2.365559907957504e-07, -7.290432222362142e-07), (-0.9807850122451782, 2.5331974029541016e-07, -0.195091113448143), (-0.9238790273666382, 2.682209014892578e-07, -0.38268423080444336), (-0.831468939781189, 2.980232238769531e-07, -0.5555710196495056), (-0.7071058750152588, 2.980232238769531e-07, -0.707107424736023), (-0.555569052696228, 2.980232238769531e-07, -0.8314701318740845), (-0.38268208503723145, 2.980232238769531e-07, -0.923879861831665), (-0.19508881866931915, 2.980232238769531e-07, -0.9807853102684021), (1.6053570561780361e-06, 2.980232238769531e-07, -0.9999997615814209), (0.19509197771549225, 2.980232238769531e-07, -0.9807847142219543), (0.3826850652694702, 2.980232238769531e-07, -0.9238786101341248), (0.5555717945098877, 2.980232238769531e-07, -0.8314683437347412)]
+CIRCLE_SHAPE = make_widget_shape(CIRCLE_VERTS, [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 7), (7, 8), (8, 9), (9, 10), (10, 11), (11, 12), (12, 13), (13, 14), (14, 15), (15, 16), (16, 17), (17, 18), (18, 19), (19, 20), (20, 21), (21, 22), (22, 23), (23, 24), (24, 25), (25, 26), (26, 27), (27, 28), (28, 29), (29, 30), (30, 31), (0, 31)])
+CIRCLE_LINE_SHAPE = make_widget_shape(CIRCLE_VERTS, [(28, 12), (0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 7), (7, 8), (8, 9), (9, 10), (10, 11), (11, 12), (12, 13), (13, 14), (14, 15), (15, 16), (16, 17), (17, 18), (18, 19), (19, 20), (20, 21), (21, 22), (22, 23), (23, 24), (24, 25), (25, 26), (26, 27), (27, 28), (28, 29), (29, 30), (30, 31), (0, 31)])
 
 
 def create_circle_widget(rig, bone_name, radius=1.0, head_tail=0.0, with_line=False, bone_transform_name=None):
@@ -524,63 +931,47 @@ def create_circle_widget(rig, bone_name, radius=1.0, head_tail=0.0, with_line=Fa
         radius: the radius of the circle
         head_tail: where along the length of the bone the circle is (0.0=head, 1.0=tail)
     """
-    obj = create_widget(rig, bone_name, bone_transform_name)
-    if obj != None:
-        v = [(0.7071068286895752, 2.980232238769531e-07, -0.7071065306663513), (0.8314696550369263, 2.980232238769531e-07, -0.5555699467658997), (0.9238795042037964, 2.682209014892578e-07, -0.3826831877231598), (0.9807852506637573, 2.5331974029541016e-07, -0.19509011507034302), (1.0, 2.365559055306221e-07, 1.6105803979371558e-07), (0.9807853698730469, 2.2351741790771484e-07, 0.19509044289588928), (0.9238796234130859, 2.086162567138672e-07, 0.38268351554870605), (0.8314696550369263, 1.7881393432617188e-07, 0.5555704236030579), (0.7071068286895752, 1.7881393432617188e-07, 0.7071070075035095), (0.5555702447891235, 1.7881393432617188e-07, 0.8314698934555054), (0.38268327713012695, 1.7881393432617188e-07, 0.923879861831665), (0.19509008526802063, 1.7881393432617188e-07, 0.9807855486869812), (-3.2584136988589307e-07, 1.1920928955078125e-07, 1.000000238418579), (-0.19509072601795197, 1.7881393432617188e-07, 0.9807854294776917), (-0.3826838731765747, 1.7881393432617188e-07, 0.9238795638084412), (-0.5555707216262817, 1.7881393432617188e-07, 0.8314695358276367), (-0.7071071863174438, 1.7881393432617188e-07, 0.7071065902709961), (-0.8314700126647949, 1.7881393432617188e-07, 0.5555698871612549), (-0.923879861831665, 2.086162567138672e-07, 0.3826829195022583), (-0.9807853698730469, 2.2351741790771484e-07, 0.1950896978378296), (-1.0, 2.365559907957504e-07, -7.290432222362142e-07), (-0.9807850122451782, 2.5331974029541016e-07, -0.195091113448143), (-0.9238790273666382, 2.682209014892578e-07, -0.38268423080444336), (-0.831468939781189, 2.980232238769531e-07, -0.5555710196495056), (-0.7071058750152588, 2.980232238769531e-07, -0.707107424736023), (-0.555569052696228, 2.980232238769531e-07, -0.8314701318740845), (-0.38268208503723145, 2.980232238769531e-07, -0.923879861831665), (-0.19508881866931915, 2.980232238769531e-07, -0.9807853102684021), (1.6053570561780361e-06, 2.980232238769531e-07, -0.9999997615814209), (0.19509197771549225, 2.980232238769531e-07, -0.9807847142219543), (0.3826850652694702, 2.980232238769531e-07, -0.9238786101341248), (0.5555717945098877, 2.980232238769531e-07, -0.8314683437347412)]
-        verts = [(a[0] * radius, head_tail, a[2] * radius) for a in v]
-        if with_line:
-            edges = [(28, 12), (0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 7), (7, 8), (8, 9), (9, 10), (10, 11), (11, 12), (12, 13), (13, 14), (14, 15), (15, 16), (16, 17), (17, 18), (18, 19), (19, 20), (20, 21), (21, 22), (22, 23), (23, 24), (24, 25), (25, 26), (26, 27), (27, 28), (28, 29), (29, 30), (30, 31), (0, 31)]
-        else:
-            edges = [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 7), (7, 8), (8, 9), (9, 10), (10, 11), (11, 12), (12, 13), (13, 14), (14, 15), (15, 16), (16, 17), (17, 18), (18, 19), (19, 20), (20, 21), (21, 22), (22, 23), (23, 24), (24, 25), (25, 26), (26, 27), (27, 28), (28, 29), (29, 30), (30, 31), (0, 31)]
-        mesh = obj.data
-        mesh.from_pydata(verts, edges, [])
-        mesh.update()
-        return obj
-    else:
-        return None
+    shape = CIRCLE_LINE_SHAPE if with_line else CIRCLE_SHAPE
+    return create_widget_shape(rig, bone_name, shape, (radius, 0.0, radius), (0.0, head_tail, 0.0),
+                               bone_transform_name=bone_transform_name)
+
+
+BOX_EDGES = [(0, 1), (1, 2), (2, 3), (3, 0), (4, 5), (5, 6), (6, 7), (7, 4), (0, 4), (1, 5), (2, 6), (3, 7)]
+CUBE_SHAPE = make_widget_shape([(1, 1, 1), (1, -1, 1), (-1, -1, 1), (-1, 1, 1), (1, 1, -1), (1, -1, -1), (-1, -1, -1), (-1, 1, -1)],
+                               BOX_EDGES)
 
 
 def create_cube_widget(rig, bone_name, radius=0.5, bone_transform_name=None):
     """ Creates a basic cube widget.
     """
-    obj = create_widget(rig, bone_name, bone_transform_name)
-    if obj is not None:
-        r = radius
-        verts = [(r, r, r), (r, -r, r), (-r, -r, r), (-r, r, r), (r, r, -r), (r, -r, -r), (-r, -r, -r), (-r, r, -r)]
-        edges = [(0, 1), (1, 2), (2, 3), (3, 0), (4, 5), (5, 6), (6, 7), (7, 4), (0, 4), (1, 5), (2, 6), (3, 7)]
-        mesh = obj.data
-        mesh.from_pydata(verts, edges, [])
-        mesh.update()
+    return create_widget_shape(rig, bone_name, CUBE_SHAPE, radius, bone_transform_name=bone_transform_name)
+
+
+CHAIN_SHAPE = make_widget_shape([(1, 1, 1), (0.5, -0.5, 0.5), (-0.5, -0.5, 0.5), (-1, 1, 1),
+                                 (1, 1, -1), (0.5, -0.5, -0.5), (-0.5, -0.5, -0.5), (-1, 1, -1)], BOX_EDGES)
+CHAIN_INVERTED_SHAPE = make_widget_shape([(0.5, 0.5, 0.5), (1, -1, 1), (-1, -1, 1), (-0.5, 0.5, 0.5),
+                                          (0.5, 0.5, -0.5), (1, -1, -1), (-1, -1, -1), (-0.5, 0.5, -0.5)], BOX_EDGES)
 
 
 def create_chain_widget(rig, bone_name, radius=0.5, invert=False, bone_transform_name=None, axis="y", offset=0.0):
     """Creates a basic chain widget
     """
-    obj = create_widget(rig, bone_name, bone_transform_name)
-    if obj is not None:
-        r = radius
-        rh = radius/2
-        if invert:
-            verts = [(rh, rh, rh), (r, -r, r), (-r, -r, r), (-rh, rh, rh), (rh, rh, -rh), (r, -r, -r), (-r, -r, -r), (-rh, rh, -rh)]
-        else:
-            verts = [(r, r, r), (rh, -rh, rh), (-rh, -rh, rh), (-r, r, r), (r, r, -r), (rh, -rh, -rh), (-rh, -rh, -rh), (-r, r, -r)]
-        edges = [(0, 1), (1, 2), (2, 3), (3, 0), (4, 5), (5, 6), (6, 7), (7, 4), (0, 4), (1, 5), (2, 6), (3, 7)]
-        mesh = obj.data
-        mesh.from_pydata(verts, edges, [])
-        mesh.update()
-        adjust_widget(mesh, axis=axis, offset=offset)
+    shape = CHAIN_INVERTED_SHAPE if invert else CHAIN_SHAPE
+    matrix = get_adjust_widget_matrix(axis, offset)
+    return create_widget_shape(rig, bone_name, shape, radius, matrix=matrix, bone_transform_name=bone_transform_name)
+
+
+SPHERE_SHAPE = make_widget_shape([(0.3535533845424652, 0.3535533845424652, 0.0), (0.4619397521018982, 0.19134171307086945, 0.0), (0.5, -2.1855694143368964e-08, 0.0), (0.4619397521018982, -0.19134175777435303, 0.0), (0.3535533845424652, -0.3535533845424652, 0.0), (0.19134174287319183, -0.4619397521018982, 0.0), (7.549790126404332e-08, -0.5, 0.0), (-0.1913416087627411, -0.46193981170654297, 0.0), (-0.35355329513549805, -0.35355350375175476, 0.0), (-0.4619397521018982, -0.19134178757667542, 0.0), (-0.5, 5.962440319251527e-09, 0.0), (-0.4619397222995758, 0.1913418024778366, 0.0), (-0.35355326533317566, 0.35355350375175476, 0.0), (-0.19134148955345154, 0.46193987131118774, 0.0), (3.2584136988589307e-07, 0.5, 0.0), (0.1913420855998993, 0.46193960309028625, 0.0), (7.450580596923828e-08, 0.46193960309028625, 0.19134199619293213), (5.9254205098113744e-08, 0.5, 2.323586443253589e-07), (4.470348358154297e-08, 0.46193987131118774, -0.1913415789604187), (2.9802322387695312e-08, 0.35355350375175476, -0.3535533547401428), (2.9802322387695312e-08, 0.19134178757667542, -0.46193981170654297), (5.960464477539063e-08, -1.1151834122813398e-08, -0.5000000596046448), (5.960464477539063e-08, -0.1913418024778366, -0.46193984150886536), (5.960464477539063e-08, -0.35355350375175476, -0.3535533845424652), (7.450580596923828e-08, -0.46193981170654297, -0.19134166836738586), (9.348272556053416e-08, -0.5, 1.624372103492533e-08), (1.043081283569336e-07, -0.4619397521018982, 0.19134168326854706), (1.1920928955078125e-07, -0.3535533845424652, 0.35355329513549805), (1.1920928955078125e-07, -0.19134174287319183, 0.46193966269493103), (1.1920928955078125e-07, -4.7414250303745575e-09, 0.49999991059303284), (1.1920928955078125e-07, 0.19134172797203064, 0.46193966269493103), (8.940696716308594e-08, 0.3535533845424652, 0.35355329513549805), (0.3535534739494324, 0.0, 0.35355329513549805), (0.1913418173789978, -2.9802322387695312e-08, 0.46193966269493103), (8.303572940349113e-08, -5.005858838558197e-08, 0.49999991059303284), (-0.19134165346622467, -5.960464477539063e-08, 0.46193966269493103), (-0.35355329513549805, -8.940696716308594e-08, 0.35355329513549805), (-0.46193963289260864, -5.960464477539063e-08, 0.19134168326854706), (-0.49999991059303284, -5.960464477539063e-08, 1.624372103492533e-08), (-0.4619397521018982, -2.9802322387695312e-08, -0.19134166836738586), (-0.3535534143447876, -2.9802322387695312e-08, -0.3535533845424652), (-0.19134171307086945, 0.0, -0.46193984150886536), (7.662531942287387e-08, 9.546055501630235e-09, -0.5000000596046448), (0.19134187698364258, 5.960464477539063e-08, -0.46193981170654297), (0.3535535931587219, 5.960464477539063e-08, -0.3535533547401428), (0.4619399905204773, 5.960464477539063e-08, -0.1913415789604187), (0.5000000596046448, 5.960464477539063e-08, 2.323586443253589e-07), (0.4619396924972534, 2.9802322387695312e-08, 0.19134199619293213)],
+                                 [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 7), (7, 8), (8, 9), (9, 10), (10, 11), (11, 12), (12, 13), (13, 14), (14, 15), (0, 15), (16, 31), (16, 17), (17, 18), (18, 19), (19, 20), (20, 21), (21, 22), (22, 23), (23, 24), (24, 25), (25, 26), (26, 27), (27, 28), (28, 29), (29, 30), (30, 31), (32, 33), (33, 34), (34, 35), (35, 36), (36, 37), (37, 38), (38, 39), (39, 40), (40, 41), (41, 42), (42, 43), (43, 44), (44, 45), (45, 46), (46, 47), (32, 47)])
 
 
 def create_sphere_widget(rig, bone_name, bone_transform_name=None):
     """ Creates a basic sphere widget, three pependicular overlapping circles.
     """
-    obj = create_widget(rig, bone_name, bone_transform_name)
-    if obj != None:
-        verts = [(0.3535533845424652, 0.3535533845424652, 0.0), (0.4619397521018982, 0.19134171307086945, 0.0), (0.5, -2.1855694143368964e-08, 0.0), (0.4619397521018982, -0.19134175777435303, 0.0), (0.3535533845424652, -0.3535533845424652, 0.0), (0.19134174287319183, -0.4619397521018982, 0.0), (7.549790126404332e-08, -0.5, 0.0), (-0.1913416087627411, -0.46193981170654297, 0.0), (-0.35355329513549805, -0.35355350375175476, 0.0), (-0.4619397521018982, -0.19134178757667542, 0.0), (-0.5, 5.962440319251527e-09, 0.0), (-0.4619397222995758, 0.1913418024778366, 0.0), (-0.35355326533317566, 0.35355350375175476, 0.0), (-0.19134148955345154, 0.46193987131118774, 0.0), (3.2584136988589307e-07, 0.5, 0.0), (0.1913420855998993, 0.46193960309028625, 0.0), (7.450580596923828e-08, 0.46193960309028625, 0.19134199619293213), (5.9254205098113744e-08, 0.5, 2.323586443253589e-07), (4.470348358154297e-08, 0.46193987131118774, -0.1913415789604187), (2.9802322387695312e-08, 0.35355350375175476, -0.3535533547401428), (2.9802322387695312e-08, 0.19134178757667542, -0.46193981170654297), (5.960464477539063e-08, -1.1151834122813398e-08, -0.5000000596046448), (5.960464477539063e-08, -0.1913418024778366, -0.46193984150886536), (5.960464477539063e-08, -0.35355350375175476, -0.3535533845424652), (7.450580596923828e-08, -0.46193981170654297, -0.19134166836738586), (9.348272556053416e-08, -0.5, 1.624372103492533e-08), (1.043081283569336e-07, -0.4619397521018982, 0.19134168326854706), (1.1920928955078125e-07, -0.3535533845424652, 0.35355329513549805), (1.1920928955078125e-07, -0.19134174287319183, 0.46193966269493103), (1.1920928955078125e-07, -4.7414250303745575e-09, 0.49999991059303284), (1.1920928955078125e-07, 0.19134172797203064, 0.46193966269493103), (8.940696716308594e-08, 0.3535533845424652, 0.35355329513549805), (0.3535534739494324, 0.0, 0.35355329513549805), (0.1913418173789978, -2.9802322387695312e-08, 0.46193966269493103), (8.303572940349113e-08, -5.005858838558197e-08, 0.49999991059303284), (-0.19134165346622467, -5.960464477539063e-08, 0.46193966269493103), (-0.35355329513549805, -8.940696716308594e-08, 0.35355329513549805), (-0.46193963289260864, -5.960464477539063e-08, 0.19134168326854706), (-0.49999991059303284, -5.960464477539063e-08, 1.624372103492533e-08), (-0.4619397521018982, -2.9802322387695312e-08, -0.19134166836738586), (-0.3535534143447876, -2.9802322387695312e-08, -0.3535533845424652), (-0.19134171307086945, 0.0, -0.46193984150886536), (7.662531942287387e-08, 9.546055501630235e-09, -0.5000000596046448), (0.19134187698364258, 5.960464477539063e-08, -0.46193981170654297), (0.3535535931587219, 5.960464477539063e-08, -0.3535533547401428), (0.4619399905204773, 5.960464477539063e-08, -0.1913415789604187), (0.5000000596046448, 5.960464477539063e-08, 2.323586443253589e-07), (0.4619396924972534, 2.9802322387695312e-08, 0.19134199619293213)]
-        edges = [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 7), (7, 8), (8, 9), (9, 10), (10, 11), (11, 12), (12, 13), (13, 14), (14, 15), (0, 15), (16, 31), (16, 17), (17, 18), (18, 19), (19, 20), (20, 21), (21, 22), (22, 23), (23, 24), (24, 25), (25, 26), (26, 27), (27, 28), (28, 29), (29, 30), (30, 31), (32, 33), (33, 34), (34, 35), (35, 36), (36, 37), (37, 38), (38, 39), (39, 40), (40, 41), (41, 42), (42, 43), (43, 44), (44, 45), (45, 46), (46, 47), (32, 47)]
-        mesh = obj.data
-        mesh.from_pydata(verts, edges, [])
-        mesh.update()
+    return create_widget_shape(rig, bone_name, SPHERE_SHAPE, bone_transform_name=bone_transform_name)
+
+
+circle_polygons = {}  # {(number of vertices, axis): unit circle shape}
 
 
 def create_circle_polygon(number_verts, axis, radius=1.0, head_tail=0.0):
@@ -590,231 +981,230 @@ def create_circle_polygon(number_verts, axis, radius=1.0, head_tail=0.0):
         radius: the radius of the circle
         head_tail: where along the length of the bone the circle is (0.0=head, 1.0=tail)
     """
-    verts = []
-    edges = []
-    angle = 2 * math.pi / number_verts
-    i = 0
-
     assert(axis in 'XYZ')
 
-    while i < (number_verts):
-        a = math.cos(i * angle)
-        b = math.sin(i * angle)
+    shape = circle_polygons.get((number_verts, axis))
+    if shape is None:
+        verts = []
+        edges = []
+        angle = 2 * math.pi / number_verts
+        i = 0
+
+        while i < (number_verts):
+            a = math.cos(i * angle)
+            b = math.sin(i * angle)
+
+            if axis == 'X':
+                verts.append((0.0, a, b))
+            elif axis == 'Y':
+                verts.append((a, 0.0, b))
+            elif axis == 'Z':
+                verts.append((a, b, 0.0))
 
-        if axis == 'X':
-            verts.append((head_tail, a * radius, b * radius))
-        elif axis == 'Y':
-            verts.append((a * radius, head_tail, b * radius))
-        elif axis == 'Z':
-            verts.append((a * radius, b * radius, head_tail))
+            if i < (number_verts - 1):
+                edges.append((i , i + 1))
 
-        if i < (number_verts - 1):
-            edges.append((i , i + 1))
+            i += 1
 
-        i += 1
+        edges.append((0, number_verts - 1))
 
-    edges.append((0, number_verts - 1))
+        shape = circle_polygons[(number_verts, axis)] = make_widget_shape(verts, edges)
 
+    # Scale the unit circle, and move it along the normal axis
+    index = 'XYZ'.index(axis)
+    scale = [radius] * 3
+    scale[index] = 0.0
+    offset = [0.0] * 3
+    offset[index] = head_tail
+    co = transform_widget_shape(shape[0], scale, offset)
+
+    verts = [tuple(co[i:i + 3]) for i in range(0, len(co), 3)]
+    edges = [shape[1][i:i + 2] for i in range(0, len(shape[1]), 2)]
     return verts, edges
 
 
+LIMB_SHAPE = make_widget_shape([(-1.1920928955078125e-07, 1.7881393432617188e-07, 0.0), (3.5762786865234375e-07, 1.0000004768371582, 0.0), (0.1767769455909729, 0.5000001192092896, 0.17677664756774902), (0.20786768198013306, 0.5000001192092896, 0.1388925313949585), (0.23097014427185059, 0.5000001192092896, 0.09567084908485413), (0.24519658088684082, 0.5000001192092896, 0.048772573471069336), (0.2500002384185791, 0.5000001192092896, -2.545945676502015e-09), (0.24519658088684082, 0.5000001192092896, -0.048772573471069336), (0.23097014427185059, 0.5000001192092896, -0.09567084908485413), (0.20786768198013306, 0.5000001192092896, -0.13889259099960327), (0.1767769455909729, 0.5000001192092896, -0.1767767071723938), (0.13889282941818237, 0.5000001192092896, -0.20786744356155396), (0.09567105770111084, 0.5000001192092896, -0.23096990585327148), (0.04877278208732605, 0.5000001192092896, -0.24519634246826172), (1.7279069197684294e-07, 0.5000000596046448, -0.25), (-0.0487724244594574, 0.5000001192092896, -0.24519634246826172), (-0.09567070007324219, 0.5000001192092896, -0.2309698462486267), (-0.13889241218566895, 0.5000001192092896, -0.20786738395690918), (-0.17677652835845947, 0.5000001192092896, -0.17677664756774902), (-0.20786726474761963, 0.5000001192092896, -0.13889244198799133), (-0.23096972703933716, 0.5000001192092896, -0.09567070007324219), (-0.24519610404968262, 0.5000001192092896, -0.04877239465713501), (-0.2499997615814209, 0.5000001192092896, 2.1997936983098043e-07), (-0.24519598484039307, 0.5000001192092896, 0.04877282679080963), (-0.23096948862075806, 0.5000001192092896, 0.09567108750343323), (-0.20786696672439575, 0.5000001192092896, 0.1388927698135376), (-0.1767762303352356, 0.5000001192092896, 0.17677688598632812), (-0.13889199495315552, 0.5000001192092896, 0.2078675627708435), (-0.09567028284072876, 0.5000001192092896, 0.23097002506256104), (-0.048771947622299194, 0.5000001192092896, 0.24519634246826172), (6.555903269145347e-07, 0.5000001192092896, 0.25), (0.04877324402332306, 0.5000001192092896, 0.24519622325897217), (0.09567153453826904, 0.5000001192092896, 0.23096966743469238), (0.13889318704605103, 0.5000001192092896, 0.20786714553833008)],
+                               [(0, 1), (2, 3), (4, 3), (5, 4), (5, 6), (6, 7), (8, 7), (8, 9), (10, 9), (10, 11), (11, 12), (13, 12), (14, 13), (14, 15), (16, 15), (16, 17), (17, 18), (19, 18), (19, 20), (21, 20), (21, 22), (22, 23), (24, 23), (25, 24), (25, 26), (27, 26), (27, 28), (29, 28), (29, 30), (30, 31), (32, 31), (32, 33), (2, 33)])
+
+
 def create_limb_widget(rig, bone_name, bone_transform_name=None):
     """ Creates a basic limb widget, a line that spans the length of the
         bone, with a circle around the center.
     """
-    obj = create_widget(rig, bone_name, bone_transform_name)
-    if obj != None:
-        verts = [(-1.1920928955078125e-07, 1.7881393432617188e-07, 0.0), (3.5762786865234375e-07, 1.0000004768371582, 0.0), (0.1767769455909729, 0.5000001192092896, 0.17677664756774902), (0.20786768198013306, 0.5000001192092896, 0.1388925313949585), (0.23097014427185059, 0.5000001192092896, 0.09567084908485413), (0.24519658088684082, 0.5000001192092896, 0.048772573471069336), (0.2500002384185791, 0.5000001192092896, -2.545945676502015e-09), (0.24519658088684082, 0.5000001192092896, -0.048772573471069336), (0.23097014427185059, 0.5000001192092896, -0.09567084908485413), (0.20786768198013306, 0.5000001192092896, -0.13889259099960327), (0.1767769455909729, 0.5000001192092896, -0.1767767071723938), (0.13889282941818237, 0.5000001192092896, -0.20786744356155396), (0.09567105770111084, 0.5000001192092896, -0.23096990585327148), (0.04877278208732605, 0.5000001192092896, -0.24519634246826172), (1.7279069197684294e-07, 0.5000000596046448, -0.25), (-0.0487724244594574, 0.5000001192092896, -0.24519634246826172), (-0.09567070007324219, 0.5000001192092896, -0.2309698462486267), (-0.13889241218566895, 0.5000001192092896, -0.20786738395690918), (-0.17677652835845947, 0.5000001192092896, -0.17677664756774902), (-0.20786726474761963, 0.5000001192092896, -0.13889244198799133), (-0.23096972703933716, 0.5000001192092896, -0.09567070007324219), (-0.24519610404968262, 0.5000001192092896, -0.04877239465713501), (-0.2499997615814209, 0.5000001192092896, 2.1997936983098043e-07), (-0.24519598484039307, 0.5000001192092896, 0.04877282679080963), (-0.23096948862075806, 0.5000001192092896, 0.09567108750343323), (-0.20786696672439575, 0.5000001192092896, 0.1388927698135376), (-0.1767762303352356, 0.5000001192092896, 0.17677688598632812), (-0.13889199495315552, 0.5000001192092896, 0.2078675627708435), (-0.09567028284072876, 0.5000001192092896, 0.23097002506256104), (-0.048771947622299194, 0.5000001192092896, 0.24519634246826172), (6.555903269145347e-07, 0.5000001192092896, 0.25), (0.04877324402332306, 0.5000001192092896, 0.24519622325897217), (0.09567153453826904, 0.5000001192092896, 0.23096966743469238), (0.13889318704605103, 0.5000001192092896, 0.20786714553833008)]
-        edges = [(0, 1), (2, 3), (4, 3), (5, 4), (5, 6), (6, 7), (8, 7), (8, 9), (10, 9), (10, 11), (11, 12), (13, 12), (14, 13), (14, 15), (16, 15), (16, 17), (17, 18), (19, 18), (19, 20), (21, 20), (21, 22), (22, 23), (24, 23), (25, 24), (25, 26), (27, 26), (27, 28), (29, 28), (29, 30), (30, 31), (32, 31), (32, 33), (2, 33)]
-        mesh = obj.data
-        mesh.from_pydata(verts, edges, [])
-        mesh.update()
+    return create_widget_shape(rig, bone_name, LIMB_SHAPE, bone_transform_name=bone_transform_name)
+
+
+BONE_SHAPE = make_widget_shape([(0.04, 1.0, -0.04), (0.1, 0.0, -0.1), (-0.1, 0.0, -0.1), (-0.04, 1.0, -0.04), (0.04, 1.0, 0.04), (0.1, 0.0, 0.1), (-0.1, 0.0, 0.1), (-0.04, 1.0, 0.04)],
+                               [(1, 2), (0, 1), (0, 3), (2, 3), (4, 5), (5, 6), (6, 7), (4, 7), (1, 5), (0, 4), (2, 6), (3, 7)])
 
 
 def create_bone_widget(rig, bone_name, bone_transform_name=None):
     """ Creates a basic bone widget, a simple obolisk-esk shape.
     """
-    obj = create_widget(rig, bone_name, bone_transform_name)
-    if obj != None:
-        verts = [(0.04, 1.0, -0.04), (0.1, 0.0, -0.1), (-0.1, 0.0, -0.1), (-0.04, 1.0, -0.04), (0.04, 1.0, 0.04), (0.1, 0.0, 0.1), (-0.1, 0.0, 0.1), (-0.04, 1.0, 0.04)]
-        edges = [(1, 2), (0, 1), (0, 3), (2, 3), (4, 5), (5, 6), (6, 7), (4, 7), (1, 5), (0, 4), (2, 6), (3, 7)]
-        mesh = obj.data
-        mesh.from_pydata(verts, edges, [])
-        mesh.update()
+    return create_widget_shape(rig, bone_name, BONE_SHAPE, bone_transform_name=bone_transform_name)
+
+
+COMPASS_SHAPE = make_widget_shape([(0.0, 1.2000000476837158, 0.0), (0.19509032368659973, 0.9807852506637573, 0.0), (0.3826834559440613, 0.9238795042037964, 0.0), (0.5555702447891235, 0.8314695954322815, 0.0), (0.7071067690849304, 0.7071067690849304, 0.0), (0.8314696550369263, 0.5555701851844788, 0.0), (0.9238795042037964, 0.3826834261417389, 0.0), (0.9807852506637573, 0.19509035348892212, 0.0), (1.2000000476837158, 7.549790126404332e-08, 0.0), (0.9807853102684021, -0.19509020447731018, 0.0), (0.9238795638084412, -0.38268327713012695, 0.0), (0.8314696550369263, -0.5555701851844788, 0.0), (0.7071067690849304, -0.7071067690849304, 0.0), (0.5555701851844788, -0.8314696550369263, 0.0), (0.38268327713012695, -0.9238796234130859, 0.0), (0.19509008526802063, -0.9807853102684021, 0.0), (-3.2584136988589307e-07, -1.2999999523162842, 0.0), (-0.19509072601795197, -0.9807851910591125, 0.0), (-0.3826838731765747, -0.9238793253898621, 0.0), (-0.5555707216262817, -0.8314692974090576, 0.0), (-0.7071072459220886, -0.707106351852417, 0.0), (-0.8314700126647949, -0.5555696487426758, 0.0), (-0.923879861831665, -0.3826826810836792, 0.0), (-0.9807854294776917, -0.1950894594192505, 0.0), (-1.2000000476837158, 9.655991561885457e-07, 0.0), (-0.980785071849823, 0.1950913518667221, 0.0), (-0.923879086971283, 0.38268446922302246, 0.0), (-0.831468939781189, 0.5555712580680847, 0.0), (-0.7071058750152588, 0.707107663154602, 0.0), (-0.5555691123008728, 0.8314703702926636, 0.0), (-0.38268208503723145, 0.9238801002502441, 0.0), (-0.19508881866931915, 0.9807855486869812, 0.0)],
+                                  [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 7), (7, 8), (8, 9), (9, 10), (10, 11), (11, 12), (12, 13), (13, 14), (14, 15), (15, 16), (16, 17), (17, 18), (18, 19), (19, 20), (20, 21), (21, 22), (22, 23), (23, 24), (24, 25), (25, 26), (26, 27), (27, 28), (28, 29), (29, 30), (30, 31), (0, 31)])
 
 
 def create_compass_widget(rig, bone_name, bone_transform_name=None):
     """ Creates a compass-shaped widget.
     """
-    obj = create_widget(rig, bone_name, bone_transform_name)
-    if obj != None:
-        verts = [(0.0, 1.2000000476837158, 0.0), (0.19509032368659973, 0.9807852506637573, 0.0), (0.3826834559440613, 0.9238795042037964, 0.0), (0.5555702447891235, 0.8314695954322815, 0.0), (0.7071067690849304, 0.7071067690849304, 0.0), (0.8314696550369263, 0.5555701851844788, 0.0), (0.9238795042037964, 0.3826834261417389, 0.0), (0.9807852506637573, 0.19509035348892212, 0.0), (1.2000000476837158, 7.549790126404332e-08, 0.0), (0.9807853102684021, -0.19509020447731018, 0.0), (0.9238795638084412, -0.38268327713012695, 0.0), (0.8314696550369263, -0.5555701851844788, 0.0), (0.7071067690849304, -0.7071067690849304, 0.0), (0.5555701851844788, -0.8314696550369263, 0.0), (0.38268327713012695, -0.9238796234130859, 0.0), (0.19509008526802063, -0.9807853102684021, 0.0), (-3.2584136988589307e-07, -1.2999999523162842, 0.0), (-0.19509072601795197, -0.9807851910591125, 0.0), (-0.3826838731765747, -0.9238793253898621, 0.0), (-0.5555707216262817, -0.8314692974090576, 0.0), (-0.7071072459220886, -0.707106351852417, 0.0), (-0.8314700126647949, -0.5555696487426758, 0.0), (-0.923879861831665, -0.3826826810836792, 0.0), (-0.9807854294776917, -0.1950894594192505, 0.0), (-1.2000000476837158, 9.655991561885457e-07, 0.0), (-0.980785071849823, 0.1950913518667221, 0.0), (-0.923879086971283, 0.38268446922302246, 0.0), (-0.831468939781189, 0.5555712580680847, 0.0), (-0.7071058750152588, 0.707107663154602, 0.0), (-0.5555691123008728, 0.8314703702926636, 0.0), (-0.38268208503723145, 0.9238801002502441, 0.0), (-0.19508881866931915, 0.9807855486869812, 0.0)]
-        edges = [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 7), (7, 8), (8, 9), (9, 10), (10, 11), (11, 12), (12, 13), (13, 14), (14, 15), (15, 16), (16, 17), (17, 18), (18, 19), (19, 20), (20, 21), (21, 22), (22, 23), (23, 24), (24, 25), (25, 26), (26, 27), (27, 28), (28, 29), (29, 30), (30, 31), (0, 31)]
-        mesh = obj.data
-        mesh.from_pydata(verts, edges, [])
-        mesh.update()
+    return create_widget_shape(rig, bone_name, COMPASS_SHAPE, bone_transform_name=bone_transform_name)
+
+
+ROOT_SHAPE = make_widget_shape([(0.7071067690849304, 0.7071067690849304, 0.0), (0.7071067690849304, -0.7071067690849304, 0.0), (-0.7071067690849304, 0.7071067690849304, 0.0), (-0.7071067690849304, -0.7071067690849304, 0.0), (0.8314696550369263, 0.5555701851844788, 0.0), (0.8314696550369263, -0.5555701851844788, 0.0), (-0.8314696550369263, 0.5555701851844788, 0.0), (-0.8314696550369263, -0.5555701851844788, 0.0), (0.9238795042037964, 0.3826834261417389, 0.0), (0.9238795042037964, -0.3826834261417389, 0.0), (-0.9238795042037964, 0.3826834261417389, 0.0), (-0.9238795042037964, -0.3826834261417389, 0.0), (0.9807852506637573, 0.19509035348892212, 0.0), (0.9807852506637573, -0.19509035348892212, 0.0), (-0.9807852506637573, 0.19509035348892212, 0.0), (-0.9807852506637573, -0.19509035348892212, 0.0), (0.19509197771549225, 0.9807849526405334, 0.0), (0.19509197771549225, -0.9807849526405334, 0.0), (-0.19509197771549225, 0.9807849526405334, 0.0), (-0.19509197771549225, -0.9807849526405334, 0.0), (0.3826850652694702, 0.9238788485527039, 0.0), (0.3826850652694702, -0.9238788485527039, 0.0), (-0.3826850652694702, 0.9238788485527039, 0.0), (-0.3826850652694702, -0.9238788485527039, 0.0), (0.5555717945098877, 0.8314685821533203, 0.0), (0.5555717945098877, -0.8314685821533203, 0.0), (-0.5555717945098877, 0.8314685821533203, 0.0), (-0.5555717945098877, -0.8314685821533203, 0.0), (0.19509197771549225, 1.2807848453521729, 0.0), (0.19509197771549225, -1.2807848453521729, 0.0), (-0.19509197771549225, 1.2807848453521729, 0.0), (-0.19509197771549225, -1.2807848453521729, 0.0), (1.280785322189331, 0.19509035348892212, 0.0), (1.280785322189331, -0.19509035348892212, 0.0), (-1.280785322189331, 0.19509035348892212, 0.0), (-1.280785322189331, -0.19509035348892212, 0.0), (0.3950919806957245, 1.2807848453521729, 0.0), (0.3950919806957245, -1.2807848453521729, 0.0), (-0.3950919806957245, 1.2807848453521729, 0.0), (-0.3950919806957245, -1.2807848453521729, 0.0), (1.280785322189331, 0.39509034156799316, 0.0), (1.280785322189331, -0.39509034156799316, 0.0), (-1.280785322189331, 0.39509034156799316, 0.0), (-1.280785322189331, -0.39509034156799316, 0.0), (0.0, 1.5807849168777466, 0.0), (0.0, -1.5807849168777466, 0.0), (1.5807852745056152, 0.0, 0.0), (-1.5807852745056152, 0.0, 0.0)],
+                               [(0, 4), (1, 5), (2, 6), (3, 7), (4, 8), (5, 9), (6, 10), (7, 11), (8, 12), (9, 13), (10, 14), (11, 15), (16, 20), (17, 21), (18, 22), (19, 23), (20, 24), (21, 25), (22, 26), (23, 27), (0, 24), (1, 25), (2, 26), (3, 27), (16, 28), (17, 29), (18, 30), (19, 31), (12, 32), (13, 33), (14, 34), (15, 35), (28, 36), (29, 37), (30, 38), (31, 39), (32, 40), (33, 41), (34, 42), (35, 43), (36, 44), (37, 45), (38, 44), (39, 45), (40, 46), (41, 46), (42, 47), (43, 47)])
 
 
 def create_root_widget(rig, bone_name, bone_transform_name=None):
     """ Creates a widget for the root bone.
     """
-    obj = create_widget(rig, bone_name, bone_transform_name)
-    if obj != None:
-        verts = [(0.7071067690849304, 0.7071067690849304, 0.0), (0.7071067690849304, -0.7071067690849304, 0.0), (-0.7071067690849304, 0.7071067690849304, 0.0), (-0.7071067690849304, -0.7071067690849304, 0.0), (0.8314696550369263, 0.5555701851844788, 0.0), (0.8314696550369263, -0.5555701851844788, 0.0), (-0.8314696550369263, 0.5555701851844788, 0.0), (-0.8314696550369263, -0.5555701851844788, 0.0), (0.9238795042037964, 0.3826834261417389, 0.0), (0.9238795042037964, -0.3826834261417389, 0.0), (-0.9238795042037964, 0.3826834261417389, 0.0), (-0.9238795042037964, -0.3826834261417389, 0.0), (0.9807852506637573, 0.19509035348892212, 0.0), (0.9807852506637573, -0.19509035348892212, 0.0), (-0.9807852506637573, 0.19509035348892212, 0.0), (-0.9807852506637573, -0.19509035348892212, 0.0), (0.19509197771549225, 0.9807849526405334, 0.0), (0.19509197771549225, -0.9807849526405334, 0.0), (-0.19509197771549225, 0.9807849526405334, 0.0), (-0.19509197771549225, -0.9807849526405334, 0.0), (0.3826850652694702, 0.9238788485527039, 0.0), (0.3826850652694702, -0.9238788485527039, 0.0), (-0.3826850652694702, 0.9238788485527039, 0.0), (-0.3826850652694702, -0.9238788485527039, 0.0), (0.5555717945098877, 0.8314685821533203, 0.0), (0.5555717945098877, -0.8314685821533203, 0.0), (-0.5555717945098877, 0.8314685821533203, 0.0), (-0.5555717945098877, -0.8314685821533203, 0.0), (0.19509197771549225, 1.2807848453521729, 0.0), (0.19509197771549225, -1.2807848453521729, 0.0), (-0.19509197771549225, 1.2807848453521729, 0.0), (-0.19509197771549225, -1.2807848453521729, 0.0), (1.280785322189331, 0.19509035348892212, 0.0), (1.280785322189331, -0.19509035348892212, 0.0), (-1.280785322189331, 0.19509035348892212, 0.0), (-1.280785322189331, -0.19509035348892212, 0.0), (0.3950919806957245, 1.2807848453521729, 0.0), (0.3950919806957245, -1.2807848453521729, 0.0), (-0.3950919806957245, 1.2807848453521729, 0.0), (-0.3950919806957245, -1.2807848453521729, 0.0), (1.280785322189331, 0.39509034156799316, 0.0), (1.280785322189331, -0.39509034156799316, 0.0), (-1.280785322189331, 0.39509034156799316, 0.0), (-1.280785322189331, -0.39509034156799316, 0.0), (0.0, 1.5807849168777466, 0.0), (0.0, -1.5807849168777466, 0.0), (1.5807852745056152, 0.0, 0.0), (-1.5807852745056152, 0.0, 0.0)]
-        edges = [(0, 4), (1, 5), (2, 6), (3, 7), (4, 8), (5, 9), (6, 10), (7, 11), (8, 12), (9, 13), (10, 14), (11, 15), (16, 20), (17, 21), (18, 22), (19, 23), (20, 24), (21, 25), (22, 26), (23, 27), (0, 24), (1, 25), (2, 26), (3, 27), (16, 28), (17, 29), (18, 30), (19, 31), (12, 32), (13, 33), (14, 34), (15, 35), (28, 36), (29, 37), (30, 38), (31, 39), (32, 40), (33, 41), (34, 42), (35, 43), (36, 44), (37, 45), (38, 44), (39, 45), (40, 46), (41, 46), (42, 47), (43, 47)]
-        mesh = obj.data
-        mesh.from_pydata(verts, edges, [])
-        mesh.update()
+    return create_widget_shape(rig, bone_name, ROOT_SHAPE, bone_transform_name=bone_transform_name)
+
+
+NECK_BEND_SHAPE = make_widget_shape([(-0.08855080604553223, 0.7388765811920166, -0.3940150737762451),
+                                     (0.08855044841766357, 0.7388765811920166, -0.3940150737762451),
+                                     (0.17710095643997192, 0.5611097812652588, -0.6478927135467529),
+                                     (-4.0892032870942785e-07, 0.4087378978729248, -0.865501880645752),
+                                     (-0.17710143327713013, 0.5611097812652588, -0.6478922367095947),
+                                     (0.08855026960372925, 0.5611097812652588, -0.6478924751281738),
+                                     (-0.08855092525482178, 0.5611097812652588, -0.6478927135467529),
+                                     (-0.6478927135467529, 0.5611097812652588, 0.08855098485946655),
+                                     (-0.6478927135467529, 0.5611097812652588, -0.08855020999908447),
+                                     (-0.6478924751281738, 0.5611097812652588, 0.17710155248641968),
+                                     (-0.865501880645752, 0.4087378978729248, 4.6876743908796925e-07),
+                                     (-0.647892951965332, 0.5611097812652588, -0.17710083723068237),
+                                     (-0.39401543140411377, 0.7388765811920166, -0.08855029940605164),
+                                     (-0.39401543140411377, 0.7388765811920166, 0.08855095505714417),
+                                     (0.6478927135467529, 0.5611097812652588, -0.08855059742927551),
+                                     (0.6478927135467529, 0.5611097812652588, 0.08855065703392029),
+                                     (0.6478924751281738, 0.5611097812652588, -0.17710113525390625),
+                                     (0.865501880645752, 0.4087378978729248, -3.264514703005261e-08),
+                                     (0.647892951965332, 0.5611097812652588, 0.1771012544631958),
+                                     (0.08855065703392029, 0.7388765811920166, 0.3940155506134033),
+                                     (-0.08855056762695312, 0.7388765811920166, 0.3940155506134033),
+                                     (-0.17710107564926147, 0.5611097812652588, 0.647892951965332),
+                                     (2.244429140318971e-07, 0.4087378978729248, 0.865502119064331),
+                                     (0.17710131406784058, 0.5611097812652588, 0.6478927135467529),
+                                     (-0.08855044841766357, 0.5611097812652588, 0.647892951965332),
+                                     (0.08855074644088745, 0.5611097812652588, 0.647892951965332),
+                                     (0.3940153121948242, 0.7388765811920166, 0.08855071663856506),
+                                     (0.39401519298553467, 0.7388765811920166, -0.08855047821998596),
+                                     (-8.416645869147032e-08, 0.8255770206451416, -0.2656517028808594),
+                                     (-0.06875583529472351, 0.8255770206451416, -0.2565997838973999),
+                                     (-0.13282597064971924, 0.8255770206451416, -0.2300611138343811),
+                                     (-0.18784427642822266, 0.8255770206451416, -0.18784409761428833),
+                                     (-0.2300613522529602, 0.8255770206451416, -0.1328257918357849),
+                                     (-0.256600022315979, 0.8255770206451416, -0.06875564157962799),
+                                     (-0.2656519412994385, 0.8255770206451416, 9.328307726264029e-08),
+                                     (-0.25660014152526855, 0.8255770206451416, 0.06875583529472351),
+                                     (-0.2300613522529602, 0.8255770206451416, 0.13282597064971924),
+                                     (-0.18784433603286743, 0.8255770206451416, 0.18784421682357788),
+                                     (-0.1328260898590088, 0.8255770206451416, 0.23006129264831543),
+                                     (-0.06875592470169067, 0.8255770206451416, 0.256600022315979),
+                                     (-1.8761508613351907e-07, 0.8255770206451416, 0.2656519412994385),
+                                     (0.06875556707382202, 0.8255770206451416, 0.2566000819206238),
+                                     (0.13282573223114014, 0.8255770206451416, 0.23006141185760498),
+                                     (0.18784403800964355, 0.8255770206451416, 0.1878443956375122),
+                                     (0.23006105422973633, 0.8255770206451416, 0.1328260898590088),
+                                     (0.25659990310668945, 0.8255770206451416, 0.06875596940517426),
+                                     (0.2656517028808594, 0.8255770206451416, 2.3684407324253698e-07),
+                                     (0.25659990310668945, 0.8255770206451416, -0.06875550746917725),
+                                     (0.23006117343902588, 0.8255770206451416, -0.13282567262649536),
+                                     (0.18784427642822266, 0.8255770206451416, -0.18784397840499878),
+                                     (0.13282597064971924, 0.8255770206451416, -0.23006099462509155),
+                                     (0.0687558501958847, 0.8255770206451416, -0.2565997838973999), ],
+                                    [(1, 0), (3, 2), (5, 2), (4, 3), (6, 4), (1, 5), (0, 6), (13, 7), (12, 8), (7, 9), (9, 10), (8, 11),
+                                     (27, 14), (26, 15), (14, 16), (16, 17), (15, 18), (17, 18), (10, 11), (12, 13), (20, 19), (22, 21),
+                                     (24, 21), (23, 22), (29, 28), (30, 29), (31, 30), (32, 31), (33, 32), (34, 33), (35, 34), (36, 35),
+                                     (37, 36), (38, 37), (39, 38), (40, 39), (41, 40), (42, 41), (43, 42), (44, 43), (45, 44), (46, 45),
+                                     (47, 46), (48, 47), (49, 48), (50, 49), (51, 50), (28, 51), (26, 27), (25, 23), (20, 24),
+                                     (19, 25), ])
 
 
 def create_neck_bend_widget(rig, bone_name, radius=1.0, head_tail=0.0, bone_transform_name=None):
-    obj = create_widget(rig, bone_name, bone_transform_name)
-    size = 2.0
-    if obj != None:
-        v = [(-0.08855080604553223 * size, 0.7388765811920166 * size, -0.3940150737762451 * size),
-                 (0.08855044841766357 * size, 0.7388765811920166 * size, -0.3940150737762451 * size),
-                 (0.17710095643997192 * size, 0.5611097812652588 * size, -0.6478927135467529 * size),
-                 (-4.0892032870942785e-07 * size, 0.4087378978729248 * size, -0.865501880645752 * size),
-                 (-0.17710143327713013 * size, 0.5611097812652588 * size, -0.6478922367095947 * size),
-                 (0.08855026960372925 * size, 0.5611097812652588 * size, -0.6478924751281738 * size),
-                 (-0.08855092525482178 * size, 0.5611097812652588 * size, -0.6478927135467529 * size),
-                 (-0.6478927135467529 * size, 0.5611097812652588 * size, 0.08855098485946655 * size),
-                 (-0.6478927135467529 * size, 0.5611097812652588 * size, -0.08855020999908447 * size),
-                 (-0.6478924751281738 * size, 0.5611097812652588 * size, 0.17710155248641968 * size),
-                 (-0.865501880645752 * size, 0.4087378978729248 * size, 4.6876743908796925e-07 * size),
-                 (-0.647892951965332 * size, 0.5611097812652588 * size, -0.17710083723068237 * size),
-                 (-0.39401543140411377 * size, 0.7388765811920166 * size, -0.08855029940605164 * size),
-                 (-0.39401543140411377 * size, 0.7388765811920166 * size, 0.08855095505714417 * size),
-                 (0.6478927135467529 * size, 0.5611097812652588 * size, -0.08855059742927551 * size),
-                 (0.6478927135467529 * size, 0.5611097812652588 * size, 0.08855065703392029 * size),
-                 (0.6478924751281738 * size, 0.5611097812652588 * size, -0.17710113525390625 * size),
-                 (0.865501880645752 * size, 0.4087378978729248 * size, -3.264514703005261e-08 * size),
-                 (0.647892951965332 * size, 0.5611097812652588 * size, 0.1771012544631958 * size),
-                 (0.08855065703392029 * size, 0.7388765811920166 * size, 0.3940155506134033 * size),
-                 (-0.08855056762695312 * size, 0.7388765811920166 * size, 0.3940155506134033 * size),
-                 (-0.17710107564926147 * size, 0.5611097812652588 * size, 0.647892951965332 * size),
-                 (2.244429140318971e-07 * size, 0.4087378978729248 * size, 0.865502119064331 * size),
-                 (0.17710131406784058 * size, 0.5611097812652588 * size, 0.6478927135467529 * size),
-                 (-0.08855044841766357 * size, 0.5611097812652588 * size, 0.647892951965332 * size),
-                 (0.08855074644088745 * size, 0.5611097812652588 * size, 0.647892951965332 * size),
-                 (0.3940153121948242 * size, 0.7388765811920166 * size, 0.08855071663856506 * size),
-                 (0.39401519298553467 * size, 0.7388765811920166 * size, -0.08855047821998596 * size),
-                 (-8.416645869147032e-08 * size, 0.8255770206451416 * size, -0.2656517028808594 * size),
-                 (-0.06875583529472351 * size, 0.8255770206451416 * size, -0.2565997838973999 * size),
-                 (-0.13282597064971924 * size, 0.8255770206451416 * size, -0.2300611138343811 * size),
-                 (-0.18784427642822266 * size, 0.8255770206451416 * size, -0.18784409761428833 * size),
-                 (-0.2300613522529602 * size, 0.8255770206451416 * size, -0.1328257918357849 * size),
-                 (-0.256600022315979 * size, 0.8255770206451416 * size, -0.06875564157962799 * size),
-                 (-0.2656519412994385 * size, 0.8255770206451416 * size, 9.328307726264029e-08 * size),
-                 (-0.25660014152526855 * size, 0.8255770206451416 * size, 0.06875583529472351 * size),
-                 (-0.2300613522529602 * size, 0.8255770206451416 * size, 0.13282597064971924 * size),
-                 (-0.18784433603286743 * size, 0.8255770206451416 * size, 0.18784421682357788 * size),
-                 (-0.1328260898590088 * size, 0.8255770206451416 * size, 0.23006129264831543 * size),
-                 (-0.06875592470169067 * size, 0.8255770206451416 * size, 0.256600022315979 * size),
-                 (-1.8761508613351907e-07 * size, 0.8255770206451416 * size, 0.2656519412994385 * size),
-                 (0.06875556707382202 * size, 0.8255770206451416 * size, 0.2566000819206238 * size),
-                 (0.13282573223114014 * size, 0.8255770206451416 * size, 0.23006141185760498 * size),
-                 (0.18784403800964355 * size, 0.8255770206451416 * size, 0.1878443956375122 * size),
-                 (0.23006105422973633 * size, 0.8255770206451416 * size, 0.1328260898590088 * size),
-                 (0.25659990310668945 * size, 0.8255770206451416 * size, 0.06875596940517426 * size),
-                 (0.2656517028808594 * size, 0.8255770206451416 * size, 2.3684407324253698e-07 * size),
-                 (0.25659990310668945 * size, 0.8255770206451416 * size, -0.06875550746917725 * size),
-                 (0.23006117343902588 * size, 0.8255770206451416 * size, -0.13282567262649536 * size),
-                 (0.18784427642822266 * size, 0.8255770206451416 * size, -0.18784397840499878 * size),
-                 (0.13282597064971924 * size, 0.8255770206451416 * size, -0.23006099462509155 * size),
-                 (0.0687558501958847 * size, 0.8255770206451416 * size, -0.2565997838973999 * size), ]
-        edges = [(1, 0), (3, 2), (5, 2), (4, 3), (6, 4), (1, 5), (0, 6), (13, 7), (12, 8), (7, 9), (9, 10), (8, 11),
-                 (27, 14), (26, 15), (14, 16), (16, 17), (15, 18), (17, 18), (10, 11), (12, 13), (20, 19), (22, 21),
-                 (24, 21), (23, 22), (29, 28), (30, 29), (31, 30), (32, 31), (33, 32), (34, 33), (35, 34), (36, 35),
-                 (37, 36), (38, 37), (39, 38), (40, 39), (41, 40), (42, 41), (43, 42), (44, 43), (45, 44), (46, 45),
-                 (47, 46), (48, 47), (49, 48), (50, 49), (51, 50), (28, 51), (26, 27), (25, 23), (20, 24),
-                 (19, 25), ]
-
-        verts = [(a[0] * radius, head_tail, a[2] * radius) for a in v]
-        mesh = obj.data
-        mesh.from_pydata(verts, edges, [])
-        mesh.update()
+    size = 2.0 * radius
+    return create_widget_shape(rig, bone_name, NECK_BEND_SHAPE, (size, 0.0, size), (0.0, head_tail, 0.0),
+                               bone_transform_name=bone_transform_name)
+
+
+NECK_TWEAK_SHAPE = make_widget_shape([(0.3535533845424652, 0.3535533845424652, 0.0),
+                                      (0.4619397521018982, 0.19134171307086945, 0.0),
+                                      (0.5, -2.1855694143368964e-08, 0.0),
+                                      (0.4619397521018982, -0.19134175777435303, 0.0),
+                                      (0.3535533845424652, -0.3535533845424652, 0.0),
+                                      (0.19134174287319183, -0.4619397521018982, 0.0),
+                                      (7.549790126404332e-08, -0.5, 0.0),
+                                      (-0.1913416087627411, -0.46193981170654297, 0.0),
+                                      (-0.35355329513549805, -0.35355350375175476, 0.0),
+                                      (-0.4619397521018982, -0.19134178757667542, 0.0),
+                                      (-0.5, 5.962440319251527e-09, 0.0),
+                                      (-0.4619397222995758, 0.1913418024778366, 0.0),
+                                      (-0.35355326533317566, 0.35355350375175476, 0.0),
+                                      (-0.19134148955345154, 0.46193987131118774, 0.0),
+                                      (3.2584136988589307e-07, 0.5, 0.0),
+                                      (0.1913420855998993, 0.46193960309028625, 0.0),
+                                      (7.450580596923828e-08, 0.46193960309028625, 0.19134199619293213),
+                                      (5.9254205098113744e-08, 0.5, 2.323586443253589e-07),
+                                      (4.470348358154297e-08, 0.46193987131118774, -0.1913415789604187),
+                                      (2.9802322387695312e-08, 0.35355350375175476, -0.3535533547401428),
+                                      (2.9802322387695312e-08, 0.19134178757667542, -0.46193981170654297),
+                                      (5.960464477539063e-08, -1.1151834122813398e-08, -0.5000000596046448),
+                                      (5.960464477539063e-08, -0.1913418024778366, -0.46193984150886536),
+                                      (5.960464477539063e-08, -0.35355350375175476, -0.3535533845424652),
+                                      (7.450580596923828e-08, -0.46193981170654297, -0.19134166836738586),
+                                      (9.348272556053416e-08, -0.5, 1.624372103492533e-08),
+                                      (1.043081283569336e-07, -0.4619397521018982, 0.19134168326854706),
+                                      (1.1920928955078125e-07, -0.3535533845424652, 0.35355329513549805),
+                                      (1.1920928955078125e-07, -0.19134174287319183, 0.46193966269493103),
+                                      (1.1920928955078125e-07, -4.7414250303745575e-09, 0.49999991059303284),
+                                      (1.1920928955078125e-07, 0.19134172797203064, 0.46193966269493103),
+                                      (8.940696716308594e-08, 0.3535533845424652, 0.35355329513549805),
+                                      (0.3535534739494324, 0.0, 0.35355329513549805),
+                                      (0.1913418173789978, -2.9802322387695312e-08, 0.46193966269493103),
+                                      (8.303572940349113e-08, -5.005858838558197e-08, 0.49999991059303284),
+                                      (-0.19134165346622467, -5.960464477539063e-08, 0.46193966269493103),
+                                      (-0.35355329513549805, -8.940696716308594e-08, 0.35355329513549805),
+                                      (-0.46193963289260864, -5.960464477539063e-08, 0.19134168326854706),
+                                      (-0.49999991059303284, -5.960464477539063e-08, 1.624372103492533e-08),
+                                      (-0.4619397521018982, -2.9802322387695312e-08, -0.19134166836738586),
+                                      (-0.3535534143447876, -2.9802322387695312e-08, -0.3535533845424652),
+                                      (-0.19134171307086945, 0.0, -0.46193984150886536),
+                                      (7.662531942287387e-08, 9.546055501630235e-09, -0.5000000596046448),
+                                      (0.19134187698364258, 5.960464477539063e-08, -0.46193981170654297),
+                                      (0.3535535931587219, 5.960464477539063e-08, -0.3535533547401428),
+                                      (0.4619399905204773, 5.960464477539063e-08, -0.1913415789604187),
+                                      (0.5000000596046448, 5.960464477539063e-08, 2.323586443253589e-07),
+                                      (0.4619396924972534, 2.9802322387695312e-08, 0.19134199619293213),
+                                      (1.563460111618042, 2.778762819843905e-08, 1.5634593963623047),
+                                      (0.8461387157440186, -1.0400220418205208e-07, 2.0427582263946533),
+                                      (7.321979467178608e-08, -1.9357810288056498e-07, 2.2110657691955566),
+                                      (-0.8461385369300842, -2.3579201524626114e-07, 2.0427582263946533),
+                                      (-1.5634597539901733, -3.67581861837607e-07, 1.5634593963623047),
+                                      (-2.0427584648132324, -2.3579204366797057e-07, 0.8461383581161499),
+                                      (-2.211066246032715, -2.3579204366797057e-07, 9.972505665700737e-08),
+                                      (-2.0427589416503906, -1.0400223260376151e-07, -0.8461381196975708),
+                                      (-1.5634604692459106, -1.040022183929068e-07, -1.563459873199463),
+                                      (-0.8461387753486633, 2.77876033294433e-08, -2.042759418487549),
+                                      (4.4872678017782164e-08, 7.00015263532805e-08, -2.211066484451294),
+                                      (0.8461388349533081, 2.913672290105751e-07, -2.0427591800689697),
+                                      (1.5634608268737793, 2.9136725743228453e-07, -1.563459873199463),
+                                      (2.042759895324707, 2.9136725743228453e-07, -0.8461377024650574),
+                                      (2.211066722869873, 2.9136725743228453e-07, 1.0554133496043505e-06),
+                                      (2.0427587032318115, 1.5957746768435754e-07, 0.8461397886276245), ],
+                                     [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 7), (7, 8), (8, 9), (9, 10), (10, 11),
+                                      (11, 12), (12, 13), (13, 14), (14, 15), (0, 15), (16, 31), (16, 17), (17, 18), (18, 19), (19, 20),
+                                      (20, 21), (21, 22), (22, 23), (23, 24), (24, 25), (25, 26), (26, 27), (27, 28), (28, 29), (29, 30),
+                                      (30, 31), (32, 33), (33, 34), (34, 35), (35, 36), (36, 37), (37, 38), (38, 39), (39, 40), (40, 41),
+                                      (41, 42), (42, 43), (43, 44), (44, 45), (45, 46), (46, 47), (32, 47), (48, 49), (49, 50), (50, 51),
+                                      (51, 52), (52, 53), (53, 54), (54, 55), (55, 56), (56, 57), (57, 58), (58, 59), (59, 60), (60, 61),
+                                      (61, 62), (62, 63), (48, 63), (21, 58), (10, 54), (29, 50), (2, 62), ])
 
 
 def create_neck_tweak_widget(rig, bone_name, size=1.0, bone_transform_name=None):
-    obj = create_widget(rig, bone_name, bone_transform_name)
-
-    if obj != None:
-        verts = [(0.3535533845424652 * size, 0.3535533845424652 * size, 0.0 * size),
-                 (0.4619397521018982 * size, 0.19134171307086945 * size, 0.0 * size),
-                 (0.5 * size, -2.1855694143368964e-08 * size, 0.0 * size),
-                 (0.4619397521018982 * size, -0.19134175777435303 * size, 0.0 * size),
-                 (0.3535533845424652 * size, -0.3535533845424652 * size, 0.0 * size),
-                 (0.19134174287319183 * size, -0.4619397521018982 * size, 0.0 * size),
-                 (7.549790126404332e-08 * size, -0.5 * size, 0.0 * size),
-                 (-0.1913416087627411 * size, -0.46193981170654297 * size, 0.0 * size),
-                 (-0.35355329513549805 * size, -0.35355350375175476 * size, 0.0 * size),
-                 (-0.4619397521018982 * size, -0.19134178757667542 * size, 0.0 * size),
-                 (-0.5 * size, 5.962440319251527e-09 * size, 0.0 * size),
-                 (-0.4619397222995758 * size, 0.1913418024778366 * size, 0.0 * size),
-                 (-0.35355326533317566 * size, 0.35355350375175476 * size, 0.0 * size),
-                 (-0.19134148955345154 * size, 0.46193987131118774 * size, 0.0 * size),
-                 (3.2584136988589307e-07 * size, 0.5 * size, 0.0 * size),
-                 (0.1913420855998993 * size, 0.46193960309028625 * size, 0.0 * size),
-                 (7.450580596923828e-08 * size, 0.46193960309028625 * size, 0.19134199619293213 * size),
-                 (5.9254205098113744e-08 * size, 0.5 * size, 2.323586443253589e-07 * size),
-                 (4.470348358154297e-08 * size, 0.46193987131118774 * size, -0.1913415789604187 * size),
-                 (2.9802322387695312e-08 * size, 0.35355350375175476 * size, -0.3535533547401428 * size),
-                 (2.9802322387695312e-08 * size, 0.19134178757667542 * size, -0.46193981170654297 * size),
-                 (5.960464477539063e-08 * size, -1.1151834122813398e-08 * size, -0.5000000596046448 * size),
-                 (5.960464477539063e-08 * size, -0.1913418024778366 * size, -0.46193984150886536 * size),
-                 (5.960464477539063e-08 * size, -0.35355350375175476 * size, -0.3535533845424652 * size),
-                 (7.450580596923828e-08 * size, -0.46193981170654297 * size, -0.19134166836738586 * size),
-                 (9.348272556053416e-08 * size, -0.5 * size, 1.624372103492533e-08 * size),
-                 (1.043081283569336e-07 * size, -0.4619397521018982 * size, 0.19134168326854706 * size),
-                 (1.1920928955078125e-07 * size, -0.3535533845424652 * size, 0.35355329513549805 * size),
-                 (1.1920928955078125e-07 * size, -0.19134174287319183 * size, 0.46193966269493103 * size),
-                 (1.1920928955078125e-07 * size, -4.7414250303745575e-09 * size, 0.49999991059303284 * size),
-                 (1.1920928955078125e-07 * size, 0.19134172797203064 * size, 0.46193966269493103 * size),
-                 (8.940696716308594e-08 * size, 0.3535533845424652 * size, 0.35355329513549805 * size),
-                 (0.3535534739494324 * size, 0.0 * size, 0.35355329513549805 * size),
-                 (0.1913418173789978 * size, -2.9802322387695312e-08 * size, 0.46193966269493103 * size),
-                 (8.303572940349113e-08 * size, -5.005858838558197e-08 * size, 0.49999991059303284 * size),
-                 (-0.19134165346622467 * size, -5.960464477539063e-08 * size, 0.46193966269493103 * size),
-                 (-0.35355329513549805 * size, -8.940696716308594e-08 * size, 0.35355329513549805 * size),
-                 (-0.46193963289260864 * size, -5.960464477539063e-08 * size, 0.19134168326854706 * size),
-                 (-0.49999991059303284 * size, -5.960464477539063e-08 * size, 1.624372103492533e-08 * size),
-                 (-0.4619397521018982 * size, -2.9802322387695312e-08 * size, -0.19134166836738586 * size),
-                 (-0.3535534143447876 * size, -2.9802322387695312e-08 * size, -0.3535533845424652 * size),
-                 (-0.19134171307086945 * size, 0.0 * size, -0.46193984150886536 * size),
-                 (7.662531942287387e-08 * size, 9.546055501630235e-09 * size, -0.5000000596046448 * size),
-                 (0.19134187698364258 * size, 5.960464477539063e-08 * size, -0.46193981170654297 * size),
-                 (0.3535535931587219 * size, 5.960464477539063e-08 * size, -0.3535533547401428 * size),
-                 (0.4619399905204773 * size, 5.960464477539063e-08 * size, -0.1913415789604187 * size),
-                 (0.5000000596046448 * size, 5.960464477539063e-08 * size, 2.323586443253589e-07 * size),
-                 (0.4619396924972534 * size, 2.9802322387695312e-08 * size, 0.19134199619293213 * size),
-                 (1.563460111618042 * size, 2.778762819843905e-08 * size, 1.5634593963623047 * size),
-                 (0.8461387157440186 * size, -1.0400220418205208e-07 * size, 2.0427582263946533 * size),
-                 (7.321979467178608e-08 * size, -1.9357810288056498e-07 * size, 2.2110657691955566 * size),
-                 (-0.8461385369300842 * size, -2.3579201524626114e-07 * size, 2.0427582263946533 * size),
-                 (-1.5634597539901733 * size, -3.67581861837607e-07 * size, 1.5634593963623047 * size),
-                 (-2.0427584648132324 * size, -2.3579204366797057e-07 * size, 0.8461383581161499 * size),
-                 (-2.211066246032715 * size, -2.3579204366797057e-07 * size, 9.972505665700737e-08 * size),
-                 (-2.0427589416503906 * size, -1.0400223260376151e-07 * size, -0.8461381196975708 * size),
-                 (-1.5634604692459106 * size, -1.040022183929068e-07 * size, -1.563459873199463 * size),
-                 (-0.8461387753486633 * size, 2.77876033294433e-08 * size, -2.042759418487549 * size),
-                 (4.4872678017782164e-08 * size, 7.00015263532805e-08 * size, -2.211066484451294 * size),
-                 (0.8461388349533081 * size, 2.913672290105751e-07 * size, -2.0427591800689697 * size),
-                 (1.5634608268737793 * size, 2.9136725743228453e-07 * size, -1.563459873199463 * size),
-                 (2.042759895324707 * size, 2.9136725743228453e-07 * size, -0.8461377024650574 * size),
-                 (2.211066722869873 * size, 2.9136725743228453e-07 * size, 1.0554133496043505e-06 * size),
-                 (2.0427587032318115 * size, 1.5957746768435754e-07 * size, 0.8461397886276245 * size), ]
-        edges = [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 7), (7, 8), (8, 9), (9, 10), (10, 11),
-                 (11, 12), (12, 13), (13, 14), (14, 15), (0, 15), (16, 31), (16, 17), (17, 18), (18, 19), (19, 20),
-                 (20, 21), (21, 22), (22, 23), (23, 24), (24, 25), (25, 26), (26, 27), (27, 28), (28, 29), (29, 30),
-                 (30, 31), (32, 33), (33, 34), (34, 35), (35, 36), (36, 37), (37, 38), (38, 39), (39, 40), (40, 41),
-                 (41, 42), (42, 43), (43, 44), (44, 45), (45, 46), (46, 47), (32, 47), (48, 49), (49, 50), (50, 51),
-                 (51, 52), (52, 53), (53, 54), (54, 55), (55, 56), (56, 57), (57, 58), (58, 59), (59, 60), (60, 61),
-                 (61, 62), (62, 63), (48, 63), (21, 58), (10, 54), (29, 50), (2, 62), ]
-
-        mesh = obj.data
-        mesh.from_pydata(verts, edges, [])
-        mesh.update()
+    return create_widget_shape(rig, bone_name, NECK_TWEAK_SHAPE, size, bone_transform_name=bone_transform_name)
 
 
 #=============================================
@@ -960,23 +1350,93 @@ def align_bone_y_axis(obj, bone, vec):
 # Misc
 #=============================================
 
+# Writable attributes of each RNA type, by type identifier, for copy_attributes()
+copy_attributes_plans = {}
+
+
+def get_copy_attributes_plan(a):
+    """ Returns the names of the writable attributes of a's RNA type,
+        in alphabetical order.
+        Computed once per type from its RNA properties.
+    """
+    rna = a.bl_rna
+    plan = copy_attributes_plans.get(rna.identifier)
+    if plan is None:
+        plan = sorted(prop.identifier for prop in rna.properties
+                      if not prop.is_readonly
+                      and not prop.identifier.startswith("error_")
+                      and prop.identifier != "group"
+                      and prop.identifier != "rna_type")
+        copy_attributes_plans[rna.identifier] = plan
+    return plan
+
+
 def copy_attributes(a, b):
-    keys = dir(a)
-    for key in keys:
-        if not key.startswith("_") \
-        and not key.startswith("error_") \
-        and key != "group" \
-        and key != "is_valid" \
-        and key != "rna_type" \
-        and key != "bl_rna":
-            try:
-                setattr(b, key, getattr(a, key))
-            except AttributeError:
-                pass
+    for key in get_copy_attributes_plan(a):
+        try:
+            setattr(b, key, getattr(a, key))
+        except AttributeError:
+            # Writable in general but not in this state
+            pass
+
+
+# Rig modules loaded by get_rig_type(), by file path: (mtime, module)
+rig_module_cache = {}
+
+
+def clear_rig_type_cache():
+    """ Forgets all loaded rig modules, so that get_rig_type() loads them
+        again from their files.
+    """
+    rig_module_cache.clear()
+
+
+def use_rig_hot_reload():
+    """ Returns True if the add-on preferences ask for rig modules to be
+        reloaded whenever their file changes.
+    """
+    try:
+        return bpy.context.user_preferences.addons[MODULE_NAME].preferences.hot_reload_rigs
+    except (AttributeError, KeyError):
+        return False
+
+
+def get_rig_type_path(rig_type, base_path=''):
+    """ Returns the path of the file of a rig module.
+    """
+    if not base_path:
+        base_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), RIG_DIR, '')
+    path = base_path + str.join(os.sep, rig_type.split('.'))
+    if os.path.isdir(path):
+        return os.path.join(path, '__init__.py')
+    return path + '.py'
 
 
 def get_rig_type(rig_type, base_path=''):
     """ Fetches a rig module by name, and returns it.
+        Modules are only loaded the first time they are asked for, or
+        again if their file changed when hot reloading is enabled in the
+        add-on preferences. clear_rig_type_cache() forces a reload.
+    """
+    path = get_rig_type_path(rig_type, base_path)
+    cached = rig_module_cache.get(path)
+    if cached is not None and not use_rig_hot_reload():
+        return cached[1]
+
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    submod = load_rig_type(rig_type, base_path)
+    rig_module_cache[path] = (mtime, submod)
+    return submod
+
+
+def load_rig_type(rig_type, base_path=''):
+    """ Loads (or reloads) a rig module by name, and returns it.
     """
     if not base_path:
         name = ".%s.%s" % (RIG_DIR, rig_type)
@@ -1069,11 +1529,16 @@ def get_layers(layers):
             return [x in layers for x in range(0, 32)]
 
 
-def write_metarig(obj, layers=False, func_name="create", groups=False):
+def write_metarig(obj, layers=False, func_name="create", groups=False, format='PYTHON'):
     """
     Write a metarig as a python script, this rig is to have all info needed for
     generating the real rig with rigify.
+    With format='DATA' the metarig is written in the compact data format
+    of write_metarig_data() instead.
     """
+    if format == 'DATA':
+        return write_metarig_data(obj, layers=layers, groups=groups)
+
     code = []
 
     code.append("import bpy\n\n")
@@ -1199,46 +1664,272 @@ def write_metarig(obj, layers=False, func_name="create", groups=False):
     return "\n".join(code)
 
 
+METARIG_DATA_FORMAT = "rigify_metarig"
+METARIG_DATA_VERSION = 1
+
+
+def write_metarig_data(obj, layers=False, groups=False):
+    """
+    Write a metarig in the compact JSON data format read by
+    read_metarig_data(). Bone data is stored as flat per-attribute
+    arrays, in the order of the armature's bones.
+    """
+    arm = obj.data
+
+    data = {'format': METARIG_DATA_FORMAT, 'version': METARIG_DATA_VERSION}
+
+    # Rigify bone group colors info
+    if groups and len(arm.rigify_colors) > 0:
+        data['colors'] = [{'name': c.name,
+                           'active': list(c.active),
+                           'normal': list(c.normal),
+                           'select': list(c.select),
+                           'standard_colors_lock': c.standard_colors_lock} for c in arm.rigify_colors]
+
+    # Rigify layer layout info
+    if layers and len(arm.rigify_layers) > 0:
+        data['layers'] = [{'name': l.name, 'row': l.row, 'set': l.set, 'group': l.group}
+                          for l in arm.rigify_layers]
+
+    # Edit bone data
+    bpy.ops.object.mode_set(mode='EDIT')
+    edit_bones = arm.edit_bones
+    names = edit_bones.keys()
+    count = len(names)
+
+    heads = [0.0] * (count * 3)
+    tails = [0.0] * (count * 3)
+    rolls = [0.0] * count
+    edit_bones.foreach_get('head', heads)
+    edit_bones.foreach_get('tail', tails)
+    edit_bones.foreach_get('roll', rolls)
+
+    bones = {'names': names,
+             'parents': [eb.parent.name if eb.parent else '' for eb in edit_bones],
+             'use_connect': [eb.use_connect for eb in edit_bones],
+             'heads': [round(x, 4) for x in heads],
+             'tails': [round(x, 4) for x in tails],
+             'rolls': [round(x, 4) for x in rolls]}
+
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+    # Pose bone data, in the same order
+    pbones = [obj.pose.bones[name] for name in names]
+    bones['rigify_types'] = [pb.rigify_type for pb in pbones]
+    bones['rotation_modes'] = [pb.rotation_mode for pb in pbones]
+    for attr in ('lock_location', 'lock_rotation', 'lock_scale'):
+        bones[attr] = [bool(x) for pb in pbones for x in getattr(pb, attr)]
+    bones['lock_rotation_w'] = [pb.lock_rotation_w for pb in pbones]
+    if layers:
+        bones['layers'] = [bool(x) for pb in pbones for x in pb.bone.layers]
+
+    # Rig type parameters
+    parameters = {}
+    for pb in pbones:
+        params = {}
+        for param_name in pb.rigify_parameters.keys():
+            param = getattr(pb.rigify_parameters, param_name, None)
+            if param is None:
+                continue
+            if str(type(param)) == "<class 'bpy_prop_array'>":
+                param = list(param)
+            elif isinstance(param, set):
+                # Enum flags, read back as sets
+                param = sorted(param)
+            try:
+                json.dumps(param)
+            except TypeError:
+                print("Warning: parameter %r of bone %r can't be saved as metarig data, skipping it" %
+                      (param_name, pb.name))
+                continue
+            params[param_name] = param
+        if params:
+            parameters[pb.name] = params
+    bones['parameters'] = parameters
+
+    data['bones'] = bones
+
+    # Set appropriate layers visible
+    if layers:
+        data['visible_layers'] = sorted(set(i % 32 for i, x in enumerate(bones['layers']) if x))
+
+    return json.dumps(data, indent=1)
+
+
+def foreach_set_by_name(collection, names, attr, values, size=1, fill=0.0):
+    """ Sets an attribute of the named items of a collection in a single
+        foreach_set call. values holds size entries per name, in the
+        order of names. Other items keep their current values.
+    """
+    order = collection.keys()
+    if order == names:
+        collection.foreach_set(attr, values)
+        return
+
+    buffer = [fill] * (len(order) * size)
+    collection.foreach_get(attr, buffer)
+    position = {name: i for i, name in enumerate(order)}
+    for i, name in enumerate(names):
+        j = position[name] * size
+        buffer[j:j + size] = values[i * size:(i + 1) * size]
+    collection.foreach_set(attr, buffer)
+
+
+METARIG_DATA_BONE_ARRAYS = (('parents', 1), ('use_connect', 1), ('heads', 3), ('tails', 3), ('rolls', 1),
+                            ('rigify_types', 1), ('rotation_modes', 1), ('lock_location', 3),
+                            ('lock_rotation', 3), ('lock_scale', 3), ('lock_rotation_w', 1))
+
+
+def check_metarig_data(data):
+    """ Parses metarig JSON data if needed, and checks that it can be
+        read by read_metarig_data(), before anything gets created.
+        Returns the data, raises MetarigError if it can't be read.
+    """
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except ValueError as e:
+            raise MetarigError("RIGIFY ERROR: invalid metarig data: %s" % e)
+    if not isinstance(data, dict) or data.get('format') != METARIG_DATA_FORMAT:
+        raise MetarigError("RIGIFY ERROR: not a metarig data file")
+    if data.get('version', 0) > METARIG_DATA_VERSION:
+        raise MetarigError("RIGIFY ERROR: metarig data version %s is newer than this version of Rigify supports" % data['version'])
+
+    bones = data.get('bones')
+    if not isinstance(bones, dict) or not isinstance(bones.get('names'), list) \
+    or not isinstance(bones.get('parameters', {}), dict):
+        raise MetarigError("RIGIFY ERROR: metarig data has no bones")
+    count = len(bones['names'])
+    for key, size in METARIG_DATA_BONE_ARRAYS:
+        if not isinstance(bones.get(key), list) or len(bones[key]) != count * size:
+            raise MetarigError("RIGIFY ERROR: metarig data has a bad '%s' bone array" % key)
+    names = set(bones['names'])
+    if any(parent and parent not in names for parent in bones['parents']) \
+    or any(name not in names for name in bones.get('parameters', {})):
+        raise MetarigError("RIGIFY ERROR: metarig data refers to missing bones")
+
+    return data
+
+
+def read_metarig_data(obj, data):
+    """ Creates a metarig in an armature object from the JSON data
+        written by write_metarig_data(), setting the bone attributes in
+        bulk.
+    """
+    data = check_metarig_data(data)
+
+    arm = obj.data
+
+    for c in data.get('colors', []):
+        color = arm.rigify_colors.add()
+        color.name = c['name']
+        color.active = Color(c['active'])
+        color.normal = Color(c['normal'])
+        color.select = Color(c['select'])
+        color.standard_colors_lock = c['standard_colors_lock']
+
+    for l in data.get('layers', []):
+        layer = arm.rigify_layers.add()
+        layer.name = l['name']
+        layer.row = l['row']
+        layer.set = l['set']
+        layer.group = l['group']
+
+    bones = data['bones']
+
+    # Edit bones
+    bpy.ops.object.mode_set(mode='EDIT')
+    edit_bones = arm.edit_bones
+
+    # New bones may get renamed if the armature already has bones
+    names = [edit_bones.new(name).name for name in bones['names']]
+    name_map = dict(zip(bones['names'], names))
+
+    foreach_set_by_name(edit_bones, names, 'head', bones['heads'], 3)
+    foreach_set_by_name(edit_bones, names, 'tail', bones['tails'], 3)
+    foreach_set_by_name(edit_bones, names, 'roll', bones['rolls'])
+    if 'layers' in bones:
+        foreach_set_by_name(edit_bones, names, 'layers', bones['layers'], 32, False)
+
+    for name, parent, use_connect in zip(names, bones['parents'], bones['use_connect']):
+        if parent:
+            bone = edit_bones[name]
+            bone.parent = edit_bones[name_map[parent]]
+            bone.use_connect = use_connect
+
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+    # Pose bones
+    pose_bones = obj.pose.bones
+    for attr in ('lock_location', 'lock_rotation', 'lock_scale'):
+        foreach_set_by_name(pose_bones, names, attr, bones[attr], 3, False)
+    foreach_set_by_name(pose_bones, names, 'lock_rotation_w', bones['lock_rotation_w'], 1, False)
+
+    for name, rigify_type, rotation_mode in zip(names, bones['rigify_types'], bones['rotation_modes']):
+        pbone = pose_bones[name]
+        pbone.rigify_type = rigify_type
+        pbone.rotation_mode = rotation_mode
+
+    # Rig type parameters
+    for bone_name, params in bones.get('parameters', {}).items():
+        pbone = pose_bones[name_map[bone_name]]
+        for param_name, value in params.items():
+            try:
+                setattr(pbone.rigify_parameters, param_name, value)
+            except TypeError:
+                # Enum flags are stored as lists
+                try:
+                    setattr(pbone.rigify_parameters, param_name, set(value))
+                except (AttributeError, TypeError, ValueError):
+                    pass
+            except (AttributeError, ValueError):
+                pass
+
+    bpy.ops.object.mode_set(mode='EDIT')
+    for bone in edit_bones:
+        bone.select = False
+        bone.select_head = False
+        bone.select_tail = False
+    for name in names:
+        bone = edit_bones[name]
+        bone.select = True
+        bone.select_head = True
+        bone.select_tail = True
+        edit_bones.active = bone
+
+    if 'visible_layers' in data:
+        arm.layers = [(x in data['visible_layers']) for x in range(len(arm.layers))]
+
+
 def write_widget(obj):
     """ Write a mesh object as a python script for widget use.
     """
     script = ""
     script += "def create_thing_widget(rig, bone_name, size=1.0, bone_transform_name=None):\n"
-    script += "    obj = create_widget(rig, bone_name, bone_transform_name)\n"
-    script += "    if obj != None:\n"
 
     # Vertices
-    if len(obj.data.vertices) > 0:
-        script += "        verts = ["
-        for v in obj.data.vertices:
-            script += "(" + str(v.co[0]) + "*size, " + str(v.co[1]) + "*size, " + str(v.co[2]) + "*size), "
-        script += "]\n"
+    script += "    verts = ["
+    for v in obj.data.vertices:
+        script += "(" + str(v.co[0]) + "*size, " + str(v.co[1]) + "*size, " + str(v.co[2]) + "*size), "
+    script += "]\n"
 
     # Edges
-    if len(obj.data.edges) > 0:
-        script += "        edges = ["
-        for e in obj.data.edges:
-            script += "(" + str(e.vertices[0]) + ", " + str(e.vertices[1]) + "), "
-        script += "]\n"
+    script += "    edges = ["
+    for e in obj.data.edges:
+        script += "(" + str(e.vertices[0]) + ", " + str(e.vertices[1]) + "), "
+    script += "]\n"
 
     # Faces
-    if len(obj.data.polygons) > 0:
-        script += "        faces = ["
-        for f in obj.data.polygons:
-            script += "("
-            for v in f.vertices:
-                script += str(v) + ", "
-            script += "), "
-        script += "]\n"
+    script += "    faces = ["
+    for f in obj.data.polygons:
+        script += "("
+        for v in f.vertices:
+            script += str(v) + ", "
+        script += "), "
+    script += "]\n"
 
     # Build mesh
-    script += "\n        mesh = obj.data\n"
-    script += "        mesh.from_pydata(verts, edges, faces)\n"
-    script += "        mesh.update()\n"
-    script += "        mesh.update()\n"
-    script += "        return obj\n"
-    script += "    else:\n"
-    script += "        return None\n"
+    script += "    return create_widget_mesh(rig, bone_name, verts, edges, faces, bone_transform_name)\n"
 
     return script
 
@@ -1290,64 +1981,170 @@ def gamma_correct(color):
 #=============================================
 
 
-def get_keyed_frames(rig):
-    frames = []
-    if rig.animation_data:
-        if rig.animation_data.action:
-            fcus = rig.animation_data.action.fcurves
-            for fc in fcus:
-                for kp in fc.keyframe_points:
-                    if kp.co[0] not in frames:
-                        frames.append(kp.co[0])
+class ActionIndex:
+    """ Index of the keyed frames and F-curves of an action, read once with
+        foreach_get, for the animation tools.
+    """
+    def __init__(self, action):
+        self.action = action
+        # All the keyed frames
+        self.frames = set()
+        # {bone name: set of keyed frames}
+        self.bone_frames = {}
+        # {bone name: [F-curves]}
+        self.bone_fcurves = {}
+        # {(bone name, custom property name): F-curve}
+        self.prop_fcurves = {}
+
+        for fcu in action.fcurves:
+            co = [0.0] * (2 * len(fcu.keyframe_points))
+            fcu.keyframe_points.foreach_get('co', co)
+            frames = set(co[::2])
+            self.frames |= frames
+
+            words = fcu.data_path.split('"')
+            if words[0] == "pose.bones[" and len(words) >= 3:
+                bone = words[1]
+                self.bone_frames.setdefault(bone, set()).update(frames)
+                self.bone_fcurves.setdefault(bone, []).append(fcu)
+                if len(words) >= 5:
+                    self.prop_fcurves.setdefault((bone, words[-2]), fcu)
+
+    def get_keyed_frames(self):
+        return sorted(self.frames)
+
+    def bones_in_frame(self, f, *args):
+        for bone in args:
+            if f in self.bone_frames.get(bone, ()):
+                return True
+        return False
 
-    frames.sort()
 
-    return frames
+def get_action_index(rig):
+    """ Returns an ActionIndex of the action of the rig, or None.
+    """
+    if rig.animation_data and rig.animation_data.action:
+        return ActionIndex(rig.animation_data.action)
+    return None
 
 
-def bones_in_frame(f, rig, *args):
+def get_keyed_frames(rig, index=None):
+    if index is None:
+        index = get_action_index(rig)
+    if index is None:
+        return []
+    return index.get_keyed_frames()
+
+
+def bones_in_frame(f, rig, *args, index=None):
     """
     True if one of the bones listed in args is animated at frame f
     :param f: the frame
     :param rig: the rig
     :param args: bone names
+    :param index: ActionIndex of the rig's action, built if not given
     :return:
     """
 
-    if rig.animation_data and rig.animation_data.action:
-        fcus = rig.animation_data.action.fcurves
-    else:
+    if index is None:
+        index = get_action_index(rig)
+    if index is None:
         return False
 
-    for fc in fcus:
-        animated_frames = [kp.co[0] for kp in fc.keyframe_points]
-        for bone in args:
-            if bone in fc.data_path.split('"') and f in animated_frames:
-                return True
+    return index.bones_in_frame(f, *args)
 
-    return False
 
+def overwrite_prop_animation(rig, bone, prop_name, value, frames, index=None):
+    if index is None:
+        index = get_action_index(rig)
+    if index is None:
+        return
 
-def overwrite_prop_animation(rig, bone, prop_name, value, frames):
-    act = rig.animation_data.action
-    if not act:
+    curve = index.prop_fcurves.get((bone.name, prop_name))
+    if not curve:
         return
 
-    bone_name = bone.name
-    curve = None
+    frames = set(frames)
+    co = [0.0] * (2 * len(curve.keyframe_points))
+    curve.keyframe_points.foreach_get('co', co)
+    for i in range(0, len(co), 2):
+        if co[i] in frames:
+            co[i + 1] = value
+    curve.keyframe_points.foreach_set('co', co)
+    curve.update()
 
-    for fcu in act.fcurves:
-        words = fcu.data_path.split('"')
-        if words[0] == "pose.bones[" and words[1] == bone_name and words[-2] == prop_name:
-            curve = fcu
-            break
 
-    if not curve:
-        return
+class PoseBake:
+    """ Records the visual transforms of pose bones frame by frame, and
+        writes them into the rig's action as keys all at once, like the
+        'Visual LocRot' and 'Scaling' keying sets would.
+    """
+    def __init__(self, rig):
+        self.rig = rig
+        # {(data_path, index, bone name): {frame: value}}
+        self.keys = {}
 
-    for kp in curve.keyframe_points:
-        if kp.co[0] in frames:
-            kp.co[1] = value
+    def add_keys(self, data_path, group, frame, values):
+        for i, value in enumerate(values):
+            self.keys.setdefault((data_path, i, group), {})[frame] = value
+
+    def record(self, frame, bone_names):
+        """ Records the current visual transforms of the bones for a frame.
+        """
+        for name in bone_names:
+            pb = self.rig.pose.bones[name]
+            mat = self.rig.convert_space(pose_bone=pb, matrix=pb.matrix, from_space='POSE', to_space='LOCAL')
+            loc = mat.to_translation()
+            rot = mat.to_quaternion()
+            path = 'pose.bones["%s"].' % name
+
+            self.add_keys(path + 'location', name, frame, loc)
+            if pb.rotation_mode == 'QUATERNION':
+                self.add_keys(path + 'rotation_quaternion', name, frame, rot)
+            elif pb.rotation_mode == 'AXIS_ANGLE':
+                axis, angle = rot.to_axis_angle()
+                self.add_keys(path + 'rotation_axis_angle', name, frame, [angle] + list(axis))
+            else:
+                euler = rot.to_euler(pb.rotation_mode, pb.rotation_euler)
+                self.add_keys(path + 'rotation_euler', name, frame, euler)
+            self.add_keys(path + 'scale', name, frame, pb.scale)
+
+    def write(self):
+        """ Writes the recorded keys into the action of the rig, replacing
+            the keys already on those frames.
+        """
+        if not self.keys:
+            return
+        if not self.rig.animation_data:
+            self.rig.animation_data_create()
+        act = self.rig.animation_data.action
+        if not act:
+            act = self.rig.animation_data.action = bpy.data.actions.new(self.rig.name + "Action")
+
+        for (data_path, index, group), values in self.keys.items():
+            fcu = act.fcurves.find(data_path, index)
+            if fcu is None:
+                fcu = act.fcurves.new(data_path, index, group)
+
+            points = fcu.keyframe_points
+            co = [0.0] * (2 * len(points))
+            points.foreach_get('co', co)
+
+            # Replace the values of the existing keys, and add the others at the end
+            new_frames = set(values)
+            for i in range(0, len(co), 2):
+                if co[i] in values:
+                    co[i + 1] = values[co[i]]
+                    new_frames.discard(co[i])
+            for frame in sorted(new_frames):
+                co += [frame, values[frame]]
+
+            if len(co) // 2 > len(points):
+                points.add(len(co) // 2 - len(points))
+            points.foreach_set('co', co)
+            fcu.update()
+
+        self.keys.clear()
 
 
 #=============================================